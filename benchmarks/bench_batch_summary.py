@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+""" Benchmark of the summaries of several biomes and experiment types: one get_studies_and_analyses_summary
+call per combination (the studies are downloaded again every time) vs get_studies_and_analyses_summaries
+(studies fetched once per biome, every listing in one batch). Reports the API requests and the wall time,
+and checks that both build the same summaries.
+
+Usage:
+    python benchmarks/bench_batch_summary.py --biomes 2 --pages 40 --latency 0.02
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import utils
+from mock_mgnify import MockMGnifyServer
+
+EXPERIMENTS = ("metagenomic", "metatranscriptomic", "assembly")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--biomes", type=int, default=2, help="number of biomes queried")
+    parser.add_argument("--pages", type=int, default=40, help="pages of each unfiltered listing")
+    parser.add_argument("--latency", type=float, default=0.02, help="server side latency per page in seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    biomes = [f"root:Engineered:Wastewater{i or ''}" for i in range(args.biomes)]
+    with MockMGnifyServer(pages=args.pages, latency=args.latency) as server, tempfile.TemporaryDirectory() as scratch:
+        utils.MGNIFY_API_URL = server.url
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = {(biome, exp): utils.get_studies_and_analyses_summary(biome, exp, scratch, args.concurrency)
+                        for biome in biomes for exp in EXPERIMENTS}
+        elapsed, requests = time.perf_counter() - start, server.requests_served
+        print(f"{'one call each':>14}: {requests:6d} requests, {elapsed:6.2f} s")
+
+        server.requests_served = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            summaries, combined = utils.get_studies_and_analyses_summaries(biomes, EXPERIMENTS, scratch, args.concurrency)
+        elapsed, batch_requests = time.perf_counter() - start, server.requests_served
+        print(f"{'batch':>14}: {batch_requests:6d} requests, {elapsed:6.2f} s "
+              f"({100 * (1 - batch_requests / requests):.0f}% fewer requests)")
+
+        for key, summary in expected.items():
+            pd.testing.assert_frame_equal(summaries[key], summary)
+        assert len(combined) == sum(len(summary) for summary in expected.values())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+""" Benchmark of the out-of-core processing of combined_dataframe.csv (bin/chunked.py) against the in-memory
+steps of main.py (read_csv, explore_dataset, feature_engineering, removing_duplicates, save_filtered_ids_to_file).
+
+Each mode runs in its own process on the same synthetic CSV file, so that its peak RSS is measured alone.
+The IDs files of both modes must be identical, and the chunked statistics must match the pandas ones.
+
+Usage:
+    python benchmarks/bench_chunked.py --sizes 100000 1000000 5000000 --chunksize 200000
+"""
+
+# import libraries
+import argparse
+import contextlib
+import filecmp
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from bench_dedup import synthetic_frame
+
+
+def write_combined_csv(path, n_rows, seed=0):
+    """Writes a synthetic combined_dataframe.csv with every summary column, in batches of one million rows."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, 1_000_000):
+        frame = synthetic_frame(min(1_000_000, n_rows - start), seed=seed + start)
+        frame['analysis_id'] = [f"MGYA{start + i:08d}" for i in range(len(frame))]
+        frame['study_name'] = "Synthetic study " + frame['study_id'].str[-4:]
+        frame['centre_name'] = rng.choice(["EMG", "BGI", "JGI", np.nan], len(frame))
+        frame['biomes'] = rng.choice(["root:Engineered:Wastewater", "root:Environmental:Aquatic"], len(frame))
+        frame.loc[rng.random(len(frame)) < 0.01, 'n_samples'] = np.nan
+        frame.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+def run_mode(mode, path, output_path, chunksize, queue):
+    """Runs one mode in a child process and sends back its wall time and peak RSS."""
+    import summary_processing
+    import chunked
+    from bench_e2e import PeakRSS
+    start = time.perf_counter()
+    # ru_maxrss would include the memory of the parent before the exec of the spawned process
+    with contextlib.redirect_stdout(io.StringIO()), PeakRSS() as rss:
+        if mode == "in-memory":
+            combined_df = pd.read_csv(path)
+            summary_processing.explore_dataset(combined_df)
+            deduplicated = summary_processing.removing_duplicates(summary_processing.feature_engineering(combined_df))
+            summary_processing.save_filtered_ids_to_file(deduplicated, 'assembly_run_id', 'initials_run', 'ERR', output_path)
+        else:
+            chunked.process_combined_dataframe_chunked(path, output_path=output_path, chunksize=chunksize)
+    queue.put((time.perf_counter() - start, rss.peak / 1024 ** 2))
+
+
+def check_statistics(path, chunksize):
+    """Compares the chunked statistics and deduplication with pandas on the whole file."""
+    import summary_processing
+    import chunked
+    frame = pd.read_csv(path, dtype=chunked.SUMMARY_DTYPES)
+    stats, table = chunked.scan_combined_dataframe(path, chunksize)
+    pd.testing.assert_series_equal(stats.runs_per_study(), frame.groupby('study_id')['assembly_run_id'].nunique(),
+                                   check_index_type=False)
+    expected_medians = frame.astype({'biomes': 'object'}).groupby('biomes')['n_samples'].median().reset_index()
+    pd.testing.assert_frame_equal(stats.median_samples_per_biome(), expected_medians, check_dtype=False)
+    pd.testing.assert_series_equal(stats.missing, frame.isnull().sum())
+    assert len(stats.studies) == frame['study_id'].nunique()
+    for column, counter in (('experiment_type', stats.experiment_type_counts), ('biomes', stats.biomes_counts)):
+        assert dict(counter) == {key: value for key, value in frame[column].value_counts().items() if value}, column
+
+    engineered = summary_processing.feature_engineering(frame)
+    with contextlib.redirect_stdout(io.StringIO()):
+        deduplicated = summary_processing.removing_duplicates(engineered)
+    assert len(table) == len(deduplicated)
+    assert table.duplicates == int((engineered['concatenated_ids'].value_counts() > 1).sum())
+
+    # two tables built on halves of the file and merged give the same rows as one table
+    half = len(frame) // 2
+    first = chunked.BestPipelineTable().update(engineered.iloc[:half], 0)
+    second = chunked.BestPipelineTable().update(engineered.iloc[half:], half)
+    np.testing.assert_array_equal(first.merge(second).kept_rows(), table.kept_rows())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--check-rows", type=int, default=200_000, help="rows of the file used to check the statistics")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "combined_dataframe.csv")
+        write_combined_csv(path, args.check_rows)
+        check_statistics(path, chunksize=max(1, args.check_rows // 7))
+        print(f"statistics and deduplication match pandas on {args.check_rows} rows\n")
+
+        print(f"{'rows':>10} {'CSV MB':>8} {'in-memory':>10} {'peak MB':>8} {'chunked':>10} {'peak MB':>8}  IDs match")
+        for n_rows in args.sizes:
+            write_combined_csv(path, n_rows)
+            results = {}
+            for mode in ("in-memory", "chunked"):
+                output_path = os.path.join(scratch, mode)
+                os.makedirs(output_path, exist_ok=True)
+                queue = context.Queue()
+                process = context.Process(target=run_mode, args=(mode, path, output_path, args.chunksize, queue))
+                process.start()
+                results[mode] = queue.get()
+                process.join()
+            match = filecmp.cmp(os.path.join(scratch, "in-memory", "assembly_run_ids.txt"),
+                                os.path.join(scratch, "chunked", "assembly_run_ids.txt"), shallow=False)
+            print(f"{n_rows:>10} {os.path.getsize(path) / 1024 ** 2:>8.0f} "
+                  f"{results['in-memory'][0]:>9.2f}s {results['in-memory'][1]:>8.0f} "
+                  f"{results['chunked'][0]:>9.2f}s {results['chunked'][1]:>8.0f}  {'yes' if match else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
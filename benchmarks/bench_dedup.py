@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+""" Benchmark of feature_engineering and removing_duplicates on synthetic combined dataframes.
+
+The current implementations are compared with the previous ones (kept below as reference) and their
+outputs are checked to match. The previous removing_duplicates is quadratic in the number of
+duplicates, so it is only run up to --max-reference-rows; above that size the output is checked
+against a groupby of the first row with the highest 'pipeline_mapped' per ID.
+
+The deduplication is checked on the full kept rows (analysis_id included), not only on the IDs. The
+kept rows now come in the order of the input, while the previous version listed the winners of the
+duplicated IDs first (by number of copies) and the unique IDs after them, so the reference rows are
+aligned on the IDs before the comparison. When copies of an ID tie on the highest 'pipeline_mapped',
+the earliest one is now kept; the previous version kept whichever came first out of numpy's unstable
+quicksort, so those rows may differ (only in the tied copy kept) and are counted in the 'ties' column.
+
+Usage:
+    python benchmarks/bench_dedup.py --sizes 10000 100000 1000000 10000000
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from summary_processing import feature_engineering, removing_duplicates
+
+
+def reference_feature_engineering(dataframe):
+    """feature_engineering as it was before the single pass concatenation."""
+    version_mapping = {1.0: 1, 2.0: 2, 3.0: 3, 4.0: 4, 4.1: 5, 5.0: 6}
+    dataframe['pipeline_mapped'] = dataframe['pipeline_version'].map(version_mapping)
+    dataframe['initials_run'] = dataframe['assembly_run_id'].str[:3]
+    dataframe['concatenated_ids'] = dataframe['study_id'] + '_' + dataframe['sample_id'] + '_' + dataframe['assembly_run_id'] + '_' + dataframe['bioproject']
+    return dataframe
+
+
+def reference_removing_duplicates(dataframe):
+    """removing_duplicates as it was before the single sort pass."""
+    counts = dataframe['concatenated_ids'].value_counts()
+    filtered_df = pd.DataFrame()
+    for id, count in counts[counts > 1].items():
+        dup_rows = dataframe[dataframe['concatenated_ids'] == id]
+        highest_pipeline_mapped_row = dup_rows.sort_values(by='pipeline_mapped', ascending=False).head(1)
+        filtered_df = pd.concat([filtered_df, highest_pipeline_mapped_row], ignore_index=True)
+    non_duplicate_ids = counts[counts == 1].index
+    non_duplicate_rows = dataframe[dataframe['concatenated_ids'].isin(non_duplicate_ids)]
+    filtered_df = pd.concat([filtered_df, non_duplicate_rows], ignore_index=True)
+    return filtered_df
+
+
+def synthetic_frame(n_rows, duplicate_ratio=0.2, missing_ratio=0.001, seed=0):
+    """
+    Builds a frame with the columns of combined_dataframe.csv.
+
+    About `duplicate_ratio` of the rows repeat the identifiers of another row with a different pipeline version,
+    and `missing_ratio` of the rows have no sample_id.
+    """
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(n_rows * (1 - duplicate_ratio)))
+    key = np.concatenate([np.arange(n_unique), rng.integers(0, n_unique, n_rows - n_unique)])
+    rng.shuffle(key)
+    frame = pd.DataFrame({
+        'analysis_id': [f"MGYA{i:08d}" for i in range(n_rows)],
+        'experiment_type': rng.choice(["metagenomic", "metatranscriptomic", "assembly"], n_rows),
+        'pipeline_version': rng.choice([1.0, 2.0, 3.0, 4.0, 4.1, 5.0], n_rows),
+        'instrument_platform': "Illumina HiSeq 2500",
+        'study_id': [f"MGYS{k // 50:08d}" for k in key],
+        'sample_id': [f"ERS{k:08d}" for k in key],
+        'assembly_run_id': [("ERZ" if k % 5 == 0 else "ERR") + f"{k:08d}" for k in key],
+        'bioproject': [f"PRJEB{k // 50}" for k in key],
+        'n_samples': rng.integers(1, 500, n_rows),
+    })
+    frame.loc[rng.random(n_rows) < missing_ratio, 'sample_id'] = np.nan
+    return frame
+
+
+def compare_with_reference(deduplicated, expected):
+    """
+    Checks the kept rows against the output of reference_removing_duplicates.
+
+    Returns:
+        int: The number of IDs for which another copy with the same highest 'pipeline_mapped' was kept.
+    """
+    assert deduplicated['analysis_id'].is_monotonic_increasing, "the kept rows are not in the order of the input"
+    assert len(deduplicated) == len(expected), f"{len(deduplicated)} rows kept instead of {len(expected)}"
+    expected = expected.set_index('concatenated_ids').loc[deduplicated['concatenated_ids']].reset_index()
+    expected = expected[deduplicated.columns]
+    pd.testing.assert_series_equal(deduplicated['pipeline_mapped'], expected['pipeline_mapped'])
+    tied = (deduplicated['analysis_id'] != expected['analysis_id']).to_numpy()
+    pd.testing.assert_frame_equal(deduplicated[~tied].reset_index(drop=True), expected[~tied].reset_index(drop=True))
+    return int(tied.sum())
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--max-reference-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'features':>10} {'ref feat':>10} {'dedup':>10} {'ref dedup':>10} {'ties':>6}  match")
+    for n_rows in args.sizes:
+        frame = synthetic_frame(n_rows)
+
+        engineered, feature_time = timed(feature_engineering, frame.copy())
+        reference, reference_feature_time = timed(reference_feature_engineering, frame.copy())
+        pd.testing.assert_frame_equal(engineered, reference)
+
+        deduplicated, dedup_time = timed(removing_duplicates, engineered)
+        if n_rows <= args.max_reference_rows:
+            expected, reference_dedup_time = timed(reference_removing_duplicates, reference)
+            ties = f"{compare_with_reference(deduplicated, expected):>6}"
+            reference_dedup = f"{reference_dedup_time:>9.2f}s"
+            match = "yes (reference)"
+        else:
+            # idxmax returns the first row with the highest pipeline, like the stable sort of the reference
+            best = engineered.groupby('concatenated_ids')['pipeline_mapped'].idxmax()
+            pd.testing.assert_frame_equal(deduplicated, engineered.loc[np.sort(best.to_numpy())].reset_index(drop=True))
+            reference_dedup = f"{'-':>10}"
+            ties = f"{'-':>6}"
+            match = "yes (groupby)"
+
+        print(f"{n_rows:>10} {feature_time:>9.2f}s {reference_feature_time:>9.2f}s "
+              f"{dedup_time:>9.2f}s {reference_dedup} {ties}  {match}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+""" End-to-end benchmark of the pipeline against local stand-ins: the mock MGnify API (mock_mgnify.py),
+the ENA-like FTP server (ftp_fixture.py) and the Blob storage emulator (blob_emulator.py).
+
+The real code paths are run:
+    1. get_studies_and_analyses_summary for every experiment type (metadata stage)
+    2. feature_engineering, removing_duplicates and the 'ERR' run IDs (dedup stage)
+    3. download_files_and_upload_to_azure for the first --accessions run IDs (transfer stage)
+
+Reported per stage: wall time, pages/s, accessions/min, MB/s and the peak RSS of the process
+(sampled every 10 ms). The results can be saved as JSON and compared with a previous run:
+the script exits with status 1 if a stage is slower than the baseline by more than --tolerance,
+if an uploaded blob differs from its source, if a stage fails, or if the summaries miss analyses
+(e.g. pages lost to injected 429 answers).
+
+Usage:
+    python benchmarks/bench_e2e.py --pages 40 --latency 0.02 --accessions 4 --file-mb 16 --output e2e.json
+    python benchmarks/bench_e2e.py --baseline e2e.json --tolerance 0.25
+    python benchmarks/bench_e2e.py --throttle-every 20      # inject a 429 every 20 API requests
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import pandas as pd
+import psutil
+from azure.storage.blob import BlobServiceClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import summary_processing
+import utils
+from blob_emulator import BlobEmulator
+from ftp_fixture import LocalFTPServer, make_fastq_tree
+from mock_mgnify import MockMGnifyServer, EXPERIMENT_TYPES
+
+BIOME = "root:Engineered:Wastewater"
+CONTAINER = "retrievefastq"
+
+# rates compared with the baseline: a lower value is a regression
+RATES = ("pages_per_s", "accessions_per_min", "mb_per_s")
+
+
+class PeakRSS:
+    """Samples the resident memory of the process in a background thread and keeps the peak of the current stage."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def reset(self):
+        self.peak = self._process.memory_info().rss
+
+    def __enter__(self):
+        self.reset()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+@contextlib.contextmanager
+def stage(name, results, rss, quiet=True):
+    """Times a stage, records its peak RSS and its error (if any) in results[name]."""
+    result = results.setdefault(name, {})
+    rss.reset()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            yield result
+    except Exception as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+        traceback.print_exc()
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        result["peak_rss_mb"] = round(max(rss.peak, psutil.Process().memory_info().rss) / 1024 ** 2, 1)
+
+
+def compare(results, baseline, tolerance):
+    """Returns the rates of results lower than the baseline ones by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, result in results.items():
+        for rate in RATES:
+            before, after = baseline.get(name, {}).get(rate), result.get(rate)
+            if before and after is not None and after < before * (1 - tolerance):
+                regressions.append(f"{name}.{rate}: {after:.2f} < {before:.2f} (-{100 * (1 - after / before):.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40, help="pages of each unfiltered listing")
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.02, help="server side latency per page in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every n-th API request with a 429")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="answer with a 429 the API requests above this many in flight")
+    parser.add_argument("--retry-after", type=float, default=1, help="seconds sent in the Retry-After header of the 429 answers")
+    parser.add_argument("--concurrency", type=int, default=8, help="pages requested at the same time")
+    parser.add_argument("--accessions", type=int, default=4, help="run accessions transferred")
+    parser.add_argument("--file-mb", type=int, default=16, help="size of each FASTQ file (2 per accession)")
+    parser.add_argument("--bandwidth-mb", type=float, default=None, help="per connection FTP bandwidth in MB/s")
+    parser.add_argument("--blob-latency", type=float, default=0.0, help="seconds added to every blob request")
+    parser.add_argument("--streaming", action="store_true", help="stream the transfers instead of going through the disk")
+    parser.add_argument("--connections", type=int, default=1, help="FTP connections per large file when streaming")
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown compared with the baseline")
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    bandwidth = int(args.bandwidth_mb * 1024 * 1024) if args.bandwidth_mb else None
+    with PeakRSS() as rss, tempfile.TemporaryDirectory() as scratch, \
+            MockMGnifyServer(pages=args.pages, page_size=args.page_size, latency=args.latency,
+                             throttle_every=args.throttle_every, max_in_flight=args.max_in_flight,
+                             retry_after=args.retry_after) as api, \
+            LocalFTPServer(bandwidth=bandwidth) as ftp_server, BlobEmulator(latency=args.blob_latency) as emulator:
+        utils.MGNIFY_API_URL = api.url
+
+        summaries = []
+        with stage("metadata", results, rss) as result:
+            for experiment_type in EXPERIMENT_TYPES:
+                summaries.append(utils.get_studies_and_analyses_summary(BIOME, experiment_type, scratch, args.concurrency))
+        result.update(pages=api.requests_served, throttled=api.requests_throttled,
+                      pages_per_s=round(api.requests_served / result["seconds"], 2),
+                      records=sum(len(summary) for summary in summaries))
+        # every synthetic analysis belongs to one experiment type, so a complete run summarizes all of them
+        expected = len(api.records["analyses"])
+        if "error" not in result and result["records"] != expected:
+            result["error"] = f"incomplete: {result['records']} of {expected} analyses summarized"
+
+        run_ids = []
+        with stage("dedup", results, rss) as result:
+            combined = pd.concat(summaries, axis=0, ignore_index=True)
+            deduplicated = summary_processing.removing_duplicates(summary_processing.feature_engineering(combined))
+            run_ids = list(dict.fromkeys(deduplicated.loc[deduplicated['initials_run'] == 'ERR', 'assembly_run_id']))
+            result.update(rows=len(combined), unique=len(deduplicated), run_ids=len(run_ids))
+
+        accessions = run_ids[:args.accessions]
+        if "error" not in results["metadata"] and "error" not in results["dedup"] and len(accessions) < args.accessions:
+            results["dedup"]["error"] = f"only {len(accessions)} ERR run IDs in the summaries, increase --pages"
+        paths = make_fastq_tree(ftp_server.root, accessions, file_size=args.file_mb * 1024 * 1024)
+        total_bytes = sum(len(files) for files in paths.values()) * args.file_mb * 1024 * 1024
+        BlobServiceClient.from_connection_string(emulator.connection_string).create_container(CONTAINER)
+        server_address = f"{ftp_server.host}:{ftp_server.port}"
+
+        with stage("transfer", results, rss) as result:
+            for accession in accessions:
+                utils.download_files_and_upload_to_azure(server_address, accession, scratch, emulator.connection_string,
+                                                         CONTAINER, streaming=args.streaming, connections=args.connections)
+            for accession, files in paths.items():
+                for remote_path in files:
+                    name = os.path.basename(remote_path)
+                    with open(os.path.join(ftp_server.root, remote_path.strip("/")), "rb") as source:
+                        if emulator.blob_data(CONTAINER, f"{accession}/{name}") != source.read():
+                            raise AssertionError(f"blob {accession}/{name} differs from its source")
+        result.update(accessions=len(accessions), mb=round(total_bytes / 1024 ** 2, 1),
+                      accessions_per_min=round(60 * len(accessions) / result["seconds"], 2),
+                      mb_per_s=round(total_bytes / 1024 ** 2 / result["seconds"], 2))
+
+    print(f"{'stage':<10} {'seconds':>8} {'pages/s':>9} {'acc/min':>9} {'MB/s':>8} {'peak RSS MB':>12}  notes")
+    for name, result in results.items():
+        rates = [f"{result[rate]:>{width}.1f}" if rate in result else " " * width
+                 for rate, width in (("pages_per_s", 9), ("accessions_per_min", 9), ("mb_per_s", 8))]
+        notes = result.get("error") or ", ".join(f"{key}={result[key]}" for key in ("pages", "throttled", "records", "rows", "unique", "run_ids", "mb")
+                                                 if key in result)
+        print(f"{name:<10} {result['seconds']:>8.2f} {' '.join(rates)} {result['peak_rss_mb']:>12.1f}  {notes}")
+        failed = failed or "error" in result
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"args": vars(args), "results": results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
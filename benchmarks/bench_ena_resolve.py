@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+""" Benchmark of the ENA FASTQ path discovery: FTP commands and time per accession.
+
+Compares the previous 'cwd into every NNN subfolder' probing with resolve_fastq_files,
+cold (empty index) and warm (persistent index filled by the previous pass).
+
+Usage:
+    python benchmarks/bench_ena_resolve.py --accessions 50
+"""
+
+# import libraries
+import argparse
+import os
+import sys
+import tempfile
+import time
+from ftplib import FTP
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from ena_ftp import AccessionIndex, resolve_fastq_files
+from ftp_fixture import LocalFTPServer, make_fastq_tree
+
+
+def probing_resolve(ftp, accession):
+    """The discovery loop used before the resolver: cwd into the accession folder, then into 001..999."""
+    base_path = f'/vol1/fastq/{accession[:6]}/'
+    try:
+        ftp.cwd(f"{base_path}{accession}/")
+        files = ftp.nlst()
+        if files:
+            return files
+    except Exception:
+        pass
+    for i in range(1, 1000):
+        try:
+            ftp.cwd(f"{base_path}{i:03}/{accession}/")
+            files = ftp.nlst()
+            if files:
+                return files
+        except Exception:
+            continue
+    return []
+
+
+def synthetic_accessions(n):
+    """Accessions with 6 to 9 digits, so every ENA directory layout is exercised."""
+    accessions = []
+    for i in range(n):
+        digits = 6 + i % 4
+        accessions.append("ERR" + str(10 ** (digits - 1) + 7919 * i + 11)[:digits])
+    return accessions
+
+
+def run(server, accessions, resolver):
+    ftp = FTP()
+    ftp.connect(server.host, server.port)
+    ftp.login()
+    server.reset_counters()
+    start = time.perf_counter()
+    found = sum(1 for accession in accessions if resolver(ftp, accession))
+    elapsed = time.perf_counter() - start
+    commands = server.total_commands()
+    ftp.quit()
+    return found, commands, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accessions", type=int, default=40)
+    args = parser.parse_args()
+
+    accessions = synthetic_accessions(args.accessions)
+    with LocalFTPServer() as server, tempfile.TemporaryDirectory() as tmp:
+        make_fastq_tree(server.root, accessions, file_size=0)
+        index = AccessionIndex(os.path.join(tmp, "index.sqlite"))
+
+        passes = [
+            ("probing", lambda ftp, accession: probing_resolve(ftp, accession)),
+            ("resolver (cold)", lambda ftp, accession: resolve_fastq_files(ftp, accession, index=index)[1]),
+            ("resolver (warm)", lambda ftp, accession: resolve_fastq_files(ftp, accession, index=index)[1]),
+        ]
+        print(f"{'discovery':>16} {'found':>7} {'FTP cmds/acc':>13} {'ms/acc':>8}")
+        for name, resolver in passes:
+            found, commands, elapsed = run(server, accessions, resolver)
+            print(f"{name:>16} {found:>3}/{len(accessions):<3} {commands / len(accessions):>13.1f} "
+                  f"{1000 * elapsed / len(accessions):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
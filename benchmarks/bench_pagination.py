@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+""" Benchmark of the MGnify pagination: serial requests loop vs concurrent aiohttp engine.
+
+Usage:
+    python benchmarks/bench_pagination.py --pages 200 --latency 0.05 --concurrency 1 4 8 16
+"""
+
+# import libraries
+import argparse
+import os
+import sys
+import time
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from mgnify_api import fetch_all_pages
+from mock_mgnify import MockMGnifyServer
+
+
+def serial_fetch(url, params):
+    """The pagination loop used before the concurrent engine: one blocking request per page."""
+    records = []
+    page = 1
+    while True:
+        params["page"] = page
+        response = requests.get(url, params=params)
+        response.raise_for_status()
+        body = response.json()
+        records.extend(body["data"])
+        if page >= body["meta"]["pagination"]["pages"]:
+            break
+        page += 1
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.02, help="server side latency per page in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    with MockMGnifyServer(pages=args.pages, page_size=args.page_size, latency=args.latency) as server:
+        url = f"{server.url}/analyses"
+        params = {"biome_name": "root:Engineered:Wastewater"}
+
+        start = time.perf_counter()
+        expected = serial_fetch(url, dict(params))
+        elapsed = time.perf_counter() - start
+        print(f"{'serial':>14}: {args.pages / elapsed:8.1f} pages/sec ({elapsed:.2f} s)")
+
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            records = fetch_all_pages(url, dict(params), concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            assert records == expected, "concurrent engine returned different records"
+            print(f"{'concurrency ' + str(concurrency):>14}: {args.pages / elapsed:8.1f} pages/sec ({elapsed:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+""" Benchmark of the request controller (bin/request_controller.py) against a server with a capacity limit.
+
+The mock MGnify API answers with a 429 every request above --capacity in flight. Each window of
+concurrent pages is fetched twice:
+    fixed     the limit stays at the window (decrease_factor=1), only the retries recover the pages
+    adaptive  the AIMD limit starts at 8 and backs off on every round of 429 answers
+Both modes must return every record; the table reports the throughput, the 429 answers and the limits.
+
+Usage:
+    python benchmarks/bench_rate_limit.py --pages 200 --capacity 6 --windows 8 16 32
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import request_controller
+from mgnify_api import fetch_all_pages
+from mock_mgnify import MockMGnifyServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.05, help="server side latency per page in seconds")
+    parser.add_argument("--capacity", type=int, default=6, help="requests in flight served before answering with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="seconds sent in the 'Retry-After' header")
+    parser.add_argument("--windows", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    print(f"{'window':>6} {'mode':>9} {'pages/s':>8} {'429s':>6} {'retries':>8} {'limit':>6} {'lowest':>7}  complete")
+    for window in args.windows:
+        for mode in ("fixed", "adaptive"):
+            with MockMGnifyServer(pages=args.pages, page_size=args.page_size, latency=args.latency,
+                                  max_in_flight=args.capacity, retry_after=args.retry_after) as server:
+                if mode == "fixed":
+                    request_controller.configure(initial_concurrency=window, max_concurrency=window,
+                                                 decrease_factor=1.0, max_retries=50)
+                else:
+                    request_controller.configure(initial_concurrency=min(8, window), max_concurrency=window, max_retries=50)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    records = fetch_all_pages(f"{server.url}/analyses", {}, concurrency=window)
+                elapsed = time.perf_counter() - start
+                controller = request_controller.CONTROLLER
+                complete = len(records) == len(server.records["analyses"])
+                print(f"{window:>6} {mode:>9} {args.pages / elapsed:>8.1f} {server.requests_throttled:>6} "
+                      f"{controller.stats['retries']:>8} {controller.limit:>6.1f} {controller.lowest_limit:>7.1f}  "
+                      f"{'yes' if complete else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+""" Benchmark of the segmented download of one large FASTQ file: single stream vs several FTP connections
+each fetching byte ranges (REST offsets), against a local FTP server throttled per connection like
+ftp.sra.ebi.ac.uk. Every run is checked byte for byte against the source file.
+
+Usage:
+    python benchmarks/bench_segmented.py --file-mb 128 --bandwidth-mb 8 --connections 1 2 4 8
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from ena_ftp import ftp_connect
+from transfer import DEFAULT_BLOCK_SIZE, plan_segments, shared_container_client, transfer_file_resumable
+from blob_emulator import BlobEmulator
+from ftp_fixture import LocalFTPServer, make_fastq_tree
+
+CONTAINER = "retrievefastq"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file-mb", type=int, default=128)
+    parser.add_argument("--bandwidth-mb", type=float, default=8.0, help="per connection FTP bandwidth in MB/s")
+    parser.add_argument("--blob-latency", type=float, default=0.0, help="seconds added to every blob request")
+    parser.add_argument("--connections", type=int, nargs="*", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    bandwidth = int(args.bandwidth_mb * 1024 * 1024) if args.bandwidth_mb else None
+    with LocalFTPServer(bandwidth=bandwidth) as ftp_server, BlobEmulator(latency=args.blob_latency) as emulator:
+        # an odd size, so that the last block and the last segment are partial
+        size = args.file_mb * 1024 * 1024 + 12345
+        paths = make_fastq_tree(ftp_server.root, ["ERR977403"], file_size=size, paired=False)
+        remote_path = paths["ERR977403"][0]
+        with open(os.path.join(ftp_server.root, remote_path.strip("/")), "rb") as source:
+            expected = source.read()
+
+        container_client = shared_container_client(emulator.connection_string, CONTAINER)
+        container_client.create_container()
+        blob_client = container_client.get_blob_client("ERR977403/ERR977403.fastq.gz")
+        server_address = f"{ftp_server.host}:{ftp_server.port}"
+
+        blocks = -(-size // DEFAULT_BLOCK_SIZE)
+        for connections in args.connections:
+            segments = plan_segments(list(range(blocks)), connections) if connections > 1 else [(0, blocks)]
+            ftp = ftp_connect(server_address)
+            ftp_server.reset_counters()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                transfer_file_resumable(ftp, "ERR977403", remote_path, blob_client, connections=connections)
+            elapsed = time.perf_counter() - start
+            ftp.quit()
+            assert emulator.blob_data(CONTAINER, "ERR977403/ERR977403.fastq.gz") == expected, connections
+            emulator.containers[CONTAINER].clear()
+            print(f"{connections:>3} connections: {args.file_mb / elapsed:8.1f} MB/s ({elapsed:.2f} s, "
+                  f"{len(segments)} segments, {ftp_server.commands.get('RETR', 0)} RETR)")
+
+
+if __name__ == "__main__":
+    main()
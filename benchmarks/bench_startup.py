@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+""" Benchmark of the startup time of every command of bin/main.py.
+
+Each command runs in a fresh interpreter (python -X importtime) against the local stand-ins: the mock
+MGnify API, the ENA-like FTP server and the Blob storage emulator, with tiny inputs so that the wall
+time is dominated by the start of the process. Reported per command: the best wall time of --repeat
+runs, the time spent importing modules and the number of imported modules. The 'eager imports' row
+is the import line of the previous main.py (from utils import * plus every backend), which every
+step used to pay.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+
+# import libraries
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin")
+sys.path.insert(0, BIN)
+
+from azure.storage.blob import BlobServiceClient
+from blob_emulator import BlobEmulator
+from ftp_fixture import LocalFTPServer, make_fastq_tree
+from mock_mgnify import MockMGnifyServer
+
+CONTAINER = "retrievefastq"
+EAGER_IMPORTS = ("from utils import *; import http_cache, state_store, streaming, chunked, ena_ftp, "
+                 "transfer, transfer_journal, metrics, request_controller")
+
+
+def run(argv, cwd, env):
+    """Runs one command and returns its wall time, the sum of its import times and its number of imported modules."""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=cwd, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed:\n{process.stderr[-2000:]}")
+    # 'import time: self [us] | cumulative | imported package', one line per module
+    lines = [line for line in process.stderr.splitlines() if line.startswith("import time:") and "self [us]" not in line]
+    import_seconds = sum(int(line.split(":", 1)[1].split("|")[0]) for line in lines) / 1e6
+    return elapsed, import_seconds, len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each command (the best one is reported)")
+    args = parser.parse_args()
+
+    main_py = os.path.abspath(os.path.join(BIN, "main.py"))
+    with tempfile.TemporaryDirectory() as scratch, MockMGnifyServer(pages=2, latency=0) as api, \
+            LocalFTPServer() as ftp_server, BlobEmulator() as emulator:
+        accession = "ERR1000000"
+        make_fastq_tree(ftp_server.root, [accession], file_size=1024)
+        BlobServiceClient.from_connection_string(emulator.connection_string).create_container(CONTAINER)
+        env = dict(os.environ, MGNIFY_API_URL=api.url, AZURE_STORAGE_CONNECTION_STRING=emulator.connection_string,
+                   PYTHONPATH=os.path.abspath(BIN))
+        output_dir = os.path.join(scratch, "outputs")
+
+        commands = [
+            ("--help", [main_py, "--help"]),
+            ("biomes", [main_py, "biomes", "--output_dir", output_dir, "--cache_dir", ""]),
+            ("summarize", [main_py, "summarize", "--output_dir", output_dir, "--cache_dir", "", "--full_listing"]),
+            ("dedup", [main_py, "dedup", "--output_dir", output_dir]),
+            ("extract-ids", [main_py, "extract-ids", "--output_dir", output_dir]),
+            ("transfer", [main_py, "transfer", "--accessions", accession, "--server", f"{ftp_server.host}:{ftp_server.port}"]),
+            ("eager imports", ["-c", EAGER_IMPORTS]),
+        ]
+        print(f"{'command':<14} {'seconds':>8} {'imports s':>10} {'modules':>8}")
+        for name, argv in commands:
+            # the commands depend on each other's outputs, so each one runs --repeat times before the next one
+            elapsed, import_seconds, modules = min(run(argv, scratch, env) for _ in range(args.repeat))
+            print(f"{name:<14} {elapsed:>8.3f} {import_seconds:>10.3f} {modules:>8}")
+
+        with open(os.path.join(output_dir, "assembly_run_ids.txt")) as file:
+            assert accession in file.read().split(), "the run IDs miss the first synthetic accession"
+        assert emulator.blob_data(CONTAINER, f"{accession}/{accession}_1.fastq.gz"), "the FASTQ file was not transferred"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+""" Benchmark of the Parquet summary store (bin/summary_store.py) against the CSV files it replaces.
+
+The same synthetic summaries (one per biome and experiment type) go through both formats:
+    csv      every new summary is concatenated with the previous ones and combined_dataframe.csv is
+             rewritten (the loop of the previous main.py), then parsed back for the deduplication,
+             and the deduplicated CSV is parsed back for the IDs
+    parquet  every summary is written once to its partition, the deduplication reads the dataset,
+             and the IDs are read with 'initials_run == ERR' pushed down to the Parquet reader
+Reported: the time of each step, the size on disk and the read time of a single partition.
+Both formats must give the same IDs.
+
+Usage:
+    python benchmarks/bench_summary_store.py --rows 200000 --biomes 4
+"""
+
+# import libraries
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import summary_processing
+import summary_store
+from bench_dedup import synthetic_frame
+from mock_mgnify import EXPERIMENT_TYPES
+
+
+def directory_size(path):
+    """Returns the size in MB of a file or of every file under a directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1024 ** 2
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1024 ** 2
+
+
+def make_summaries(n_biomes, rows):
+    """Returns {(biome, experiment type): summary} with the columns of summarize_records."""
+    summaries = {}
+    for b in range(n_biomes):
+        for e, experiment_type in enumerate(EXPERIMENT_TYPES):
+            frame = synthetic_frame(rows, seed=b * len(EXPERIMENT_TYPES) + e)
+            frame['experiment_type'] = experiment_type
+            frame['analysis_id'] = [f"MGYA{b:02d}{e}{i:08d}" for i in range(rows)]
+            frame['study_name'] = "Synthetic study " + frame['study_id'].str[-4:]
+            frame['centre_name'] = "EMG"
+            frame['biomes'] = f"root:Synthetic:Biome{b}"
+            summaries[(f"root:Synthetic:Biome{b}", experiment_type)] = frame
+    # the store reads its partitions sorted by biome and experiment type: the CSV file gets the same order
+    return dict(sorted(summaries.items()))
+
+
+def dedup(combined_df):
+    """feature_engineering and removing_duplicates, as in the dedup command."""
+    return summary_processing.removing_duplicates(summary_processing.feature_engineering(combined_df))
+
+
+def run_csv(summaries, scratch):
+    """The CSV steps; returns {step: seconds}."""
+    times = {}
+    combined_path = os.path.join(scratch, "combined_dataframe.csv")
+    start = time.perf_counter()
+    collected = []
+    for summary in summaries.values():
+        collected.append(summary)
+        pd.concat(collected, axis=0).to_csv(combined_path, index=False)
+    times["write"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    deduplicated = dedup(pd.read_csv(combined_path))
+    deduplicated.to_csv(os.path.join(scratch, "deduplicated_dataframe.csv"), index=False)
+    times["dedup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    deduplicated = pd.read_csv(os.path.join(scratch, "deduplicated_dataframe.csv"))
+    summary_processing.save_filtered_ids_to_file(deduplicated, 'assembly_run_id', 'initials_run', 'ERR', scratch)
+    times["ids"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    combined_df = pd.read_csv(combined_path)
+    first_biome, first_type = next(iter(summaries))
+    combined_df[(combined_df['biomes'] == first_biome) & (combined_df['experiment_type'] == first_type)]
+    times["one partition"] = time.perf_counter() - start
+    times["MB"] = directory_size(combined_path)
+    return times
+
+
+def run_parquet(summaries, scratch):
+    """The Parquet steps; returns {step: seconds}."""
+    times = {}
+    store_path = os.path.join(scratch, summary_store.STORE_NAME)
+    start = time.perf_counter()
+    for (biome, experiment_type), summary in summaries.items():
+        summary_store.write_summary(summary, store_path, biome, experiment_type)
+    times["write"] = time.perf_counter() - start
+
+    deduplicated_path = os.path.join(scratch, "deduplicated.parquet")
+    start = time.perf_counter()
+    deduplicated = dedup(summary_store.read_summaries(store_path))
+    with summary_store.SummaryWriter(deduplicated_path, list(deduplicated.columns)) as writer:
+        writer.write(deduplicated)
+    times["dedup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary_processing.save_filtered_ids_to_file(deduplicated_path, 'assembly_run_id', 'initials_run', 'ERR', scratch)
+    times["ids"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first_biome, first_type = next(iter(summaries))
+    summary_store.read_summaries(store_path, biome_names=[first_biome], experiment_types=[first_type])
+    times["one partition"] = time.perf_counter() - start
+    times["MB"] = directory_size(store_path)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="rows of each summary")
+    parser.add_argument("--biomes", type=int, default=4, help="biomes (each one with every experiment type)")
+    args = parser.parse_args()
+
+    summaries = make_summaries(args.biomes, args.rows)
+    with tempfile.TemporaryDirectory() as scratch:
+        results = {}
+        for name, run in (("csv", run_csv), ("parquet", run_parquet)):
+            os.makedirs(os.path.join(scratch, name))
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = run(summaries, os.path.join(scratch, name))
+        match = filecmp.cmp(os.path.join(scratch, "csv", "assembly_run_ids.txt"),
+                            os.path.join(scratch, "parquet", "assembly_run_ids.txt"), shallow=False)
+
+    print(f"{len(summaries)} summaries of {args.rows} rows")
+    steps = ["write", "dedup", "ids", "one partition"]
+    print(f"{'format':<8} " + " ".join(f"{step + ' s':>16}" for step in steps) + f" {'MB on disk':>11}")
+    for name, times in results.items():
+        print(f"{name:<8} " + " ".join(f"{times[step]:>16.2f}" for step in steps) + f" {times['MB']:>11.1f}")
+    print(f"IDs match: {'yes' if match else 'NO'}")
+    if not match:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+""" Benchmark of the taxonomy abundance loader: pandas.read_csv of the dense table vs the streaming sparse
+parser vs the memory-mapped binary cache, and the phylum roll-up with a pandas groupby on split lineage
+strings vs the rank trie. The roll-ups are checked against each other.
+
+A synthetic table with the MGnify layout (lineage rows, ERR run columns, mostly zeros) is written first.
+
+Usage:
+    python benchmarks/bench_taxonomy.py --lineages 3000 --runs 5000 --density 0.02
+"""
+
+# import libraries
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from taxonomy_table import load_taxonomy_table, rank_depth
+
+
+def write_synthetic_table(path, lineages, runs, density, seed=0):
+    """Writes a random taxonomy abundance TSV with `lineages` rows and `runs` columns."""
+    rng = np.random.default_rng(seed)
+    names = set()
+    while len(names) < lineages:
+        kingdom, phylum, klass, order, family, genus, species = rng.integers(0, [2, 40, 120, 300, 800, 2000, 6000])
+        names.add(f"Root;k__K{kingdom};p__P{phylum};c__C{klass};o__O{order};f__F{family};g__G{genus};s__S{species}")
+    with open(path, "w") as file:
+        file.write("#SampleID\t" + "\t".join(f"ERR{977403 + i}" for i in range(runs)) + "\n")
+        for name in sorted(names):
+            row = np.where(rng.random(runs) < density, rng.integers(1, 5000, runs), 0)
+            file.write(name + "\t" + "\t".join(map(str, row)) + "\n")
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineages", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=5000)
+    parser.add_argument("--density", type=float, default=0.02)
+    parser.add_argument("--rank", default="phylum")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "taxonomy_abundances.tsv")
+        write_synthetic_table(path, args.lineages, args.runs, args.density)
+        print(f"{args.lineages} lineages x {args.runs} runs, {os.path.getsize(path) / 1024 ** 2:.1f} MB of TSV")
+
+        dense, dense_seconds = timed(lambda: pd.read_csv(path, sep="\t", index_col=0))
+        cache_dir = os.path.join(scratch, "cache")
+        table, parse_seconds = timed(lambda: load_taxonomy_table(path, cache_dir=cache_dir))
+        cached, cached_seconds = timed(lambda: load_taxonomy_table(path, cache_dir=cache_dir))
+        matrix = table.matrix
+        sparse_mb = (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1024 ** 2
+        print(f"{'pandas.read_csv':>18}: {dense_seconds:8.3f} s, {dense.memory_usage().sum() / 1024 ** 2:8.1f} MB")
+        print(f"{'sparse parse':>18}: {parse_seconds:8.3f} s, {sparse_mb:8.1f} MB")
+        print(f"{'cached load':>18}: {cached_seconds:8.3f} s (memory-mapped)")
+
+        depth = rank_depth(args.rank)
+
+        def groupby_rollup():
+            keys = dense.index.str.split(";").str[:depth].str.join(";")
+            return dense.groupby(keys).sum()
+
+        expected, groupby_seconds = timed(groupby_rollup)
+        rolled, trie_seconds = timed(lambda: cached.rollup(args.rank))
+        result = pd.DataFrame(rolled.matrix.toarray(), index=rolled.lineages, columns=rolled.run_ids).sort_index()
+        assert np.array_equal(result.to_numpy(), expected.sort_index().to_numpy())
+        print(f"{args.rank} roll-up ({len(expected)} groups): groupby {groupby_seconds:.3f} s, trie {trie_seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
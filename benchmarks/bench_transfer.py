@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+""" Benchmark of the FASTQ transfers: local disk round-trip vs streaming block staging, one accession
+at a time with download_files_and_upload_to_azure, then the TransferScheduler with several worker counts.
+
+A local FTP server serves synthetic FASTQ files (optionally throttled per connection, like
+ftp.sra.ebi.ac.uk) and an in-process blob emulator receives them.
+
+Usage:
+    python benchmarks/bench_transfer.py --accessions 8 --file-mb 16 --bandwidth-mb 5 --workers 1 2 4 8
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from azure.storage.blob import BlobServiceClient
+from transfer import TransferScheduler, shared_container_client
+from utils import download_files_and_upload_to_azure
+from blob_emulator import BlobEmulator
+from ftp_fixture import LocalFTPServer, make_fastq_tree
+
+CONTAINER = "retrievefastq"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accessions", type=int, default=2)
+    parser.add_argument("--file-mb", type=int, default=32)
+    parser.add_argument("--bandwidth-mb", type=float, default=None, help="per connection FTP bandwidth in MB/s")
+    parser.add_argument("--blob-latency", type=float, default=0.0, help="seconds added to every blob request")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4], help="worker counts of the scheduler")
+    args = parser.parse_args()
+
+    accessions = [f"ERR{977403 + i}" for i in range(args.accessions)]
+    bandwidth = int(args.bandwidth_mb * 1024 * 1024) if args.bandwidth_mb else None
+    with LocalFTPServer(bandwidth=bandwidth) as ftp_server, BlobEmulator(latency=args.blob_latency) as emulator, \
+            tempfile.TemporaryDirectory() as scratch:
+        paths = make_fastq_tree(ftp_server.root, accessions, file_size=args.file_mb * 1024 * 1024)
+        total_mb = sum(len(files) for files in paths.values()) * args.file_mb
+        BlobServiceClient.from_connection_string(emulator.connection_string).create_container(CONTAINER)
+
+        server_address = f"{ftp_server.host}:{ftp_server.port}"
+
+        def check_and_clear():
+            for accession, files in paths.items():
+                for remote_path in files:
+                    name = os.path.basename(remote_path)
+                    with open(os.path.join(ftp_server.root, remote_path.strip("/")), "rb") as source:
+                        assert emulator.blob_data(CONTAINER, f"{accession}/{name}") == source.read(), name
+            emulator.containers[CONTAINER].clear()
+
+        runs = [("disk", None), ("streaming", None)] + [(f"scheduler x{workers}", workers) for workers in args.workers]
+        for mode, workers in runs:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if workers is None:
+                    for accession in accessions:
+                        download_files_and_upload_to_azure(server_address, accession, scratch, emulator.connection_string,
+                                                           CONTAINER, streaming=(mode == "streaming"))
+                else:
+                    container_client = shared_container_client(emulator.connection_string, CONTAINER)
+                    TransferScheduler(server_address, container_client, workers=workers).run(accessions)
+            elapsed = time.perf_counter() - start
+            check_and_clear()
+            print(f"{mode:>14}: {total_mb / elapsed:8.1f} MB/s ({total_mb} MB in {elapsed:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+""" Minimal in-process stand-in for Azure Blob Storage (Azurite-style) used by the benchmarks.
+
+It implements the block blob REST operations used by the pipeline: create container, Put Blob,
+Put Block, Put Block List, Get Block List, Get Blob Properties, Get Blob and Delete Blob. Requests
+are not authenticated. Use `connection_string` with BlobServiceClient.from_connection_string.
+"""
+
+# import libraries
+import asyncio
+import base64
+import hashlib
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from email.utils import formatdate
+from aiohttp import web
+
+ACCOUNT = "devstoreaccount1"
+# well known development key of Azurite, only used to let the SDK sign requests
+ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
+
+
+class BlobEmulator:
+    """
+    Block blob store served over HTTP from a background thread.
+
+    Args:
+        latency (float, optional): Seconds slept before answering each request. Defaults to 0.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.containers = {}     # container -> {blob name: committed bytes}
+        self.blocks = {}         # (container, blob) -> {block id: bytes} not yet committed
+        self.committed_blocks = {}  # (container, blob) -> [(block id, size)]
+        self.etags = {}
+        self.requests_served = 0
+        self.bytes_received = 0
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def connection_string(self):
+        return (f"DefaultEndpointsProtocol=http;AccountName={ACCOUNT};AccountKey={ACCOUNT_KEY};"
+                f"BlobEndpoint={self.url}/{ACCOUNT};")
+
+    def _headers(self, key=None, **extra):
+        headers = {"x-ms-request-id": str(uuid.uuid4()), "x-ms-version": "2021-08-06",
+                   "Date": formatdate(usegmt=True)}
+        if key is not None and key in self.etags:
+            headers["ETag"] = self.etags[key]
+            headers["Last-Modified"] = formatdate(usegmt=True)
+        headers.update({name: str(value) for name, value in extra.items()})
+        return headers
+
+    def _not_found(self, code):
+        return web.Response(status=404, headers=self._headers(**{"x-ms-error-code": code}))
+
+    async def _handle(self, request):
+        self.requests_served += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        container = request.match_info["container"]
+        blob = request.match_info.get("blob")
+        query = request.query
+
+        if blob is None:
+            if request.method == "PUT":
+                if container in self.containers:
+                    return web.Response(status=409, headers=self._headers(**{"x-ms-error-code": "ContainerAlreadyExists"}))
+                self.containers[container] = {}
+                return web.Response(status=201, headers=self._headers())
+            if container not in self.containers:
+                return self._not_found("ContainerNotFound")
+            return web.Response(status=200, headers=self._headers())
+
+        store = self.containers.setdefault(container, {})
+        key = (container, blob)
+        comp = query.get("comp")
+
+        if request.method == "PUT" and comp == "block":
+            body = await request.read()
+            self.bytes_received += len(body)
+            self.blocks.setdefault(key, {})[query["blockid"]] = body
+            return web.Response(status=201, headers=self._headers(**{"x-ms-request-server-encrypted": "false"}))
+
+        if request.method == "PUT" and comp == "blocklist":
+            root = ET.fromstring(await request.read())
+            staged = self.blocks.get(key, {})
+            previous = dict(self.committed_blocks.get(key, []))
+            committed_data = store.get(blob, b"")
+            offsets, offset = {}, 0
+            for block_id, size in self.committed_blocks.get(key, []):
+                offsets[block_id] = committed_data[offset:offset + size]
+                offset += size
+            parts, block_list = [], []
+            for element in root:
+                block_id = element.text
+                if element.tag in ("Latest", "Uncommitted") and block_id in staged:
+                    data = staged[block_id]
+                elif element.tag in ("Latest", "Committed") and block_id in previous:
+                    data = offsets[block_id]
+                else:
+                    return web.Response(status=400, headers=self._headers(**{"x-ms-error-code": "InvalidBlockList"}))
+                parts.append(data)
+                block_list.append((block_id, len(data)))
+            store[blob] = b"".join(parts)
+            self.committed_blocks[key] = block_list
+            self.blocks.pop(key, None)
+            self.etags[key] = '"' + uuid.uuid4().hex + '"'
+            return web.Response(status=201, headers=self._headers(key, **{"x-ms-request-server-encrypted": "false"}))
+
+        if request.method == "GET" and comp == "blocklist":
+            root = ET.Element("BlockList")
+            committed = ET.SubElement(root, "CommittedBlocks")
+            for block_id, size in self.committed_blocks.get(key, []):
+                block = ET.SubElement(committed, "Block")
+                ET.SubElement(block, "Name").text = block_id
+                ET.SubElement(block, "Size").text = str(size)
+            uncommitted = ET.SubElement(root, "UncommittedBlocks")
+            for block_id, data in self.blocks.get(key, {}).items():
+                block = ET.SubElement(uncommitted, "Block")
+                ET.SubElement(block, "Name").text = block_id
+                ET.SubElement(block, "Size").text = str(len(data))
+            if blob not in store and key not in self.blocks:
+                return self._not_found("BlobNotFound")
+            body = b'<?xml version="1.0" encoding="utf-8"?>' + ET.tostring(root)
+            return web.Response(status=200, body=body, content_type="application/xml", headers=self._headers(key))
+
+        if request.method == "PUT":
+            body = await request.read()
+            self.bytes_received += len(body)
+            store[blob] = body
+            self.committed_blocks[key] = [(base64.b64encode(b"0").decode(), len(body))]
+            self.blocks.pop(key, None)
+            self.etags[key] = '"' + uuid.uuid4().hex + '"'
+            md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+            return web.Response(status=201, headers=self._headers(key, **{"Content-MD5": md5, "x-ms-request-server-encrypted": "false"}))
+
+        if request.method in ("HEAD", "GET"):
+            if blob not in store:
+                return self._not_found("BlobNotFound")
+            data = store[blob]
+            headers = self._headers(key, **{"x-ms-blob-type": "BlockBlob", "Content-Length": len(data),
+                                            "Content-Type": "application/octet-stream"})
+            if request.method == "HEAD":
+                return web.Response(status=200, headers=headers)
+            byte_range = request.headers.get("x-ms-range") or request.headers.get("Range")
+            if byte_range and data:
+                start, _, end = byte_range.split("=")[1].partition("-")
+                start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+                headers["Content-Length"] = str(end - start + 1)
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                return web.Response(status=206, body=data[start:end + 1], headers=headers)
+            return web.Response(status=200, body=data, headers=headers)
+
+        if request.method == "DELETE":
+            if store.pop(blob, None) is None:
+                return self._not_found("BlobNotFound")
+            self.committed_blocks.pop(key, None)
+            self.blocks.pop(key, None)
+            return web.Response(status=202, headers=self._headers())
+
+        return web.Response(status=400, headers=self._headers(**{"x-ms-error-code": "UnsupportedOperation"}))
+
+    def blob_data(self, container, blob):
+        """Returns the committed content of a blob, or None."""
+        return self.containers.get(container, {}).get(blob)
+
+    def start(self):
+        """Starts the emulator on a free local port and returns its base URL."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            app = web.Application(client_max_size=1024 ** 3)
+            app.router.add_route("*", f"/{ACCOUNT}/{{container}}", self._handle)
+            app.router.add_route("*", f"/{ACCOUNT}/{{container}}/{{blob:.+}}", self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            self._loop.run_until_complete(site.start())
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}"
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        """Stops the emulator and joins its thread."""
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
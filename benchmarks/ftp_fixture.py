@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+""" Local FTP server serving synthetic FASTQ trees with the ENA '/vol1/fastq/ERRxxx/NNN/' layout.
+
+The server runs pyftpdlib in a background thread, counts the FTP commands it receives (to measure
+discovery round-trips) and can throttle the bandwidth of each data connection.
+"""
+
+# import libraries
+import logging
+import os
+import sys
+import tempfile
+import threading
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler, ThrottledDTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+from ena_ftp import ena_fastq_directory
+
+# a handler marks pyftpdlib logging as configured, so the server does not log every command to stderr
+logging.getLogger("pyftpdlib").addHandler(logging.NullHandler())
+logging.getLogger("pyftpdlib").setLevel(logging.WARNING)
+
+
+def make_fastq_tree(root, accessions, file_size=1024 * 1024, paired=True):
+    """
+    Writes synthetic gzip-named FASTQ files for the given accessions under `root`.
+
+    Args:
+        root (str): Local directory served as the FTP root.
+        accessions (list): Run accessions to create.
+        file_size (int, optional): Size in bytes of each file. Defaults to 1 MB.
+        paired (bool, optional): Create '_1' and '_2' files instead of a single one. Defaults to True.
+
+    Returns:
+        dict: Maps each accession to the FTP paths of its files.
+    """
+    # the repeated pattern is not a multiple of any block or segment size, so data written out of order is detected
+    block = os.urandom(min(file_size, 1024 * 1024 + 4099)) if file_size else b""
+    paths = {}
+    for accession in accessions:
+        directory = ena_fastq_directory(accession)
+        local_directory = os.path.join(root, directory.strip("/"))
+        os.makedirs(local_directory, exist_ok=True)
+        names = [f"{accession}_1.fastq.gz", f"{accession}_2.fastq.gz"] if paired else [f"{accession}.fastq.gz"]
+        for name in names:
+            with open(os.path.join(local_directory, name), "wb") as file:
+                remaining = file_size
+                while remaining > 0:
+                    file.write(block[:remaining])
+                    remaining -= len(block)
+        paths[accession] = [directory + name for name in names]
+    return paths
+
+
+class LocalFTPServer:
+    """
+    Anonymous read-only FTP server on a free local port.
+
+    Args:
+        root (str, optional): Directory to serve. A temporary directory is created if None.
+        bandwidth (int, optional): Bytes per second allowed on each data connection (None for unlimited).
+    """
+
+    def __init__(self, root=None, bandwidth=None):
+        self._tmp = None
+        if root is None:
+            self._tmp = tempfile.TemporaryDirectory()
+            root = self._tmp.name
+        self.root = root
+        self.bandwidth = bandwidth
+        self.commands = {}
+        self.host = "127.0.0.1"
+        self.port = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Starts the server and returns its port."""
+        commands = self.commands
+        lock = threading.Lock()
+
+        class CountingHandler(FTPHandler):
+            def pre_process_command(self, line, cmd, arg):
+                with lock:
+                    commands[cmd] = commands.get(cmd, 0) + 1
+                return super().pre_process_command(line, cmd, arg)
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_anonymous(self.root)
+        CountingHandler.authorizer = authorizer
+        CountingHandler.banner = "local ENA stand-in"
+        if self.bandwidth:
+            dtp_handler = type("Throttled", (ThrottledDTPHandler,), {"read_limit": self.bandwidth, "write_limit": self.bandwidth})
+            CountingHandler.dtp_handler = dtp_handler
+
+        self._server = ThreadedFTPServer((self.host, 0), CountingHandler)
+        self._server.max_cons = 256
+        self.port = self._server.socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"handle_exit": False}, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def reset_counters(self):
+        """Clears the command counters."""
+        self.commands.clear()
+
+    def total_commands(self):
+        """Number of FTP commands received since the last reset."""
+        return sum(self.commands.values())
+
+    def stop(self):
+        """Stops the server and removes the temporary directory, if any."""
+        self._server.close_all()
+        self._thread.join(timeout=5)
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
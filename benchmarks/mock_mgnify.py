@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+""" Local stand-in for the MGnify JSON:API used by the benchmarks.
+
+The server generates deterministic synthetic studies and analyses and serves them
+through paginated '/studies', '/analyses' and '/biomes' endpoints with the same
+'data' / 'meta.pagination' layout as https://www.ebi.ac.uk/metagenomics/api/v1.
+Rate limiting can be injected as '429 Too Many Requests' answers with a 'Retry-After' header.
+"""
+
+# import libraries
+import asyncio
+import collections
+import hashlib
+import json
+import threading
+from aiohttp import web
+
+EXPERIMENT_TYPES = ("metagenomic", "metatranscriptomic", "assembly")
+PIPELINE_VERSIONS = ("1.0", "2.0", "3.0", "4.0", "4.1", "5.0")
+
+
+def make_study(index):
+    """Builds one synthetic JSON:API study record."""
+    return {
+        "type": "studies",
+        "id": f"MGYS{index:08d}",
+        "attributes": {
+            "study-name": f"Synthetic study {index}",
+            "samples-count": 10 + index % 50,
+            "bioproject": f"PRJEB{10000 + index}",
+            "centre-name": f"CENTRE{index % 7}",
+            "last-update": f"2024-01-01T00:00:{index % 60:02d}",
+        },
+        "relationships": {"biomes": {"data": [{"type": "biomes", "id": "root:Engineered:Wastewater"}]}},
+    }
+
+
+def make_analysis(index, n_studies):
+    """Builds one synthetic JSON:API analysis record."""
+    experiment_type = EXPERIMENT_TYPES[index % len(EXPERIMENT_TYPES)]
+    run_key = "assembly" if experiment_type == "assembly" else "run"
+    run_id = f"ERZ{1000000 + index}" if experiment_type == "assembly" else f"ERR{1000000 + index // 2}"
+    return {
+        "type": "analysis-jobs",
+        "id": f"MGYA{index:08d}",
+        "attributes": {
+            "experiment-type": experiment_type,
+            "pipeline-version": PIPELINE_VERSIONS[index % len(PIPELINE_VERSIONS)],
+            "instrument-model": "Illumina HiSeq 2500",
+        },
+        "relationships": {
+            "study": {"data": {"type": "studies", "id": f"MGYS{index % n_studies:08d}"}},
+            "sample": {"data": {"type": "samples", "id": f"ERS{2000000 + index // 2}"}},
+            run_key: {"data": {"type": run_key + "s", "id": run_id}},
+        },
+    }
+
+
+class MockMGnifyServer:
+    """
+    Paginated MGnify API served from a background thread.
+
+    Args:
+        pages (int, optional): Number of pages of each listing. Defaults to 50.
+        page_size (int, optional): Records per page. Defaults to 25.
+        latency (float, optional): Seconds slept before answering each page. Defaults to 0.02.
+        throttle_every (int, optional): Answer every n-th request with a 429 (0 = never). Defaults to 0.
+        max_in_flight (int, optional): Answer with a 429 the requests above this many in flight. Defaults to None (no limit).
+        retry_after (float, optional): Seconds sent in the 'Retry-After' header of the 429 answers. Defaults to 1.
+    """
+
+    def __init__(self, pages=50, page_size=25, latency=0.02, throttle_every=0, max_in_flight=None, retry_after=1):
+        self.pages = pages
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.requests_by_listing = collections.Counter()  # 'studies', 'analyses' or 'biomes' -> pages served
+        self.requests_throttled = 0
+        self._received = 0
+        self._in_flight = 0
+        n_records = pages * page_size
+        self.records = {
+            "studies": [make_study(i) for i in range(n_records)],
+            "analyses": [make_analysis(i, n_records) for i in range(n_records)],
+            "biomes": [{"type": "biomes", "id": "root:Engineered:Wastewater"}],
+        }
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    async def _handle(self, request):
+        key = request.match_info["key"]
+        if key not in self.records:
+            raise web.HTTPNotFound()
+        self._received += 1
+        if (self.throttle_every and self._received % self.throttle_every == 0) or \
+                (self.max_in_flight is not None and self._in_flight >= self.max_in_flight):
+            self.requests_throttled += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": f"{self.retry_after:g}"})
+        self.requests_served += 1
+        self.requests_by_listing[key] += 1
+        page = int(request.query.get("page", 1))
+        if self.latency:
+            self._in_flight += 1
+            try:
+                await asyncio.sleep(self.latency)
+            finally:
+                self._in_flight -= 1
+        records = self.records[key]
+        experiment_type = request.query.get("experiment_type")
+        if key == "analyses" and experiment_type:
+            records = [item for item in records if item["attributes"]["experiment-type"] == experiment_type]
+        ordering = request.query.get("ordering")
+        if ordering == "-accession":
+            records = sorted(records, key=lambda item: item["id"], reverse=True)
+        elif ordering == "-last_update":
+            records = sorted(records, key=lambda item: (item["attributes"].get("last-update", ""), item["id"]), reverse=True)
+        total_pages = max(1, -(-len(records) // self.page_size))
+        start = (page - 1) * self.page_size
+        body = {
+            "data": records[start:start + self.page_size],
+            "meta": {"pagination": {"page": page, "pages": total_pages, "count": len(records)}},
+        }
+        text = json.dumps(body)
+        etag = '"' + hashlib.md5(text.encode("utf-8")).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=text, content_type="application/vnd.api+json", headers={"ETag": etag})
+
+    def start(self):
+        """Starts the server on a free local port and returns its base URL."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            app = web.Application()
+            app.router.add_get("/{key}", self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            self._loop.run_until_complete(site.start())
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}"
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        """Stops the server and joins its thread."""
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
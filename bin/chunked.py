@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+
+""" This python script contains the out-of-core processing of combined_dataframe.csv (row batches with compact dtypes).
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import collections
+import gc
+import os
+import numpy as np
+import pandas as pd
+from metrics import timed
+from summary_processing import feature_engineering
+
+DEFAULT_CHUNKSIZE = 200000
+
+# compact dtypes of the summary columns: the low-cardinality strings are categoricals, the identifiers stay strings
+SUMMARY_DTYPES = {
+    'analysis_id': 'object',
+    'experiment_type': 'category',
+    'pipeline_version': 'float64',   # float32 would turn 4.1 into 4.099999 and break the mapping to 'pipeline_mapped'
+    'instrument_platform': 'category',
+    'study_id': 'object',
+    'sample_id': 'object',
+    'assembly_run_id': 'object',
+    'study_name': 'object',
+    'n_samples': 'float32',          # missing for the analyses whose study was not returned
+    'bioproject': 'object',
+    'centre_name': 'category',
+    'biomes': 'category',
+}
+
+# the columns read and written by feature_engineering
+FEATURE_COLUMNS = ['study_id', 'sample_id', 'assembly_run_id', 'bioproject', 'pipeline_version']
+ENGINEERED_COLUMNS = ['pipeline_mapped', 'initials_run', 'concatenated_ids']
+
+
+def read_summary_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """
+    Reads a summary CSV file (e.g. combined_dataframe.csv) in row batches with the compact SUMMARY_DTYPES.
+    A Parquet file or store written by summary_store is read in batches of at most `chunksize` rows instead.
+
+    Args:
+        path (str): The CSV file to read, or a Parquet file, store directory or dataset (see summary_store.open_store).
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+        columns (list, optional): Only parse these columns (the others are skipped by the parser). Defaults to all.
+
+    Yields:
+        pd.DataFrame: The next batch of rows (each batch has its own categories).
+    """
+    if isinstance(path, str) and not path.endswith('.parquet') and not os.path.isdir(path):
+        with pd.read_csv(path, dtype=SUMMARY_DTYPES, chunksize=chunksize, usecols=columns) as reader:
+            yield from _collected(reader)
+    else:
+        # pyarrow is only imported for the Parquet summaries
+        from summary_store import iter_summary_batches
+        yield from _collected(iter_summary_batches(path, chunksize, columns))
+
+
+def _collected(chunks):
+    for chunk in chunks:
+        yield chunk
+        # the .str accessor leaves a reference cycle (frame -> cached column -> accessor -> column):
+        # without a collection every processed batch would stay in memory until the next full gc
+        del chunk
+        gc.collect()
+
+
+def hash_values(values):
+    """Returns the 64-bit hashes of a Series or of the rows of a DataFrame, used as compact keys."""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def insert_new_keys(keys, values, new_keys, new_values):
+    """
+    Inserts in the sorted array `keys` (and the parallel arrays `values`) the sorted unique `new_keys`
+    that are not there yet. Costs one copy of the arrays instead of a sort.
+
+    Returns:
+        tuple: The extended keys and the list of extended value arrays.
+    """
+    positions = np.searchsorted(keys, new_keys)
+    present = positions < len(keys)
+    present[present] = keys[positions[present]] == new_keys[present]
+    positions, new_keys = positions[~present], new_keys[~present]
+    values = [np.insert(array, positions, new[~present]) for array, new in zip(values, new_values)]
+    return np.insert(keys, positions, new_keys), values
+
+
+def add_counts(counter, series):
+    """Adds the value counts of a Series (categoricals included, missing values excluded) to a Counter."""
+    counts = series.value_counts(sort=False)
+    counter.update({value: int(count) for value, count in counts.items() if count})
+
+
+class DatasetStats:
+    """
+    Mergeable aggregates of the statistics printed by explore_dataset, built one batch of rows at a time.
+
+    Every statistic is kept in a form that can be summed across batches: counters of values, the missing
+    values per column, the (biome, n_samples) occurrences from which the medians are computed exactly,
+    and the sorted 64-bit hashes of the distinct (study_id, assembly_run_id) pairs. The memory depends
+    on the number of studies, biomes and distinct runs, not on the number or width of the rows.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.missing = None
+        self.studies = {}                               # study hash -> study_id
+        self.pairs = np.empty(0, dtype=np.uint64)       # sorted hashes of the distinct (study_id, assembly_run_id)
+        self.pair_studies = np.empty(0, dtype=np.uint64)
+        self.samples = collections.Counter()            # (biome, n_samples) -> rows
+        self.experiment_type_counts = collections.Counter()
+        self.biomes_counts = collections.Counter()
+
+    def update(self, chunk):
+        """Adds a batch of rows to the statistics and returns self."""
+        self.rows += len(chunk)
+        missing = chunk.isnull().sum()
+        self.missing = missing if self.missing is None else self.missing.add(missing, fill_value=0).astype('int64')
+
+        studies = chunk['study_id'].dropna()
+        study_hashes, positions = np.unique(hash_values(studies), return_index=True)
+        for study_hash, study_id in zip(study_hashes.tolist(), studies.to_numpy()[positions]):
+            self.studies.setdefault(study_hash, study_id)
+
+        # nunique per study ignores the missing runs
+        runs = chunk.loc[chunk['study_id'].notna() & chunk['assembly_run_id'].notna(), ['study_id', 'assembly_run_id']]
+        pairs, first = np.unique(hash_values(runs), return_index=True)
+        self.pairs, (self.pair_studies,) = insert_new_keys(self.pairs, [self.pair_studies],
+                                                           pairs, [hash_values(runs['study_id'])[first]])
+
+        samples = chunk.loc[chunk['biomes'].notna() & chunk['n_samples'].notna(), ['biomes', 'n_samples']]
+        sizes = samples.groupby(['biomes', 'n_samples'], observed=True).size()
+        self.samples.update({(biome, float(n_samples)): int(count) for (biome, n_samples), count in sizes.items()})
+        add_counts(self.experiment_type_counts, chunk['experiment_type'])
+        add_counts(self.biomes_counts, chunk['biomes'])
+        return self
+
+    def merge(self, other):
+        """Adds the statistics of another DatasetStats (e.g. of another file or process) and returns self."""
+        self.rows += other.rows
+        if other.missing is not None:
+            self.missing = other.missing if self.missing is None else self.missing.add(other.missing, fill_value=0).astype('int64')
+        for study_hash, study_id in other.studies.items():
+            self.studies.setdefault(study_hash, study_id)
+        self.pairs, (self.pair_studies,) = insert_new_keys(self.pairs, [self.pair_studies], other.pairs, [other.pair_studies])
+        self.samples.update(other.samples)
+        self.experiment_type_counts.update(other.experiment_type_counts)
+        self.biomes_counts.update(other.biomes_counts)
+        return self
+
+    def runs_per_study(self):
+        """Returns the number of distinct assembly_run_id of each study_id, as groupby('study_id').nunique() does."""
+        study_hashes, counts = np.unique(self.pair_studies, return_counts=True)
+        runs = dict(zip(study_hashes.tolist(), counts.tolist()))
+        series = pd.Series({study_id: runs.get(study_hash, 0) for study_hash, study_id in self.studies.items()},
+                           name='assembly_run_id', dtype='int64').sort_index()
+        return series.rename_axis('study_id')
+
+    def median_samples_per_biome(self):
+        """Returns the median 'n_samples' of the rows of each biome, computed exactly from the value occurrences."""
+        values = collections.defaultdict(list)
+        for (biome, n_samples), count in self.samples.items():
+            values[biome].append((n_samples, count))
+        medians = {}
+        for biome in self.biomes_counts:
+            occurrences = sorted(values.get(biome, []))
+            total = sum(count for _, count in occurrences)
+            if not total:
+                medians[biome] = np.nan
+                continue
+            # the two middle ranks are the same value when the total is odd
+            middle = [(total - 1) // 2, total // 2]
+            found, seen = [], 0
+            for value, count in occurrences:
+                while middle and middle[0] < seen + count:
+                    found.append(value)
+                    middle.pop(0)
+                seen += count
+            medians[biome] = (found[0] + found[1]) / 2
+        frame = pd.DataFrame({'biomes': list(medians), 'n_samples': list(medians.values())})
+        return frame.sort_values('biomes', ignore_index=True)
+
+    def report(self):
+        """Prints the statistics in the same layout as explore_dataset."""
+        print("\nTotal number of unique studies")
+        print(len(self.studies))
+        print('\033[92m' + "-" * 25 + '\033[0m')
+
+        print("\nNumber of unique assembly_run_id per study_id")
+        print(self.runs_per_study())
+        print('\033[92m' + "-" * 25 + '\033[0m')
+
+        # missing data
+        print("\nMissing values per variable")
+        print(self.missing)
+        any_missing_data = self.missing is not None and bool(self.missing.any())
+        print(f"Are there any missing data in the dataframe? {'yes' if any_missing_data else 'no'}")
+        print('\033[92m' + "-" * 25 + '\033[0m')
+
+        print("\nNumber of samples per biome (median)")
+        print(self.median_samples_per_biome())
+        print('\033[92m' + "-" * 25 + '\033[0m')
+
+        print('\033[92m' + "-" * 25 + '\033[0m')
+        print("\nDistribuzione di experiment_type:")
+        print(counts_series(self.experiment_type_counts, 'experiment_type'))
+
+        print("\nDistribuzione di biomes:")
+        print(counts_series(self.biomes_counts, 'biomes'))
+        print('\033[92m' + "-" * 25 + '\033[0m')
+
+
+def counts_series(counter, name):
+    """Returns a Counter as the Series value_counts would return (highest count first)."""
+    series = pd.Series(dict(counter), name='count', dtype='int64').rename_axis(name)
+    return series.sort_values(ascending=False, kind='stable')
+
+
+class BestPipelineTable:
+    """
+    Per-key table of the best row for the deduplication: for every distinct 'concatenated_ids' it keeps the
+    key itself, the highest 'pipeline_mapped', the row number holding it (the earliest on ties) and the number
+    of rows with that key.
+
+    The four columns are numpy arrays sorted by key (the keys as fixed-width UTF-8 bytes, about 60 bytes per
+    distinct key in total), updated one batch at a time with a binary search and a single copy, so the memory
+    depends on the number of distinct keys only. The keys are compared exactly, so two identifiers are never
+    merged. Two tables built on different batches can be merged.
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype='S1')
+        self.pipeline = np.empty(0, dtype=np.int8)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def duplicates(self):
+        """Number of keys found on more than one row."""
+        return int((self.counts > 1).sum())
+
+    def update(self, chunk, first_row):
+        """
+        Adds a batch of rows already passed through feature_engineering.
+
+        Args:
+            chunk (pd.DataFrame): The batch, with the 'concatenated_ids' and 'pipeline_mapped' columns.
+            first_row (int): Position of the first row of the batch in the whole file.
+
+        Returns:
+            BestPipelineTable: self.
+        """
+        valid = chunk['concatenated_ids'].notna().to_numpy()
+        keys = chunk['concatenated_ids'][valid].astype(str).str.encode('utf-8').to_numpy(dtype=bytes)
+        # rows without a pipeline lose against any mapped version (na_position='last' in removing_duplicates)
+        pipeline = chunk['pipeline_mapped'][valid].fillna(-1).to_numpy(dtype=np.int8)
+        rows = first_row + np.flatnonzero(valid)
+        return self._add(*self._reduce(keys, pipeline, rows, np.ones(len(keys), dtype=np.int32)))
+
+    def merge(self, other):
+        """Adds the keys of another table and returns self."""
+        return self._add(other.keys, other.pipeline, other.rows, other.counts)
+
+    @staticmethod
+    def _reduce(keys, pipeline, rows, counts):
+        """Keeps the best row of each key of a batch: highest pipeline first, then the earliest row."""
+        if not len(keys):
+            return keys, pipeline, rows, counts
+        order = np.lexsort((rows, -pipeline.astype(np.int16), keys))
+        keys, pipeline, rows, counts = keys[order], pipeline[order], rows[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        return keys[starts], pipeline[starts], rows[starts], np.add.reduceat(counts, starts).astype(np.int32)
+
+    def _add(self, keys, pipeline, rows, counts):
+        # both sides get the width of the longest key, so that no key is truncated by the search or the insert
+        width = np.dtype(f'S{max(self.keys.dtype.itemsize, keys.dtype.itemsize)}')
+        self.keys, keys = self.keys.astype(width, copy=False), keys.astype(width, copy=False)
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+
+        existing = positions[found]
+        self.counts[existing] += counts[found]
+        better = (pipeline[found] > self.pipeline[existing]) | \
+                 ((pipeline[found] == self.pipeline[existing]) & (rows[found] < self.rows[existing]))
+        self.pipeline[existing[better]] = pipeline[found][better]
+        self.rows[existing[better]] = rows[found][better]
+
+        new, positions = ~found, positions[~found]
+        self.keys = np.insert(self.keys, positions, keys[new])
+        self.pipeline = np.insert(self.pipeline, positions, pipeline[new])
+        self.rows = np.insert(self.rows, positions, rows[new])
+        self.counts = np.insert(self.counts, positions, counts[new])
+        return self
+
+    def kept_rows(self):
+        """Returns the sorted row numbers kept by the deduplication."""
+        return np.sort(self.rows)
+
+
+@timed()
+def scan_combined_dataframe(path, chunksize=DEFAULT_CHUNKSIZE, explore=True):
+    """
+    First pass over combined_dataframe.csv: collects the explore_dataset statistics and the best row of each key.
+
+    Args:
+        path (str): The combined CSV file.
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+        explore (bool, optional): Also collect the DatasetStats. Defaults to True.
+
+    Returns:
+        tuple: (DatasetStats or None, BestPipelineTable)
+    """
+    stats = DatasetStats() if explore else None
+    table = BestPipelineTable()
+    first_row = 0
+    for chunk in read_summary_chunks(path, chunksize, columns=None if explore else FEATURE_COLUMNS):
+        if stats is not None:
+            stats.update(chunk)
+        table.update(feature_engineering(chunk), first_row)
+        first_row += len(chunk)
+    return stats, table
+
+
+def iter_deduplicated_chunks(path, table, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """
+    Second pass over combined_dataframe.csv: yields, batch by batch, the rows chosen by the BestPipelineTable
+    with the engineered columns added (the rows of removing_duplicates(feature_engineering(...)), in the same order).
+
+    Args:
+        path (str): The combined CSV file scanned to build the table.
+        table (BestPipelineTable): The best row of each key.
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+        columns (list, optional): Columns parsed (FEATURE_COLUMNS must be included). Defaults to None (all).
+
+    Yields:
+        pd.DataFrame: The deduplicated rows of each batch (possibly empty).
+    """
+    kept = table.kept_rows()
+    first_row = 0
+    for chunk in read_summary_chunks(path, chunksize, columns=columns):
+        start, stop = np.searchsorted(kept, [first_row, first_row + len(chunk)])
+        rows = feature_engineering(chunk.iloc[kept[start:stop] - first_row].copy())
+        first_row += len(chunk)
+        yield rows
+
+
+@timed()
+def save_deduplicated_rows(path, table, deduplicated_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Writes the rows chosen by the BestPipelineTable to a CSV or Parquet file, batch by batch.
+
+    Args:
+        path (str): The combined CSV file or the summary store scanned to build the table.
+        table (BestPipelineTable): The best row of each key.
+        deduplicated_path (str): The file written, in Parquet if its name ends with '.parquet'.
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+
+    Returns:
+        pd.Series: The value counts of 'initials_run' among the deduplicated rows.
+    """
+    initials = collections.Counter()
+    header = True
+    writer = None
+    for rows in iter_deduplicated_chunks(path, table, chunksize):
+        add_counts(initials, rows['initials_run'])
+        if deduplicated_path.endswith('.parquet'):
+            if writer is None:
+                from summary_store import SummaryWriter
+                writer = SummaryWriter(deduplicated_path, list(rows.columns))
+            writer.write(rows)
+        elif header or len(rows):
+            rows.to_csv(deduplicated_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+    if writer is not None:
+        writer.close()
+    print(f"Deduplicated dataset saved to {deduplicated_path}")
+    return counts_series(initials, 'initials_run')
+
+
+@timed()
+def save_filtered_ids_chunked(path, output_column, filter_column, filter_value, output_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Out-of-core counterpart of save_filtered_ids_to_file on a CSV file which already holds the engineered
+    columns (e.g. the deduplicated dataset): only the two columns are parsed, batch by batch.
+
+    Args:
+        path (str): The CSV file (e.g. '../outputs/deduplicated_dataframe.csv').
+        output_column (str): The column whose values are saved.
+        filter_column (str): The column the filter applies to (e.g. 'initials_run').
+        filter_value (str): The value rows must have in filter_column.
+        output_path (str): Directory of 'assembly_run_ids.txt'.
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+
+    Returns:
+        int: The number of saved values.
+    """
+    saved = 0
+    with open(os.path.join(output_path, 'assembly_run_ids.txt'), 'w') as file:
+        for chunk in read_summary_chunks(path, chunksize, columns=list(dict.fromkeys([output_column, filter_column]))):
+            values = chunk.loc[chunk[filter_column] == filter_value, output_column]
+            file.writelines(f"{value}\n" for value in values.tolist())
+            saved += len(values)
+    print(f"Saved {saved} {output_column} to {output_path}")
+    return saved
+
+
+@timed()
+def save_deduplicated_ids(path, table, output_column, filter_column, filter_value, output_path,
+                          chunksize=DEFAULT_CHUNKSIZE, deduplicated_path=None):
+    """
+    Second pass over combined_dataframe.csv: keeps the rows chosen by the BestPipelineTable and appends the
+    filtered IDs to 'assembly_run_ids.txt' batch by batch. The file holds the same lines, in the same order,
+    as removing_duplicates followed by save_filtered_ids_to_file on the whole dataframe.
+
+    Args:
+        path (str): The combined CSV file scanned to build the table.
+        table (BestPipelineTable): The best row of each key.
+        output_column (str): The column whose values are saved.
+        filter_column (str): The column the filter applies to (e.g. 'initials_run').
+        filter_value (str): The value rows must have in filter_column.
+        output_path (str): Directory of 'assembly_run_ids.txt'.
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+        deduplicated_path (str, optional): If given, the deduplicated rows are also written to this CSV file.
+
+    Returns:
+        pd.Series: The value counts of 'initials_run' among the deduplicated rows.
+    """
+    initials = collections.Counter()
+    saved = 0
+    header = True
+    # without the deduplicated file, only the columns needed for the IDs are parsed
+    columns = None
+    if deduplicated_path is None:
+        columns = FEATURE_COLUMNS + [column for column in (output_column, filter_column)
+                                     if column not in FEATURE_COLUMNS + ENGINEERED_COLUMNS]
+    with open(os.path.join(output_path, 'assembly_run_ids.txt'), 'w') as file:
+        for rows in iter_deduplicated_chunks(path, table, chunksize, columns=columns):
+            add_counts(initials, rows['initials_run'])
+            values = rows.loc[rows[filter_column] == filter_value, output_column]
+            file.writelines(f"{value}\n" for value in values.tolist())
+            file.flush()
+            saved += len(values)
+            if deduplicated_path is not None and (header or len(rows)):
+                rows.to_csv(deduplicated_path, mode='w' if header else 'a', header=header, index=False)
+                header = False
+
+    print(f"Saved {saved} {output_column} to {output_path}")
+    return counts_series(initials, 'initials_run')
+
+
+def process_combined_dataframe_chunked(path, output_column='assembly_run_id', filter_column='initials_run', filter_value='ERR',
+                                       output_path='.', chunksize=DEFAULT_CHUNKSIZE, explore=True, deduplicated_path=None):
+    """
+    Out-of-core counterpart of explore_dataset, feature_engineering, removing_duplicates and save_filtered_ids_to_file.
+
+    The CSV file is read twice in batches of `chunksize` rows with compact dtypes (categoricals for
+    'experiment_type', 'biomes', 'instrument_platform' and 'centre_name'). The first pass collects
+    the statistics and the per-key best 'pipeline_mapped' table. The second pass writes the IDs
+    incrementally. Only one batch, the aggregates and the per-key table (about 60 bytes per
+    distinct key with its exact key, see BestPipelineTable) are held in memory.
+
+    Args:
+        path (str): The combined CSV file (e.g. '../outputs/combined_dataframe.csv').
+        output_column (str, optional): The column whose values are saved. Defaults to 'assembly_run_id'.
+        filter_column (str, optional): The column the filter applies to. Defaults to 'initials_run'.
+        filter_value (str, optional): The value rows must have in filter_column. Defaults to 'ERR'.
+        output_path (str, optional): Directory of 'assembly_run_ids.txt'. Defaults to '.'.
+        chunksize (int, optional): Rows per batch. Defaults to 200000.
+        explore (bool, optional): Print the explore_dataset statistics. Defaults to True.
+        deduplicated_path (str, optional): If given, the deduplicated rows are also written to this CSV file.
+
+    Returns:
+        pd.Series: The value counts of 'initials_run' among the deduplicated rows.
+    """
+    stats, table = scan_combined_dataframe(path, chunksize, explore=explore)
+    if stats is not None:
+        stats.report()
+    print(f"Number of duplicates in the dataset: {table.duplicates}")
+    return save_deduplicated_ids(path, table, output_column, filter_column, filter_value, output_path,
+                                 chunksize=chunksize, deduplicated_path=deduplicated_path)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+""" This python script contains the functions used to locate FASTQ files on the ENA FTP server.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import json
+import posixpath
+import sqlite3
+import time
+from ftplib import FTP, error_perm
+import metrics
+
+ENA_FTP_SERVER = 'ftp.sra.ebi.ac.uk'
+ENA_FASTQ_ROOT = '/vol1/fastq'
+
+
+def ena_fastq_directory(accession, root=ENA_FASTQ_ROOT):
+    """
+    Computes the ENA FTP directory of a run accession from its digits.
+
+    ENA groups runs by the first three letters and three digits of the accession ('ERR123').
+    Accessions with more than six digits are further placed in a subfolder made of the extra
+    digits zero-padded to three characters: ERR1234567 -> 007, ERR12345678 -> 067, ERR123456789 -> 789.
+
+    Args:
+        accession (str): A run accession such as 'ERR977403'.
+        root (str, optional): The FASTQ root of the server. Defaults to '/vol1/fastq'.
+
+    Returns:
+        str: The directory expected to contain the FASTQ files, with a trailing slash.
+    """
+    prefix = accession[:6]
+    extra_digits = accession[9:]
+    if extra_digits:
+        return f"{root}/{prefix}/{int(extra_digits):03d}/{accession}/"
+    return f"{root}/{prefix}/{accession}/"
+
+
+def ftp_connect(server_address, timeout=60):
+    """
+    Opens an anonymous FTP session.
+
+    Args:
+        server_address (str): The server host, optionally followed by ':port' (e.g. a local mirror 'localhost:2121').
+        timeout (float, optional): Socket timeout in seconds. Defaults to 60.
+
+    Returns:
+        ftplib.FTP: A logged in FTP connection.
+    """
+    host, _, port = server_address.partition(':')
+    ftp = FTP(timeout=timeout)
+    ftp.connect(host, int(port) if port else 21)
+    ftp.login()  # Non sono richieste credenziali per questo server
+    return ftp
+
+
+def list_files(ftp, directory):
+    """
+    Lists the file names of a FTP directory.
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection.
+        directory (str): The directory to list.
+
+    Returns:
+        list: The base names of the entries, empty if the directory does not exist.
+    """
+    try:
+        return [posixpath.basename(name.rstrip('/')) for name in ftp.nlst(directory)]
+    except error_perm:
+        return []
+
+
+class AccessionIndex:
+    """
+    Persistent SQLite index of the FTP directory and file names already resolved for each accession,
+    so that repeated or batched runs do not repeat the FTP discovery.
+
+    Args:
+        path (str): Path of the SQLite database. It is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fastq_paths ("
+            " accession TEXT PRIMARY KEY, directory TEXT, files TEXT, resolved_at REAL)"
+        )
+        self._db.commit()
+
+    def get(self, accession):
+        """Returns (directory, files) for an indexed accession, or None."""
+        row = self._db.execute("SELECT directory, files FROM fastq_paths WHERE accession = ?", (accession,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, accession, directory, files):
+        """Stores the resolved directory and file names of an accession."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO fastq_paths (accession, directory, files, resolved_at) VALUES (?, ?, ?, ?)",
+            (accession, directory, json.dumps(files), time.time()),
+        )
+        self._db.commit()
+
+    def forget(self, accession):
+        """Drops an accession, e.g. when its indexed files disappeared from the server."""
+        self._db.execute("DELETE FROM fastq_paths WHERE accession = ?", (accession,))
+        self._db.commit()
+
+    def close(self):
+        """Closes the SQLite database."""
+        self._db.close()
+
+
+def resolve_fastq_files(ftp, accession, index=None, root=ENA_FASTQ_ROOT):
+    """
+    Finds the FTP directory and the FASTQ file names of an accession.
+
+    The index is checked first. Otherwise the directory computed by ena_fastq_directory is listed, which is a
+    single FTP round-trip. Only if that fails, the accession group directory ('/vol1/fastq/ERR123/') is listed
+    once and the accession is looked up in it and in the NNN subfolders that actually exist.
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection.
+        accession (str): The run accession.
+        index (AccessionIndex, optional): Persistent index read before, and updated after, the FTP discovery.
+        root (str, optional): The FASTQ root of the server. Defaults to '/vol1/fastq'.
+
+    Returns:
+        tuple: (directory, list of file names), or (None, []) if the accession was not found.
+    """
+    with metrics.timer("ftp.resolve", accession=accession) as labels:
+        if index is not None:
+            cached = index.get(accession)
+            if cached:
+                labels["source"] = "index"
+                return cached
+
+        labels["source"] = "listing"
+        directory = ena_fastq_directory(accession, root)
+        files = list_files(ftp, directory)
+
+        if not files:
+            labels["source"] = "fallback"
+            base_path = f"{root}/{accession[:6]}/"
+            entries = list_files(ftp, base_path)
+            candidates = [f"{base_path}{accession}/"] if accession in entries else []
+            candidates += [f"{base_path}{entry}/{accession}/" for entry in sorted(entries)
+                           if len(entry) == 3 and entry.isdigit()]
+            for candidate in candidates:
+                if candidate == directory:
+                    continue
+                files = list_files(ftp, candidate)
+                if files:
+                    directory = candidate
+                    break
+
+        if not files:
+            return None, []
+
+        if index is not None:
+            index.put(accession, directory, files)
+        return directory, files
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+""" This python script contains the persistent on-disk cache used for the MGnify API responses.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nf-retrieve_info_mgnify", "http")
+DEFAULT_TTL = 24 * 60 * 60           # one day
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3     # 2 GB of compressed bodies
+
+
+def cache_key(url, params=None):
+    """
+    Builds the cache key of a request from its URL and query parameters.
+
+    Args:
+        url (str): The requested URL.
+        params (dict, optional): The query parameters. Their order does not change the key.
+
+    Returns:
+        str: The hexadecimal sha256 digest identifying the request.
+    """
+    items = sorted((str(key), str(value)) for key, value in (params or {}).items())
+    return hashlib.sha256(json.dumps([url, items]).encode("utf-8")).hexdigest()
+
+
+class CacheEntry:
+    """A cached response: compressed body on disk plus its validators and timestamps."""
+
+    def __init__(self, key, path, etag, last_modified, stored_at):
+        self.key = key
+        self.path = path
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def read(self):
+        """Returns the decompressed body."""
+        with open(self.path, "rb") as file:
+            return zlib.decompress(file.read())
+
+    def has_validators(self):
+        """True if the server gave an ETag or a Last-Modified header for this response."""
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        """Headers used to revalidate the entry with a conditional GET."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """
+    Persistent cache of HTTP response bodies keyed by URL and query parameters.
+
+    Bodies are stored zlib-compressed, one file per response, and indexed in a SQLite database.
+    An entry younger than `ttl` seconds is served without any network request. Once expired it is
+    revalidated with If-None-Match / If-Modified-Since when the server sent validators, and fetched
+    again otherwise. When the compressed bodies exceed `max_size` bytes the least recently used
+    entries are evicted.
+
+    Args:
+        cache_dir (str, optional): Directory holding the index and the bodies. Defaults to ~/.cache/nf-retrieve_info_mgnify/http.
+        ttl (float, optional): Freshness lifetime in seconds. Defaults to one day.
+        max_size (int, optional): Upper bound in bytes for the stored bodies. Defaults to 2 GB.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0, "evicted": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT,"
+            " stored_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self._db.commit()
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".z")
+
+    def lookup(self, url, params=None):
+        """
+        Looks up a request in the cache.
+
+        Args:
+            url (str): The requested URL.
+            params (dict, optional): The query parameters.
+
+        Returns:
+            CacheEntry or None: The stored entry, or None if the request was never cached.
+        """
+        key = cache_key(url, params)
+        row = self._db.execute(
+            "SELECT etag, last_modified, stored_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or not os.path.exists(self._body_path(key)):
+            return None
+        return CacheEntry(key, self._body_path(key), row[0], row[1], row[2])
+
+    def is_fresh(self, entry):
+        """True if the entry can be served without contacting the server."""
+        return entry is not None and time.time() - entry.stored_at < self.ttl
+
+    def hit(self, entry):
+        """Records a cache hit and returns the body of the entry."""
+        self.stats["hits"] += 1
+        self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), entry.key))
+        self._db.commit()
+        return entry.read()
+
+    def revalidated(self, entry):
+        """Records a 304 Not Modified answer: the entry is fresh again and its body is returned."""
+        self.stats["revalidated"] += 1
+        now = time.time()
+        self._db.execute("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, entry.key))
+        self._db.commit()
+        return entry.read()
+
+    def store(self, url, params, body, headers=None):
+        """
+        Stores a response body fetched from the network (counted as a miss).
+
+        Args:
+            url (str): The requested URL.
+            params (dict): The query parameters.
+            body (bytes): The raw response body.
+            headers (Mapping, optional): Response headers, used to keep the ETag and Last-Modified validators.
+        """
+        self.stats["misses"] += 1
+        headers = headers or {}
+        key = cache_key(url, params)
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        compressed = zlib.compress(body, 6)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(compressed)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (key, url, etag, last_modified, stored_at, accessed_at, size)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, url, headers.get("ETag"), headers.get("Last-Modified"), now, now, len(compressed)),
+        )
+        self._db.commit()
+        self.stats["stored"] += 1
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the stored bodies fit in max_size."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.stats["evicted"] += 1
+        self._db.commit()
+
+    def report(self):
+        """Prints the hit/miss counters of the current run."""
+        lookups = self.stats["hits"] + self.stats["revalidated"] + self.stats["misses"]
+        ratio = (self.stats["hits"] + self.stats["revalidated"]) / lookups if lookups else 0.0
+        print(f"HTTP cache: {self.stats['hits']} hits, {self.stats['revalidated']} revalidated, "
+              f"{self.stats['misses']} misses, {self.stats['evicted']} evicted (hit ratio {ratio:.1%})")
+
+    def close(self):
+        """Closes the SQLite index."""
+        self._db.close()
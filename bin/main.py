@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 
 """ This python script downloads fastq file given a biome related to MGnify.
- __  __ 
-|  \/  | 
-| \  / | ___  _ __   __ _ 
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
 | |\/| |/ _ \| '_ \ / _` |
 | |  | | (_) | | | | (_| |
 |_|  |_|\___/|_| |_|\__,_|
@@ -15,84 +15,297 @@ __date__ = 02 Feb 2024
 __maintainer__ = Marco Reverenna
 __email__ = marcor@dtu.dk
 __status__ = Dev
+
+Each step of the pipeline is a command, and each command imports only the modules it needs
+(e.g. 'biomes' does not load pandas, only 'transfer' loads the Azure SDK):
+    main.py biomes                                               # STEP 1: mgnify_biomes_list.txt
+    main.py summarize --biomes root:Engineered:Wastewater        # STEP 2: summaries/ (Parquet, one partition per biome and experiment type)
+    main.py dedup --explore                                      # STEPS 3-5: deduplicated.parquet
+    main.py extract-ids --filter_value ERR                       # STEP 6: assembly_run_ids.txt
+    main.py transfer --accession_file ../outputs/assembly_run_ids.txt --credentials ../credentials.json
+Add --csv to 'summarize' and 'dedup' to also write combined_dataframe.csv and deduplicated_dataframe.csv, and
+--chunksize to 'dedup' to process the summaries in row batches with bounded memory (CSV inputs are still accepted).
+main.nf runs the same commands, scattering 'summarize': once per biome with --studies_only, then once per biome
+and experiment type with --studies, so that the studies of a biome are fetched only once.
 """
 
 # import libraries
-from utils import *
-import requests
-import os
-import pandas as pd
-#import matplotlib.pyplot as plt
-#import seaborn as sns
+import argparse
 import json
-from ftplib import FTP
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+import os
+import sys
+import metrics
+
+OUTPUT_PATH = '../outputs'  # default directory of the inputs and outputs of every command
+
+
+def open_cache(args):
+    """Returns the on-disk cache of the MGnify API responses, None if disabled with an empty --cache_dir."""
+    from http_cache import HTTPCache
+    cache_dir = os.path.join(args.output_dir, '.http_cache') if args.cache_dir is None else args.cache_dir
+    return HTTPCache(cache_dir=cache_dir, ttl=args.cache_ttl) if cache_dir else None
+
+
+def run_biomes(args):
+    """STEP 1: saves the list of MGnify biomes as 'mgnify_biomes_list.txt'."""
+    from mgnify_api import fetch_biomes_and_save
+    cache = open_cache(args)
+    try:
+        fetch_biomes_and_save(output_dir=args.output_dir, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def run_summarize(args):
+    """STEP 2: saves the summary of every biome and experiment type and 'combined_dataframe.csv'."""
+    import request_controller
+    from mgnify_api import DEFAULT_CONCURRENCY, IncompleteListingError, biome_slug
+    from streaming import append_csv, stream_biome_summaries
+    from summary_store import STORE_NAME, write_summary, write_summary_csv
+    from utils import get_studies_and_analyses_summaries
+
+    if args.streaming and (args.studies or args.studies_only):
+        print("--studies and --studies_only are not supported with --streaming", file=sys.stderr)
+        return 2
+    studies = {}
+    if args.studies:
+        # the scattered tasks of main.nf fetch the studies of a biome once and pass them to every experiment type
+        if len(args.studies) != len(args.biomes):
+            print("--studies needs one file per biome, in the order of --biomes", file=sys.stderr)
+            return 2
+        for biome, path in zip(args.biomes, args.studies):
+            with open(path) as file:
+                studies[biome] = json.load(file)
+
+    request_controller.configure(initial_concurrency=min(args.concurrency, DEFAULT_CONCURRENCY), max_concurrency=args.concurrency,
+                                 max_retries=args.max_retries)
+    cache = open_cache(args)
+    state_store = None
+    if not args.streaming and not args.full_listing:
+        # sync studies and analyses into a local state store instead of downloading the whole listings
+        from state_store import StateStore
+        state_store = StateStore(args.state_store or os.path.join(args.output_dir, 'mgnify_state.sqlite'))
+
+    store_path = os.path.join(args.output_dir, STORE_NAME)
+    combined_path = os.path.join(args.output_dir, 'combined_dataframe.csv')
+    try:
+        if args.streaming:
+            # one page at a time (NDJSON + CSV batches): flat memory even on very large lineages
+            if args.csv and os.path.exists(combined_path):
+                os.remove(combined_path)
+            for biome in args.biomes:
+                # the studies of each biome are streamed once and shared by its experiment types
+                summary_paths = stream_biome_summaries(biome_name=biome, experiment_types=args.experiment_types,
+                                                       output_dir=args.output_dir, concurrency=args.concurrency, cache=cache)
+                for exp, summary_path in summary_paths.items():
+                    write_summary_csv(summary_path, store_path, biome, exp)
+                    if args.csv:
+                        append_csv(summary_path, combined_path)
+        else:
+            # one batch for every biome and experiment type: the studies of a biome are downloaded only once
+            df_summary_dict, combined_df = get_studies_and_analyses_summaries(biome_names=args.biomes,
+                                                                              experiment_types=[] if args.studies_only else args.experiment_types,
+                                                                              output_dir=args.output_dir,
+                                                                              concurrency=args.concurrency,
+                                                                              cache=cache,
+                                                                              state_store=state_store,
+                                                                              studies=studies)
+            if args.studies_only:
+                return
+            # each summary is written once to its own partition, nothing is rewritten when a summary is added
+            for (biome, exp), df_summary in df_summary_dict.items():
+                write_summary(df_summary, store_path, biome, exp)
+                if args.csv:
+                    df_summary.to_csv(os.path.join(args.output_dir, f"{biome_slug(biome)}_{exp}_summary.csv"), index=False)
+            if args.csv:
+                combined_df.to_csv(combined_path, index=False)
+        print(f"Summaries saved to {store_path}")
+    except IncompleteListingError as err:
+        print(f"Incomplete listing: {err}", file=sys.stderr)
+        return 1
+    finally:
+        if cache is not None:
+            cache.report()
+            cache.close()
+        if state_store is not None:
+            state_store.close()
+        request_controller.report()
+
+
+def run_dedup(args):
+    """STEPS 3-5: explores the summaries, removes the duplicated analyses and saves 'deduplicated.parquet'."""
+    from summary_store import STORE_NAME, SummaryWriter, export_csv, open_store
+    input_path = args.input or os.path.join(args.output_dir, STORE_NAME)
+    deduplicated_path = os.path.join(args.output_dir, 'deduplicated.parquet')
+    if input_path.endswith('.csv'):
+        source = input_path
+    else:
+        # only the files of the selected biomes and experiment types are read
+        source = open_store(input_path, args.biomes, args.experiment_types)
+
+    if args.chunksize:
+        # two batched passes over the input: statistics and best pipeline per key, then the kept rows are written
+        from chunked import save_deduplicated_rows, scan_combined_dataframe
+        stats, table = scan_combined_dataframe(source, args.chunksize, explore=args.explore)
+        if stats is not None:
+            stats.report()
+        print(f"Number of duplicates in the dataset: {table.duplicates}")
+        print(save_deduplicated_rows(source, table, deduplicated_path, chunksize=args.chunksize))
+    else:
+        import pandas as pd
+        from summary_store import store_columns
+        from summary_processing import explore_dataset, feature_engineering, removing_duplicates
+        if input_path.endswith('.csv'):
+            combined_df = pd.read_csv(input_path)
+        else:
+            combined_df = source.to_table(columns=store_columns(source)).to_pandas()
+        if args.explore:
+            print(combined_df.dtypes)
+            explore_dataset(combined_df)
+
+        combined_df_updated = feature_engineering(combined_df)
+        new_dataframe = removing_duplicates(combined_df_updated)
+        with SummaryWriter(deduplicated_path, list(new_dataframe.columns)) as writer:
+            writer.write(new_dataframe)
+        print(f"Deduplicated dataset saved to {deduplicated_path}")
+        print(new_dataframe["initials_run"].value_counts())
+
+    if args.csv:
+        export_csv(deduplicated_path, os.path.join(args.output_dir, 'deduplicated_dataframe.csv'))
+
+
+def run_extract_ids(args):
+    """STEP 6: saves the output_column of the deduplicated rows matching the filter to 'assembly_run_ids.txt'."""
+    input_path = args.input or os.path.join(args.output_dir, 'deduplicated.parquet')
+    if input_path.endswith('.parquet'):
+        # the filter is pushed down to the Parquet reader, which decodes only the output column
+        from summary_processing import save_filtered_ids_to_file
+        save_filtered_ids_to_file(dataframe=input_path,
+                                  filter_column=args.filter_column,
+                                  filter_value=args.filter_value,
+                                  output_column=args.output_column,
+                                  output_path=args.output_dir)
+        return
+
+    if args.chunksize:
+        from chunked import save_filtered_ids_chunked
+        save_filtered_ids_chunked(input_path, args.output_column, args.filter_column, args.filter_value,
+                                  args.output_dir, chunksize=args.chunksize)
+        return
+
+    import pandas as pd
+    from summary_processing import save_filtered_ids_to_file
+    dataframe = pd.read_csv(input_path, usecols=list(dict.fromkeys([args.output_column, args.filter_column])))
+    save_filtered_ids_to_file(dataframe=dataframe,
+                              filter_column=args.filter_column,
+                              filter_value=args.filter_value,
+                              output_column=args.output_column,
+                              output_path=args.output_dir)
+
+
+def run_transfer(args):
+    """STEP 7: streams the FASTQ files of the run IDs from the ENA FTP server to Azure Blob Storage."""
+    # the Azure SDK, ftplib and sqlite3 are only imported by this command
+    import transfer_fastq
+    results = transfer_fastq.run(args)
+    # a failed transfer fails the command (completed files are skipped when it is run again)
+    return 1 if 'failed' in results.values() else 0
+
+
+def build_parser():
+    """Returns the parser of every command; the backends are only imported when a command runs."""
+    parser = argparse.ArgumentParser(description="Retrieves MGnify metadata, extracts the run IDs and transfers their FASTQ files.",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__[__doc__.index("Each step"):])
+    parser.add_argument("--metrics", default=None, help="JSON-lines metrics file (one line per timed stage, HTTP request and file)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, function, description):
+        command = commands.add_parser(name, help=description, description=description)
+        command.add_argument("--output_dir", default=OUTPUT_PATH, help=f"directory of the inputs and outputs (default: {OUTPUT_PATH})")
+        command.set_defaults(function=function)
+        return command
+
+    def add_api_options(command):
+        command.add_argument("--cache_dir", default=None,
+                             help="on-disk cache of the MGnify API responses (default: OUTPUT_DIR/.http_cache, '' disables it)")
+        command.add_argument("--cache_ttl", type=int, default=24 * 60 * 60, help="seconds before a cached response is revalidated")
+
+    biomes = add_command("biomes", run_biomes, "save the list of MGnify biomes")
+    add_api_options(biomes)
+
+    summarize = add_command("summarize", run_summarize, "fetch the studies and analyses and save their summaries")
+    summarize.add_argument("--biomes", nargs="+", default=["root:Engineered:Wastewater"],
+                           help="the studies of each biome are fetched once for every experiment type")
+    summarize.add_argument("--experiment_types", nargs="+", default=["metagenomic", "metatranscriptomic", "assembly"])
+    summarize.add_argument("--concurrency", type=int, default=8,
+                           help="highest number of pages requested at the same time (the limit adapts below it when throttled)")
+    summarize.add_argument("--max_retries", type=int, default=6, help="retries of a throttled or failed page before giving up")
+    summarize.add_argument("--streaming", action="store_true",
+                           help="process one page at a time (NDJSON + CSV batches) to keep the memory flat on large lineages")
+    summarize.add_argument("--full_listing", action="store_true",
+                           help="download the whole listings instead of syncing them into the local state store")
+    summarize.add_argument("--state_store", default=None, help="SQLite state store (default: OUTPUT_DIR/mgnify_state.sqlite)")
+    summarize.add_argument("--studies_only", action="store_true",
+                           help="only save the studies of the biomes as mgnify_studies_BIOME.json (first scatter step of main.nf)")
+    summarize.add_argument("--studies", nargs="+", default=None,
+                           help="mgnify_studies_BIOME.json files saved by --studies_only, one per biome in the order of --biomes: "
+                                "the studies of these biomes are not fetched again")
+    summarize.add_argument("--csv", action="store_true",
+                           help="also write the summaries as *_summary.csv and combined_dataframe.csv")
+    add_api_options(summarize)
+
+    dedup = add_command("dedup", run_dedup, "remove the duplicated analyses of the summaries")
+    dedup.add_argument("--input", default=None,
+                       help="summary store written by 'summarize', or a combined CSV file (default: OUTPUT_DIR/summaries)")
+    dedup.add_argument("--biomes", nargs="+", default=None, help="only read the summaries of these biomes (default: all)")
+    dedup.add_argument("--experiment_types", nargs="+", default=None, help="only read these experiment types (default: all)")
+    dedup.add_argument("--csv", action="store_true", help="also write the deduplicated rows as deduplicated_dataframe.csv")
+    dedup.add_argument("--explore", action="store_true", help="print the dtypes, missing values and statistics of the dataset")
+    dedup.add_argument("--chunksize", type=int, default=None, help="process the file in batches of this many rows")
+
+    extract_ids = add_command("extract-ids", run_extract_ids, "save the run IDs of the deduplicated analyses")
+    extract_ids.add_argument("--input", default=None,
+                             help="deduplicated analyses, Parquet or CSV (default: OUTPUT_DIR/deduplicated.parquet)")
+    extract_ids.add_argument("--filter_column", default="initials_run")
+    extract_ids.add_argument("--filter_value", default="ERR")
+    extract_ids.add_argument("--output_column", default="assembly_run_id")
+    extract_ids.add_argument("--chunksize", type=int, default=None, help="read a CSV input in batches of this many rows")
+
+    transfer = commands.add_parser("transfer", help="transfer the FASTQ files of run accessions to Azure Blob Storage")
+    source = transfer.add_mutually_exclusive_group(required=True)
+    source.add_argument("--accessions", nargs="+", help="run accessions to transfer")
+    source.add_argument("--accession_file", help="file with one run accession per line")
+    transfer.add_argument("--credentials", help="JSON file with 'storageAccountName' and 'storageAccountKey' "
+                                                "(the AZURE_STORAGE_CONNECTION_STRING variable is used if omitted)")
+    transfer.add_argument("--container", default="retrievefastq", help="Azure Blob Storage container")
+    transfer.add_argument("--server", default=None, help="FTP server, optionally as host:port (defaults to ena_ftp.ENA_FTP_SERVER)")
+    transfer.add_argument("--workers", type=int, default=4, help="files transferred at the same time")
+    transfer.add_argument("--upload_workers", type=int, default=None,
+                          help="blocks of a file staged in parallel (defaults to transfer.DEFAULT_UPLOAD_WORKERS)")
+    transfer.add_argument("--connections", type=int, default=1, help="FTP connections downloading segments of a large file")
+    transfer.add_argument("--index", help="SQLite index of the FTP paths already resolved")
+    transfer.add_argument("--journal", help="SQLite transfer journal used to resume interrupted transfers")
+    transfer.add_argument("--local_directory", default=None,
+                          help="download the files to this directory before uploading them (streamed to Azure if omitted)")
+    transfer.add_argument("--report", default="transfer_report.tsv", help="TSV file with the status of every accession")
+    transfer.set_defaults(function=run_transfer)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if hasattr(args, "output_dir"):
+        os.makedirs(args.output_dir, exist_ok=True)
+    metrics.configure(args.metrics)
+    try:
+        status = args.function(args)
+    finally:
+        metrics.summary()
+        metrics.close()
+    sys.exit(status or 0)
+
 
 if __name__ == "__main__":
-    # setting the variables for FTP and Azure
-    server_address = 'ftp.sra.ebi.ac.uk'
-    remote_directory = '/vol1/fastq'  # Remote directory where FASTQ files are stored
-    # set variables for MGnify
-    biome = "root:Engineered:Wastewater"
-    biome_lower = biome.replace(":", "_").lower()
-    experiments = ("metagenomic","metatranscriptomic","assembly")
-    output_path = '../outputs/'
-    df_summary_dict = {}
-    local_directory_base = '../outputs'  # Base local directory to save files
-    
-    #accession = 'ERR1356751'  # Sostituisci con il tuo ID di accessione
-    #local_download_directory = f'../outputs/Unified_analyses/{accession}/'
-    """
-
-    # running function form utils
-    print('\033[93m' + 'STARTING STEP 1: fetch_biomes_and_save'+ '\033[0m')
-    fetch_biomes_and_save(output_dir= output_path)
-
-    print('\033[93m' + 'STARTING STEP 2: get_studies_and_analyses_summary'+ '\033[0m')
-    for exp in experiments:
-        print(f"Processing experiment type: {exp}")
-        df_summary = get_studies_and_analyses_summary(biome_name=biome,experiment_type=exp)
-        df_summary_dict[exp] = df_summary  # Aggiungi il DataFrame al dizionario
-
-        # save the CSV file
-        df_summary.to_csv(os.path.join(output_path, f"{biome_lower}_{exp}_summary.csv"), index=False)
-        combined_df = pd.concat(df_summary_dict.values(), axis=0)
-        combined_df.to_csv(os.path.join(output_path, 'combined_dataframe.csv'), index=False)
-
-    combined_df = pd.read_csv(os.path.join(output_path, 'combined_dataframe.csv'))
-    
-    print('\033[93m' + 'STARTING STEP 3: explore_dataset' + '\033[0m')
-    display(combined_df.dtypes)
-    explore_dataset(combined_df)
-    
-    print('\033[93m' + 'STARTING STEP 4: feature_engineering' + '\033[0m')
-    combined_df_updated = feature_engineering(combined_df)
-    display(combined_df_updated['concatenated_ids'].value_counts())
-
-    print('\033[93m' + 'STARTING STEP 5: removing_duplicates' + '\033[0m')
-    new_dataframe = removing_duplicates(combined_df_updated)
-    print(new_dataframe["initials_run"].value_counts())
-
-    print('\033[93m' + 'STARTING STEP 6: save_filtered_ids_to_file' + '\033[0m')
-    save_filtered_ids_to_file(dataframe = new_dataframe,
-                          filter_column = 'initials_run',
-                          filter_value = 'ERR',
-                          output_column = 'assembly_run_id',
-                          output_path = '../outputs')
-    """
-    # load personal credentials for Azure connection
-    credentials = load_credentials('../credentials.json')
-
-    # download fastq files and push them in the storage account
-    with open('../outputs/assembly_run_ids.txt', 'r')as file:
-        accession_ids = file.read().splitlines()
-
-    for accession in accession_ids:
-        print(f"Processing {accession}...")
-        download_files_and_upload_to_azure(server_address,
-                                           accession,
-                                           local_directory_base = '../outputs',
-                                           azure_connection_string = f"DefaultEndpointsProtocol=https;AccountName={ credentials['storageAccountName']};AccountKey={credentials['storageAccountKey']};EndpointSuffix=core.windows.net",
-                                           azure_container_name = 'retrievefastq'
-                                           )
-        print(f"Completed processing for {accession}.")
\ No newline at end of file
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+""" This python script contains the instrumentation (timers, latency histograms, byte counters) of the pipeline stages.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import bisect
+import contextlib
+import functools
+import json
+import sys
+import threading
+import time
+
+# histogram buckets: 4 per power of two, from 1 microsecond to about 18 minutes
+BUCKET_BOUNDS = [1e-6 * 2 ** (step / 4) for step in range(121)]
+
+
+class Histogram:
+    """
+    Fixed log-scale histogram of durations: constant memory and an O(log buckets) update,
+    with percentiles estimated within one bucket (about 19%).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Returns the upper bound of the bucket holding the q-th percentile (0 < q <= 100), capped at the maximum."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.max, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    Collects the metrics of a run: a duration histogram per stage, byte counters and throughputs per accession,
+    and optionally every measure as one JSON line in a metrics file.
+
+    The aggregates cost a lock and a few additions per measure; the JSON line is only built when a metrics
+    file is configured. Disabled metrics turn every call into a no-op.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.path = None
+        self.histograms = {}     # name -> Histogram
+        self.counters = {}       # name -> total
+        self.throughputs = {}    # (name, accession) -> [bytes, seconds, count]
+        self._file = None
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def configure(self, path=None, enabled=True):
+        """
+        Sets where the measures are written.
+
+        Args:
+            path (str, optional): JSON-lines metrics file (appended to). Only the aggregates are kept if None.
+            enabled (bool, optional): Turn the instrumentation off altogether. Defaults to True.
+        """
+        self.close()
+        self.enabled = enabled
+        self.path = path
+        self._file = open(path, "a") if path and enabled else None
+
+    def _emit(self, kind, name, labels, **values):
+        if self._file is not None:
+            line = json.dumps({"ts": round(time.time(), 6), "type": kind, "name": name, **values, **labels})
+            with self._lock:
+                self._file.write(line + "\n")
+
+    def observe(self, name, seconds, **labels):
+        """Records a duration (e.g. the latency of a HTTP request) in the histogram of `name`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+        self._emit("timer", name, labels, seconds=round(seconds, 6))
+
+    def add(self, name, value=1, **labels):
+        """Increments the counter `name`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._emit("counter", name, labels, value=value)
+
+    def throughput(self, name, nbytes, seconds, accession=None, **labels):
+        """Records `nbytes` moved in `seconds` (e.g. the download of one file), aggregated per accession."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for key in ((name, None), (name, accession)) if accession else ((name, None),):
+                totals = self.throughputs.setdefault(key, [0, 0.0, 0])
+                totals[0] += nbytes
+                totals[1] += seconds
+                totals[2] += 1
+        if accession:
+            labels = dict(labels, accession=accession)
+        self._emit("throughput", name, labels, bytes=nbytes, seconds=round(seconds, 6),
+                   mb_per_s=round(nbytes / seconds / 1024 ** 2, 3) if seconds else None)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Context manager timing a block of code into the histogram of `name`.
+
+        The labels (e.g. accession='ERR977403') only go to the metrics file. The yielded dict can be
+        filled inside the block with labels known only at the end (e.g. the number of records).
+        """
+        extra = {}
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels, **extra)
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function, under `name` or the name of the function."""
+        def decorator(function):
+            stage = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def summary(self, file=None, max_accessions=10):
+        """
+        Prints the end-of-run summary: one row per timed stage, the counters and the throughputs.
+
+        Args:
+            file (file, optional): Where to print. Defaults to stdout.
+            max_accessions (int, optional): Number of accessions listed for each throughput (the slowest first). Defaults to 10.
+        """
+        file = file or sys.stdout
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            throughputs = dict(self.throughputs)
+
+        print(f"\nMetrics of the run ({time.time() - self._started:.1f} s)", file=file)
+        if histograms:
+            print(f"{'stage':<32} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}", file=file)
+            for name, histogram in histograms:
+                print(f"{name:<32} {histogram.count:>7} {histogram.total:>9.2f} {1000 * histogram.total / histogram.count:>9.1f} "
+                      f"{1000 * histogram.percentile(50):>9.1f} {1000 * histogram.percentile(95):>9.1f} {1000 * histogram.max:>9.1f}",
+                      file=file)
+        if counters:
+            print(f"\n{'counter':<32} {'value':>12}", file=file)
+            for name, value in counters:
+                print(f"{name:<32} {value:>12}", file=file)
+        totals = sorted((name, totals) for (name, accession), totals in throughputs.items() if accession is None)
+        if totals:
+            print(f"\n{'throughput':<32} {'count':>7} {'MB':>10} {'MB/s':>8}", file=file)
+            for name, (nbytes, seconds, files) in totals:
+                print(f"{name:<32} {files:>7} {nbytes / 1024 ** 2:>10.1f} {nbytes / seconds / 1024 ** 2 if seconds else 0:>8.1f}", file=file)
+                per_accession = [(accession, values) for (key, accession), values in throughputs.items()
+                                 if key == name and accession is not None]
+                per_accession.sort(key=lambda item: item[1][0] / item[1][1] if item[1][1] else 0)
+                for accession, (nbytes, seconds, files) in per_accession[:max_accessions]:
+                    print(f"  {accession:<30} {files:>7} {nbytes / 1024 ** 2:>10.1f} {nbytes / seconds / 1024 ** 2 if seconds else 0:>8.1f}",
+                          file=file)
+
+    def close(self):
+        """Flushes and closes the metrics file."""
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
+                self._file = None
+
+
+# the metrics of the process, shared by every module
+METRICS = Metrics()
+configure = METRICS.configure
+timer = METRICS.timer
+timed = METRICS.timed
+observe = METRICS.observe
+add = METRICS.add
+throughput = METRICS.throughput
+summary = METRICS.summary
+close = METRICS.close
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+
+""" This python script contains the functions used to talk with the MGnify API.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import asyncio
+import collections
+import json
+import os
+import time
+import aiohttp
+import requests
+import metrics
+from request_controller import CONTROLLER
+
+# can be pointed to a mirror or a local stand-in through the environment
+MGNIFY_API_URL = os.environ.get("MGNIFY_API_URL", "https://www.ebi.ac.uk/metagenomics/api/v1")
+DEFAULT_CONCURRENCY = 8
+
+# fixed schemas of the flattened records
+STUDIES_COLUMNS = ['study_id', 'study_name', 'n_samples', 'bioproject', 'centre_name', 'biomes']
+ANALYSES_COLUMNS = ['analysis_id', 'experiment_type', 'pipeline_version', 'instrument_platform', 'study_id', 'sample_id', 'assembly_run_id']
+SUMMARY_COLUMNS = ANALYSES_COLUMNS + [column for column in STUDIES_COLUMNS if column != 'study_id']
+
+
+def biome_slug(biome_name):
+    """ Returns the lowercase, file-name friendly form of a biome lineage (root:Engineered:Wastewater -> root_engineered_wastewater). """
+    return biome_name.replace(":", "_").lower()
+
+
+class IncompleteListingError(Exception):
+    """
+    Raised when a page of a listing still fails after the retries of the request controller,
+    instead of returning the records of the preceding pages as if the listing were complete.
+
+    Attributes:
+        url (str): The endpoint of the listing.
+        records (list): The records of the pages retrieved before the failure, in page order.
+        pages_retrieved (int): The number of pages retrieved.
+        total_pages (int): The number of pages of the listing (None if the first page failed).
+    """
+
+    def __init__(self, url, records, pages_retrieved, total_pages, cause):
+        self.url = url
+        self.records = records
+        self.pages_retrieved = pages_retrieved
+        self.total_pages = total_pages
+        super().__init__(f"{url}: only {pages_retrieved} of {total_pages if total_pages is not None else '?'} pages retrieved "
+                         f"({len(records)} records), page {pages_retrieved + 1} failed: {cause}")
+
+
+def flatten_studies(records):
+    """
+    Flattens JSON:API study records into rows following STUDIES_COLUMNS.
+
+    Args:
+        records (iterable): Raw study records as returned in the 'data' list of the API.
+
+    Yields:
+        dict: One row per study.
+    """
+    for item in records:
+        yield {
+            'study_id': item['id'],
+            'study_name': item['attributes'].get('study-name', ''),
+            'n_samples': item['attributes'].get('samples-count', 0),
+            'bioproject': item['attributes'].get('bioproject', ''),
+            'centre_name': item['attributes'].get('centre-name', ''),
+            'biomes': ", ".join([biome['id'] for biome in item['relationships']['biomes']['data']])
+            }
+
+
+def flatten_analyses(records):
+    """
+    Flattens JSON:API analysis records into rows following ANALYSES_COLUMNS.
+    The 'assembly_run_id' holds the assembly accession for assemblies and the run accession otherwise.
+
+    Args:
+        records (iterable): Raw analysis records as returned in the 'data' list of the API.
+
+    Yields:
+        dict: One row per analysis.
+    """
+    for item in records:
+        yield {
+            'analysis_id': item['id'],
+            'experiment_type': item['attributes'].get('experiment-type', ''),
+            'pipeline_version': item['attributes'].get('pipeline-version', ''),
+            'instrument_platform': item['attributes'].get('instrument-model', ''),
+            'study_id': item['relationships']['study']['data'].get('id', '') if item['relationships'].get('study') else '',
+            'sample_id': item['relationships']['sample']['data'].get('id', '') if item['relationships'].get('sample') else '',
+            'assembly_run_id': item['relationships'].get('assembly', {}).get('data', {}).get('id', '') if item['attributes'].get('experiment-type') == 'assembly' else item['relationships'].get('run', {}).get('data', {}).get('id', '')
+            }
+
+
+def get_json(url, params=None, cache=None):
+    """
+    Performs a blocking GET request and decodes its JSON body, going through the HTTP cache if given.
+    Throttled or failed requests are retried by the shared request controller.
+
+    Args:
+        url (str): The requested URL.
+        params (dict, optional): Query parameters.
+        cache (HTTPCache, optional): Cache used to serve and store the response.
+
+    Returns:
+        dict: The decoded JSON body.
+
+    Raises:
+        requests.exceptions.HTTPError: If the server answers with an error status code.
+    """
+    entry = cache.lookup(url, params) if cache else None
+    if cache and cache.is_fresh(entry):
+        return json.loads(cache.hit(entry))
+
+    headers = entry.conditional_headers() if entry else {}
+
+    def attempt():
+        start = time.perf_counter()
+        response = requests.get(url, params=params, headers=headers)
+        metrics.observe("http.request", time.perf_counter() - start, endpoint=url.rsplit("/", 1)[-1], status=response.status_code)
+        if entry and response.status_code == 304:
+            return json.loads(cache.revalidated(entry))
+        response.raise_for_status()
+        if cache:
+            cache.store(url, params, response.content, response.headers)
+        return json.loads(response.content)
+
+    return CONTROLLER.execute_sync(attempt)
+
+
+@metrics.timed()
+def fetch_biomes_and_save(output_dir, cache = None):
+    """
+    Fetches the list of biomes from the MGnify API and saves it to a text file in the specified output directory.
+    The function makes a GET request to the MGnify API's biomes endpoint, extracts the biome IDs from the response,
+    and writes them to a file named 'mgnify_biomes_list.txt' within the given output directory.
+
+    Args:
+        output_dir (str): The directory path where the biomes list file will be saved. The directory must exist.
+        cache (HTTPCache, optional): On-disk cache used to serve the response when it was already downloaded.
+
+    Note:
+        This function requires the 'requests' library for making HTTP requests and 'os' library for file path operations.
+    """
+    url = f"{MGNIFY_API_URL}/biomes"
+    try:
+        biomes_data = get_json(url, cache=cache)
+    except requests.exceptions.HTTPError as http_err:
+        print("Failed to retrieve biomes. Status code:", http_err.response.status_code)
+        return
+
+    biomes_list = [biome['id'] for biome in biomes_data['data']]
+    
+    # Ensure the output directory exists
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    # Write the biome IDs to a file
+    with open(os.path.join(output_dir, "mgnify_biomes_list.txt"), 'w') as file:
+        for biome_name in biomes_list:
+            file.write(f"{biome_name}\n")
+            
+    print("Biomes list saved successfully.")
+
+
+async def fetch_page(session, url, params, page, semaphore, cache=None):
+    """
+    Fetches a single page of a paginated MGnify JSON:API listing.
+
+    The request goes through the shared request controller, which bounds the requests in flight
+    adaptively and retries the page when it is throttled (429, 503), on 5xx answers and network errors.
+
+    Args:
+        session (aiohttp.ClientSession): The pooled session used for the request.
+        url (str): The endpoint to query (e.g. '.../studies').
+        params (dict): Query parameters shared by every page.
+        page (int): The page number to retrieve.
+        semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+        cache (HTTPCache, optional): Cache used to serve and store the page.
+
+    Returns:
+        dict: The decoded JSON body of the page.
+
+    Raises:
+        aiohttp.ClientResponseError: If the page still fails after the retries.
+    """
+    page_params = {key: str(value) for key, value in params.items()}
+    page_params["page"] = str(page)
+
+    entry = cache.lookup(url, page_params) if cache else None
+    if cache and cache.is_fresh(entry):
+        metrics.add("http.cache_hits")
+        return json.loads(cache.hit(entry))
+    headers = entry.conditional_headers() if entry else {}
+
+    async def attempt():
+        start = time.perf_counter()
+        async with session.get(url, params=page_params, headers=headers) as response:
+            # MGnify answers with 'application/vnd.api+json', so the body is decoded directly
+            body = await response.read()
+            metrics.observe("http.request", time.perf_counter() - start, endpoint=url.rsplit("/", 1)[-1], page=page,
+                            status=response.status)
+            if entry and response.status == 304:
+                return json.loads(cache.revalidated(entry))
+            response.raise_for_status()
+            if cache:
+                cache.store(url, page_params, body, response.headers)
+            return json.loads(body)
+
+    # the semaphore bounds the window of this listing, the controller the requests of the whole process
+    async with semaphore:
+        return await CONTROLLER.execute(attempt)
+
+
+async def iter_pages_async(url, params, concurrency=DEFAULT_CONCURRENCY, session=None, cache=None):
+    """
+    Yields the pages of a paginated MGnify listing in page order while fetching them concurrently.
+
+    The first page is read to learn 'meta.pagination.pages'. The following pages are requested through a
+    sliding window of at most `concurrency` pages, so only that many bodies are held in memory at once.
+    An error on a page is raised once every preceding page has been yielded.
+
+    Args:
+        url (str): The endpoint to query.
+        params (dict): Query parameters shared by every page.
+        concurrency (int, optional): Maximum number of simultaneous requests. Defaults to 8.
+        session (aiohttp.ClientSession, optional): An existing session to reuse. A new one is created if None.
+        cache (HTTPCache, optional): Cache used to serve and store every page.
+
+    Yields:
+        tuple: (page number, total pages, decoded JSON body of the page).
+    """
+    own_session = session is None
+    if own_session:
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        session = aiohttp.ClientSession(connector=connector)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    window = collections.deque()
+    try:
+        first_page = await fetch_page(session, url, params, 1, semaphore, cache)
+        total_pages = first_page["meta"]["pagination"]["pages"]
+        yield 1, total_pages, first_page
+
+        next_page = 2
+        while next_page <= total_pages or window:
+            while next_page <= total_pages and len(window) < concurrency:
+                window.append(asyncio.ensure_future(fetch_page(session, url, params, next_page, semaphore, cache)))
+                next_page += 1
+            page = next_page - len(window)
+            body = await window.popleft()
+            yield page, total_pages, body
+    finally:
+        for task in window:
+            task.cancel()
+            if task.done() and not task.cancelled():
+                task.exception()  # already failed: mark the exception as retrieved
+        if own_session:
+            await session.close()
+
+
+async def fetch_all_pages_async(url, params, concurrency=DEFAULT_CONCURRENCY, session=None, cache=None):
+    """
+    Retrieves every page of a paginated MGnify listing concurrently.
+
+    The first page is read to learn 'meta.pagination.pages', the remaining pages are then requested
+    with at most `concurrency` requests in flight over one pooled session. Records are returned in page order.
+    A failed page is retried by the request controller; if it still fails, IncompleteListingError is raised
+    (with the records of the preceding pages) instead of returning a truncated listing.
+
+    Args:
+        url (str): The endpoint to query.
+        params (dict): Query parameters shared by every page.
+        concurrency (int, optional): Maximum number of simultaneous requests. Defaults to 8.
+        session (aiohttp.ClientSession, optional): An existing session to reuse. A new one is created if None.
+        cache (HTTPCache, optional): Cache used to serve and store every page.
+
+    Returns:
+        list: The 'data' records of all retrieved pages, in page order.
+
+    Raises:
+        IncompleteListingError: If a page could not be retrieved.
+    """
+    records = []
+    page = 1
+    total_pages = None
+    with metrics.timer("pagination", endpoint=url.rsplit("/", 1)[-1]) as labels:
+        try:
+            async for page, total_pages, body in iter_pages_async(url, params, concurrency, session, cache):
+                records.extend(body["data"])
+                if page == 1:
+                    print(f"Page 1 retrieved successfully. Total pages: {total_pages}")
+                page += 1
+        except aiohttp.ClientResponseError as http_err:
+            print(f"HTTP error occurred on page {page}: {http_err.message} - Status code: {http_err.status}")
+            labels.update(pages=page - 1, records=len(records), incomplete=True)
+            raise IncompleteListingError(url, records, page - 1, total_pages, http_err) from http_err
+        except Exception as err:
+            print(f"An error occurred on page {page}: {err}")
+            labels.update(pages=page - 1, records=len(records), incomplete=True)
+            raise IncompleteListingError(url, records, page - 1, total_pages, err) from err
+        labels.update(pages=page - 1, records=len(records))
+
+    print(f"Retrieved {len(records)} records from {url}")
+    return records
+
+
+def fetch_all_pages(url, params, concurrency=DEFAULT_CONCURRENCY, cache=None):
+    """
+    Synchronous wrapper around fetch_all_pages_async for callers that do not run an event loop.
+
+    Args:
+        url (str): The endpoint to query.
+        params (dict): Query parameters shared by every page.
+        concurrency (int, optional): Maximum number of simultaneous requests. Defaults to 8.
+        cache (HTTPCache, optional): Cache used to serve and store every page.
+
+    Returns:
+        list: The 'data' records of all retrieved pages, in page order.
+
+    Raises:
+        IncompleteListingError: If a page could not be retrieved.
+    """
+    return asyncio.run(fetch_all_pages_async(url, params, concurrency=concurrency, cache=cache))
+
+
+async def fetch_listings_async(listings, concurrency=DEFAULT_CONCURRENCY, cache=None):
+    """
+    Retrieves several paginated MGnify listings as one batch over a single pooled session.
+
+    Every listing is paginated concurrently as in fetch_all_pages_async, and all of them run at the same
+    time; the connection pool of the shared session caps the requests in flight at `concurrency` overall.
+
+    Args:
+        listings (list): (url, params) of each listing.
+        concurrency (int, optional): Maximum number of simultaneous requests for the whole batch. Defaults to 8.
+        cache (HTTPCache, optional): Cache used to serve and store every page.
+
+    Returns:
+        list: The records of each listing, in the order of `listings`.
+
+    Raises:
+        IncompleteListingError: If a page of any listing could not be retrieved.
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*(fetch_all_pages_async(url, params, concurrency, session, cache)
+                                      for url, params in listings))
+
+
+def fetch_listings(listings, concurrency=DEFAULT_CONCURRENCY, cache=None):
+    """
+    Synchronous wrapper around fetch_listings_async.
+
+    Returns:
+        list: The records of each listing, in the order of `listings`.
+    """
+    return asyncio.run(fetch_listings_async(listings, concurrency=concurrency, cache=cache))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+""" This python script contains the controller (adaptive concurrency and retries) every MGnify API request goes through.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import asyncio
+import contextlib
+import email.utils
+import random
+import time
+import aiohttp
+import requests
+import metrics
+
+# answers worth another attempt: throttling (429, 503) and transient server errors
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+NETWORK_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError,
+                  requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def parse_retry_after(value):
+    """Returns the seconds of a 'Retry-After' header (delay in seconds or HTTP date), None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_reason(error):
+    """
+    Tells whether a failed request is worth retrying.
+
+    Returns:
+        tuple: (status or None for network errors, seconds of 'Retry-After' or None), or None if the error is final.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        status, headers = error.status, error.headers or {}
+    elif isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status, headers = error.response.status_code, error.response.headers
+    elif isinstance(error, NETWORK_ERRORS):
+        return None, None
+    else:
+        return None
+    if status not in RETRY_STATUSES:
+        return None
+    return status, parse_retry_after(headers.get("Retry-After"))
+
+
+class RequestController:
+    """
+    Shared controller of the MGnify API traffic: an adaptive concurrency limit and the retries of failed requests.
+
+    The limit follows AIMD (additive increase, multiplicative decrease): every successful request raises it
+    by 1/limit, about +1 per round of requests, and a throttled answer (429 or 503) multiplies it by
+    `decrease_factor`. Only one decrease happens per round: the answers to requests started before
+    the last decrease do not lower the limit again. A 'Retry-After' header pauses every new request
+    until the given time. Failed requests (throttling, 5xx, network errors) are retried up to
+    `max_retries` times after a jittered exponential backoff.
+
+    Args:
+        initial_concurrency (int, optional): Starting limit of requests in flight. Defaults to 8.
+        max_concurrency (int, optional): Highest limit reached when ramping up. Defaults to 32.
+        min_concurrency (int, optional): Lowest limit after backing off. Defaults to 1.
+        max_retries (int, optional): Attempts after the first one before giving up. Defaults to 6.
+        backoff_base (float, optional): Seconds of the first backoff, doubled at each retry. Defaults to 0.5.
+        backoff_max (float, optional): Longest backoff in seconds. Defaults to 60.
+        decrease_factor (float, optional): Multiplier of the limit when throttled. Defaults to 0.5.
+    """
+
+    def __init__(self, initial_concurrency=8, max_concurrency=32, min_concurrency=1, max_retries=6,
+                 backoff_base=0.5, backoff_max=60.0, decrease_factor=0.5):
+        self.configure(initial_concurrency, max_concurrency, min_concurrency, max_retries, backoff_base, backoff_max, decrease_factor)
+
+    def configure(self, initial_concurrency=8, max_concurrency=32, min_concurrency=1, max_retries=6,
+                  backoff_base=0.5, backoff_max=60.0, decrease_factor=0.5):
+        """Sets the parameters (see the class) and resets the limit and the counters."""
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.decrease_factor = decrease_factor
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.lowest_limit = self.limit
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0}
+        self._round = 0
+        self._loop = None
+        self._condition = None
+
+    def _succeeded(self):
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _throttled(self, request_round, retry_after):
+        self.stats["throttled"] += 1
+        if retry_after:
+            self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+        if request_round == self._round:
+            self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+            self.lowest_limit = min(self.lowest_limit, self.limit)
+            self._round += 1
+        metrics.add("http.throttled", limit=round(self.limit, 2))
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Returns the seconds to wait before the retry number `attempt` (0 for the first retry).
+
+        'Retry-After' is honoured with a small jitter, so the waiting requests do not all come back at once;
+        otherwise the delay is drawn uniformly up to backoff_base * 2**attempt ("full jitter").
+        """
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry(self, error, attempt, request_round):
+        """Returns the backoff before the next attempt, or raises the error if it is final or the retries are exhausted."""
+        reason = retry_reason(error)
+        if reason is None or attempt >= self.max_retries:
+            self.stats["failed"] += 1
+            raise error
+        status, retry_after = reason
+        if status in THROTTLE_STATUSES:
+            self._throttled(request_round, retry_after)
+        self.stats["retries"] += 1
+        metrics.add("http.retries", status=status or "network")
+        return self.backoff(attempt, retry_after)
+
+    def _bind(self):
+        # asyncio primitives belong to one event loop, and every asyncio.run of the pipeline starts a new one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._condition, self.in_flight = loop, asyncio.Condition(), 0
+        return self._condition
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Waits for the pause (if any) and for a free slot under the current limit; yields the round of the request."""
+        condition = self._bind()
+        pause = self.resume_at - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield self._round
+        finally:
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+    async def execute(self, attempt):
+        """
+        Runs a request coroutine with the adaptive limit and the retries.
+
+        Args:
+            attempt (callable): Coroutine function performing one attempt (it raises on an error status).
+
+        Returns:
+            The result of the first successful attempt.
+
+        Raises:
+            The error of the last attempt, if it is not worth retrying or the retries are exhausted.
+        """
+        for retry in range(self.max_retries + 1):
+            async with self.slot() as request_round:
+                self.stats["requests"] += 1
+                try:
+                    result = await attempt()
+                except Exception as error:
+                    delay = self._retry(error, retry, request_round)
+                else:
+                    self._succeeded()
+                    return result
+            await asyncio.sleep(delay)
+
+    def execute_sync(self, attempt):
+        """Blocking counterpart of execute, for the requests made outside an event loop (one at a time)."""
+        for retry in range(self.max_retries + 1):
+            pause = self.resume_at - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            self.stats["requests"] += 1
+            try:
+                result = attempt()
+            except Exception as error:
+                delay = self._retry(error, retry, self._round)
+            else:
+                self._succeeded()
+                return result
+            time.sleep(delay)
+
+    def report(self):
+        """Prints the counters of the current run."""
+        print(f"MGnify API: {self.stats['requests']} requests, {self.stats['retries']} retried, "
+              f"{self.stats['throttled']} throttled, {self.stats['failed']} failed "
+              f"(concurrency limit {self.limit:.1f}, lowest {self.lowest_limit:.1f})")
+
+
+# the controller of the process, shared by every MGnify request
+CONTROLLER = RequestController()
+configure = CONTROLLER.configure
+report = CONTROLLER.report
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+""" This python script contains the local state store used for the incremental sync of MGnify studies and analyses.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import asyncio
+import json
+import sqlite3
+import time
+import aiohttp
+from mgnify_api import DEFAULT_CONCURRENCY, IncompleteListingError, fetch_page, fetch_all_pages_async
+
+# listing -> (ordering sent to the API so that the newest records come first, attribute telling when a record changed)
+# analyses are never edited once published, so the increasing MGYA accession is enough to spot new ones
+INCREMENTAL_ORDERING = {
+    "studies": ("-last_update", "last-update"),
+    "analyses": ("-accession", None),
+}
+
+
+class StateStore:
+    """
+    SQLite store of the MGnify records already ingested, grouped by listing ('studies' or 'analyses')
+    and scope (the biome, plus the experiment type for analyses).
+
+    Args:
+        path (str): Path of the SQLite database. It is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " kind TEXT, scope TEXT, id TEXT, updated TEXT, ingested_at REAL, body TEXT,"
+            " PRIMARY KEY (kind, scope, id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS syncs (kind TEXT, scope TEXT, synced_at REAL, PRIMARY KEY (kind, scope))"
+        )
+        self._db.commit()
+
+    def last_sync(self, kind, scope):
+        """Returns the timestamp of the last completed sync of a listing, or None if it was never synced."""
+        row = self._db.execute("SELECT synced_at FROM syncs WHERE kind = ? AND scope = ?", (kind, scope)).fetchone()
+        return row[0] if row else None
+
+    def mark_synced(self, kind, scope):
+        """Records that a listing has been synced up to now."""
+        self._db.execute("INSERT OR REPLACE INTO syncs (kind, scope, synced_at) VALUES (?, ?, ?)", (kind, scope, time.time()))
+        self._db.commit()
+
+    def known_versions(self, kind, scope, ids):
+        """
+        Returns the stored version of the given records.
+
+        Args:
+            kind (str): 'studies' or 'analyses'.
+            scope (str): The scope of the listing.
+            ids (list): Record IDs to look up.
+
+        Returns:
+            dict: Maps each already ingested ID to the 'updated' value stored for it.
+        """
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._db.execute(
+            f"SELECT id, updated FROM records WHERE kind = ? AND scope = ? AND id IN ({placeholders})",
+            (kind, scope, *ids),
+        )
+        return dict(rows.fetchall())
+
+    def upsert(self, kind, scope, records, updated_field=None):
+        """
+        Inserts new records and replaces the changed ones.
+
+        Args:
+            kind (str): 'studies' or 'analyses'.
+            scope (str): The scope of the listing.
+            records (list): Raw JSON:API records.
+            updated_field (str, optional): Attribute holding the last modification date of a record.
+        """
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO records (kind, scope, id, updated, ingested_at, body) VALUES (?, ?, ?, ?, ?, ?)",
+            [(kind, scope, item["id"], record_version(item, updated_field), now, json.dumps(item)) for item in records],
+        )
+        self._db.commit()
+
+    def records(self, kind, scope):
+        """Yields the raw JSON:API records stored for a listing, ordered by ID."""
+        cursor = self._db.execute("SELECT body FROM records WHERE kind = ? AND scope = ? ORDER BY id", (kind, scope))
+        for (body,) in cursor:
+            yield json.loads(body)
+
+    def close(self):
+        """Closes the SQLite database."""
+        self._db.close()
+
+
+def record_version(item, updated_field=None):
+    """Returns the value used to tell whether a stored record changed ('' when the listing has no such attribute)."""
+    if updated_field is None:
+        return ""
+    return str(item["attributes"].get(updated_field) or "")
+
+
+async def sync_listing_async(store, kind, scope, url, params, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Brings the stored copy of a MGnify listing up to date.
+
+    The first sync of a listing downloads every page concurrently. Later syncs ask the API for the newest
+    records first and walk the pages in order, collecting new or changed records, and stop at the first page
+    in which every record is already stored with the same version.
+
+    A listing is only marked as synced, and the changed records of an incremental sync only stored, once
+    every page was retrieved: after a failure the next run starts the same sync again. Otherwise a
+    truncated first sync would pass for a complete one, and an interrupted incremental sync would leave
+    a gap behind the newest pages (the next walk would stop on them).
+
+    Args:
+        store (StateStore): The state store to update.
+        kind (str): 'studies' or 'analyses'.
+        scope (str): The scope of the listing (e.g. the biome name).
+        url (str): The endpoint to query.
+        params (dict): Query parameters of the listing.
+        concurrency (int, optional): Maximum number of simultaneous requests for the first sync. Defaults to 8.
+
+    Returns:
+        int: The number of records inserted or updated.
+
+    Raises:
+        IncompleteListingError: If a page could not be retrieved (nothing is stored or marked as synced).
+    """
+    ordering, updated_field = INCREMENTAL_ORDERING[kind]
+    params = dict(params, ordering=ordering)
+
+    if store.last_sync(kind, scope) is None:
+        try:
+            records = await fetch_all_pages_async(url, params, concurrency=concurrency)
+        except IncompleteListingError as err:
+            print(f"Initial sync of {kind} for {scope} incomplete, not marked as synced: {err}")
+            raise
+        store.upsert(kind, scope, records, updated_field)
+        store.mark_synced(kind, scope)
+        print(f"Initial sync of {kind} for {scope}: {len(records)} records stored")
+        return len(records)
+
+    changed = []
+    page = 1
+    total_pages = None
+    semaphore = asyncio.Semaphore(1)
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                body = await fetch_page(session, url, params, page, semaphore)
+            except Exception as err:
+                # the store is left as it is: the next run starts again from the newest records
+                print(f"Incremental sync of {kind} for {scope} incomplete, not marked as synced: {err}")
+                raise IncompleteListingError(url, changed, page - 1, total_pages, err) from err
+
+            data = body["data"]
+            total_pages = body["meta"]["pagination"]["pages"]
+            known = store.known_versions(kind, scope, [item["id"] for item in data])
+            fresh = [item for item in data if known.get(item["id"]) != record_version(item, updated_field)]
+            changed.extend(fresh)
+
+            if not fresh or page >= total_pages:
+                break
+            page += 1
+
+    store.upsert(kind, scope, changed, updated_field)
+    store.mark_synced(kind, scope)
+    print(f"Incremental sync of {kind} for {scope}: {len(changed)} new or updated records in {page} pages")
+    return len(changed)
+
+
+def sync_listing(store, kind, scope, url, params, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Synchronous wrapper around sync_listing_async.
+
+    Returns:
+        int: The number of records inserted or updated.
+    """
+    return asyncio.run(sync_listing_async(store, kind, scope, url, params, concurrency=concurrency))
+
+
+async def sync_listings_async(store, listings, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Syncs several listings at the same time (see sync_listing_async).
+
+    Args:
+        store (StateStore): The state store to update.
+        listings (list): (kind, scope, url, params) of each listing.
+        concurrency (int, optional): Maximum number of simultaneous requests of each initial sync. Defaults to 8.
+
+    Returns:
+        list: The number of records inserted or updated for each listing.
+    """
+    return await asyncio.gather(*(sync_listing_async(store, kind, scope, url, params, concurrency)
+                                  for kind, scope, url, params in listings))
+
+
+def sync_listings(store, listings, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Synchronous wrapper around sync_listings_async.
+
+    Returns:
+        list: The number of records inserted or updated for each listing.
+    """
+    return asyncio.run(sync_listings_async(store, listings, concurrency=concurrency))
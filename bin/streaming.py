@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+""" This python script contains the streaming ingestion of MGnify studies and analyses (one page at a time).
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import asyncio
+import csv
+import json
+import os
+import shutil
+import aiohttp
+from mgnify_api import (MGNIFY_API_URL, DEFAULT_CONCURRENCY, SUMMARY_COLUMNS, IncompleteListingError,
+                        biome_slug, flatten_analyses, flatten_studies, iter_pages_async)
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+async def stream_listing_async(url, params, ndjson_path, concurrency=DEFAULT_CONCURRENCY, cache=None):
+    """
+    Streams a paginated MGnify listing page by page, appending every raw record to a NDJSON file.
+
+    Each page is written and flushed as soon as it arrives (in page order), so the file always holds
+    complete, usable pages even if the run is interrupted. A page that still fails after the retries of
+    the request controller stops the stream with IncompleteListingError, once the preceding pages are written.
+
+    Args:
+        url (str): The endpoint to query.
+        params (dict): Query parameters shared by every page.
+        ndjson_path (str): Path of the NDJSON file, overwritten at the start of the stream.
+        concurrency (int, optional): Maximum number of simultaneous requests. Defaults to 8.
+        cache (HTTPCache, optional): Cache used to serve and store every page.
+
+    Yields:
+        list: The 'data' records of each page.
+
+    Raises:
+        IncompleteListingError: If a page could not be retrieved.
+    """
+    page = 1
+    total_pages = None
+    with open(ndjson_path, "w") as outfile:
+        try:
+            async for page, total_pages, body in iter_pages_async(url, params, concurrency, cache=cache):
+                for item in body["data"]:
+                    outfile.write(json.dumps(item) + "\n")
+                outfile.flush()
+                if page == 1:
+                    print(f"Page 1 retrieved successfully. Total pages: {total_pages}")
+                yield body["data"]
+                page += 1
+        except aiohttp.ClientResponseError as http_err:
+            print(f"HTTP error occurred on page {page}: {http_err.message} - Status code: {http_err.status}")
+            # the records of the preceding pages are already in the NDJSON file
+            raise IncompleteListingError(url, [], page - 1, total_pages, http_err) from http_err
+        except Exception as err:
+            print(f"An error occurred on page {page}: {err}")
+            raise IncompleteListingError(url, [], page - 1, total_pages, err) from err
+    print(f"Records from {url} streamed to {ndjson_path}")
+
+
+class BatchWriter:
+    """
+    Writes fixed-schema rows to a CSV file in bounded batches.
+
+    Args:
+        path (str): Path of the CSV file, overwritten when the writer is opened.
+        columns (list): The columns of the file, in order.
+        batch_size (int, optional): Number of rows buffered before they are written and flushed. Defaults to 10000.
+    """
+
+    def __init__(self, path, columns, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._batch = []
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, restval="", extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, row):
+        """Buffers a row, writing the batch once it is full."""
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes and flushes the buffered rows."""
+        self._writer.writerows(self._batch)
+        self._file.flush()
+        self.rows_written += len(self._batch)
+        self._batch = []
+
+    def close(self):
+        """Writes the last rows and closes the file."""
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def stream_biome_summaries_async(biome_name, experiment_types, output_dir='../outputs',
+                                      concurrency=DEFAULT_CONCURRENCY, cache=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Asynchronous core of stream_biome_summaries.
+
+    Returns:
+        dict: Maps each experiment type to the path of its summary CSV file.
+    """
+    slug = biome_slug(biome_name)
+
+    # the studies of a biome are few compared to its analyses: their flattened rows are kept for the join
+    # of every experiment type, so they are streamed once per biome
+    studies = {}
+    studies_path = os.path.join(output_dir, f"mgnify_studies_{slug}.ndjson")
+    async for records in stream_listing_async(f"{MGNIFY_API_URL}/studies", {"biome_name": biome_name}, studies_path,
+                                              concurrency, cache):
+        for row in flatten_studies(records):
+            studies[row['study_id']] = row
+
+    summary_paths = {}
+    for experiment_type in experiment_types:
+        print(f"Processing experiment type: {experiment_type}")
+        analyses_params = {"biome_name": biome_name, "lineage": biome_name, "experiment_type": experiment_type}
+        analyses_path = os.path.join(output_dir, f"mgnify_analyses_{slug}_{experiment_type}.ndjson")
+        summary_path = os.path.join(output_dir, f"{slug}_{experiment_type}_summary.csv")
+        with BatchWriter(summary_path, SUMMARY_COLUMNS, batch_size) as writer:
+            async for records in stream_listing_async(f"{MGNIFY_API_URL}/analyses", analyses_params, analyses_path,
+                                                      concurrency, cache):
+                for row in flatten_analyses(records):
+                    study = studies.get(row['study_id'])
+                    if study:
+                        row = {**study, **row}
+                    writer.write(row)
+        print(f"Summary of {writer.rows_written} analyses for {biome_name} {experiment_type} saved to {summary_path}")
+        summary_paths[experiment_type] = summary_path
+    return summary_paths
+
+
+def stream_biome_summaries(biome_name, experiment_types, output_dir='../outputs',
+                           concurrency=DEFAULT_CONCURRENCY, cache=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streaming counterpart of get_studies_and_analyses_summaries for one biome, keeping the memory flat.
+
+    The studies of the biome are streamed once and joined to the analyses of every experiment type.
+    Pages are processed one at a time: raw records are appended to 'mgnify_studies_{biome}.ndjson' and
+    'mgnify_analyses_{biome}_{experiment_type}.ndjson', flattened by generators into the fixed summary schema
+    (the same columns as the merged DataFrame) and written to '{biome}_{experiment_type}_summary.csv' in
+    bounded row batches. Only one window of pages, one batch of rows and the flattened studies are held in memory.
+
+    Args:
+        biome_name (str): The name of the biome to filter studies and analyses.
+        experiment_types (list): The types of experiment to filter analyses.
+        output_dir (str, optional): The directory where the NDJSON and CSV files will be saved. Defaults to '../outputs'.
+        concurrency (int, optional): Maximum number of pages requested at the same time. Defaults to 8.
+        cache (HTTPCache, optional): On-disk cache used for every page.
+        batch_size (int, optional): Number of summary rows written at once. Defaults to 10000.
+
+    Returns:
+        dict: Maps each experiment type to the path of its summary CSV file.
+
+    Raises:
+        IncompleteListingError: If a page of a listing could not be retrieved.
+    """
+    return asyncio.run(stream_biome_summaries_async(biome_name, experiment_types, output_dir, concurrency, cache, batch_size))
+
+
+def append_csv(source_path, destination_path):
+    """
+    Appends a CSV file to another one, writing the header only if the destination does not exist yet.
+
+    Args:
+        source_path (str): The CSV file to append.
+        destination_path (str): The CSV file to extend.
+    """
+    write_header = not os.path.exists(destination_path)
+    with open(source_path, "r") as source, open(destination_path, "a") as destination:
+        header = source.readline()
+        if write_header:
+            destination.write(header)
+        shutil.copyfileobj(source, destination)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+""" This python script contains the processing of the summaries with pandas: exploration, feature engineering, deduplication and ID extraction.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+# (pandas and numpy only: the steps on the summaries do not load the HTTP clients of the MGnify API)
+import os
+import numpy as np
+import pandas as pd
+from metrics import timed
+
+
+@timed()
+def explore_dataset(dataset):
+    """
+    Explores the given dataset by printing out statistics and information related to its composition.
+    This includes the total number of unique studies, the distribution of unique assembly run IDs per study,
+    the presence of missing values across variables, and the median number of samples per biome.
+
+    Args:
+        dataset (pd.DataFrame): The dataset to be explored. It must contain the columns 'study_id',
+                                'assembly_run_id', 'biomes', and 'n_samples' among others.
+
+    Note:
+        The function assumes 'combined_df' is the dataset passed through the 'dataset' argument for some print statements.
+        Replace 'combined_df' with 'dataset' in the actual implementation if 'combined_df' is a typo.
+    """
+
+    print("\nTotal number of unique studies")
+    print(dataset['study_id'].nunique())
+    print('\033[92m' + "-" * 25 + '\033[0m')
+
+    print("\nNumber of unique assembly_run_id per study_id")
+    print(dataset.groupby('study_id')['assembly_run_id'].nunique())
+    print('\033[92m' + "-" * 25 + '\033[0m')
+
+    # missing data
+    print("\nMissing values per variable")
+    print(dataset.isnull().sum())
+    any_missing_data = dataset.isnull().values.any()
+    print(f"Are there any missing data in the dataframe? {'yes' if any_missing_data else 'no'}")
+    print('\033[92m' + "-" * 25 + '\033[0m')
+
+    print("\nNumber of samples per biome (median)")
+    print(dataset.groupby('biomes', observed=True)['n_samples'].median().reset_index())
+    print('\033[92m' + "-" * 25 + '\033[0m')
+
+    experiment_type_counts = dataset["experiment_type"].value_counts()
+    biomes_counts = dataset["biomes"].value_counts()
+    print('\033[92m' + "-" * 25 + '\033[0m')
+    
+    print("\nDistribuzione di experiment_type:")
+    print(experiment_type_counts)
+
+    print("\nDistribuzione di biomes:")
+    print(biomes_counts)
+    print('\033[92m' + "-" * 25 + '\033[0m')
+
+
+
+@timed()
+def feature_engineering(dataframe):
+    """
+    Performs feature engineering on the provided dataframe. It includes mapping pipeline versions
+    to a simplified numerical scale, extracting initials from the 'assembly_run_id', and concatenating
+    multiple identifiers into a single 'concatenated_ids' column.
+    
+    The function does the following transformations:
+    - Maps 'pipeline_version' to 'pipeline_mapped' using a predefined version mapping for simplification.
+    - Extracts the first three characters from 'assembly_run_id' and stores them in 'initials_run'.
+    - Concatenates 'study_id', 'sample_id', 'assembly_run_id', and 'bioproject' into a new 'concatenated_ids' column.
+
+    Args:
+        dataframe (pd.DataFrame): The input dataframe to process. It must contain the columns 'pipeline_version',
+                                  'assembly_run_id', 'study_id', 'sample_id', and 'bioproject'.
+
+    Returns:
+        pd.DataFrame: The dataframe with added features based on the original data.
+    """
+
+    version_mapping = {1.0: 1, 2.0: 2, 3.0: 3, 4.0: 4, 4.1: 5, 5.0: 6}
+    dataframe['pipeline_mapped'] = dataframe['pipeline_version'].map(version_mapping)
+
+    # extract the first three characters
+    dataframe['initials_run'] = dataframe['assembly_run_id'].str[:3]
+
+    # build every identifier in one pass (one string per row, no intermediate Series); NaN if any part is missing
+    id_columns = ['study_id', 'sample_id', 'assembly_run_id', 'bioproject']
+    concatenated_ids = pd.Series([f"{study}_{sample}_{run}_{project}" for study, sample, run, project
+                                  in zip(*(dataframe[column].to_numpy() for column in id_columns))],
+                                 index=dataframe.index, dtype=object)
+    missing = dataframe[id_columns].isna().any(axis=1).to_numpy()
+    if missing.any():
+        concatenated_ids[missing] = np.nan
+    dataframe['concatenated_ids'] = concatenated_ids
+
+    return dataframe
+
+
+
+@timed()
+def removing_duplicates(dataframe):
+    """
+    Removes duplicate rows from the dataframe based on the 'concatenated_ids' column.
+    Among duplicates, it retains only the row with the highest value in the 'pipeline_mapped' column.
+    
+    The rows are stable-sorted once by 'pipeline_mapped' in descending order and the first row of each
+    'concatenated_ids' value is kept, effectively removing duplicates with lower 'pipeline_mapped' values
+    (on ties the earliest row wins). Rows without duplicates are preserved as is, rows without an ID are dropped,
+    and the kept rows stay in their original order.
+
+    Args:
+        dataframe (pd.DataFrame): The dataframe to process. It must contain the columns 'concatenated_ids' and 'pipeline_mapped'.
+
+    Returns:
+        pd.DataFrame: A dataframe with duplicates removed based on the above criteria.
+    """
+
+    ids = dataframe['concatenated_ids']
+    valid_positions = np.flatnonzero(ids.notna().to_numpy())
+    codes, uniques = pd.factorize(ids.iloc[valid_positions])
+
+    duplicates = int((np.bincount(codes, minlength=len(uniques)) > 1).sum())
+    print(f"Number of duplicates in the dataset: {duplicates}")
+
+    # a single stable sort puts the highest 'pipeline_mapped' of each ID first, then the first row per ID is kept
+    pipeline = dataframe['pipeline_mapped'].iloc[valid_positions].reset_index(drop=True)
+    order = pipeline.sort_values(ascending=False, kind='stable', na_position='last').index.to_numpy()
+    first_in_order = ~pd.Series(codes[order]).duplicated().to_numpy()
+    kept_positions = np.sort(valid_positions[order[first_in_order]])
+
+    # Return the DataFrame with duplicates removed
+    return dataframe.iloc[kept_positions].reset_index(drop=True)
+
+
+@timed()
+def save_filtered_ids_to_file(dataframe, output_column, filter_column, filter_value, output_path):
+    """
+    Filters a DataFrame for rows where filter_column equals filter_value,
+    extracts values from output_column of those rows, and saves them to a file.
+
+    Parameters:
+    - dataframe: pd.DataFrame, the DataFrame to filter, or the path of a Parquet file (e.g. deduplicated.parquet):
+      only output_column is read, and the filter is pushed down to the Parquet reader.
+    - filter_column: str, the name of the column to apply the filter on.
+    - filter_value: str, the value to filter rows by in the filter_column.
+    - output_column: str, the name of the column from which to extract values.
+    - output_file_path: str, the path to the file where the output will be saved.
+
+    Returns:
+    - None, but saves a file at output_file_path with one value per line from the output_column.
+    """
+
+    if isinstance(dataframe, str):
+        # the row groups excluded by the statistics of the filter are never read, and only the output column is decoded
+        filtered_df = pd.read_parquet(dataframe, columns=[output_column], filters=[(filter_column, '==', filter_value)])
+    else:
+        filtered_df = dataframe[dataframe[filter_column] == filter_value]
+
+    output_values = filtered_df[output_column].tolist()
+
+    with open(os.path.join(output_path, 'assembly_run_ids.txt' ), 'w') as file:
+        for value in output_values:
+            file.write(f"{value}\n")
+
+    print(f"Saved {output_column} to {output_path}")
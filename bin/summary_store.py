@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+""" This python script contains the columnar store (partitioned Parquet dataset) of the summaries of studies and analyses.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import os
+import urllib.parse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from chunked import SUMMARY_DTYPES, read_summary_chunks
+from metrics import timed
+
+# every summary is written once, to 'summaries/biome=<biome>/experiment_type=<experiment type>/part-0.parquet'
+STORE_NAME = 'summaries'
+PARTITION_KEYS = ['biome', 'experiment_type']
+PART_NAME = 'part-0.parquet'
+
+# arrow types of the summary columns: the categoricals of SUMMARY_DTYPES are dictionary encoded, so each
+# distinct string is stored once per column chunk and read back as a pandas categorical
+ARROW_TYPES = {'object': pa.string(), 'category': pa.dictionary(pa.int32(), pa.string()),
+               'float64': pa.float64(), 'float32': pa.float32()}
+COLUMN_TYPES = {column: ARROW_TYPES[dtype] for column, dtype in SUMMARY_DTYPES.items()}
+# the columns added by feature_engineering, stored with the deduplicated rows
+COLUMN_TYPES.update({'pipeline_mapped': pa.float64(),
+                     'initials_run': pa.dictionary(pa.int32(), pa.string()),
+                     'concatenated_ids': pa.string()})
+
+
+def partition_directory(store_path, biome_name, experiment_type):
+    """Returns the directory of the summary of a biome and experiment type (the values are URI encoded, as read by pyarrow)."""
+    return os.path.join(store_path, f"biome={urllib.parse.quote(biome_name, safe='')}",
+                        f"experiment_type={urllib.parse.quote(experiment_type, safe='')}")
+
+
+def summary_schema(columns):
+    """Returns the arrow schema of the given columns (the columns unknown to COLUMN_TYPES are stored as strings)."""
+    return pa.schema([(column, COLUMN_TYPES.get(column, pa.string())) for column in columns])
+
+
+def summary_table(dataframe, schema):
+    """
+    Converts a summary DataFrame to an arrow table with the given schema.
+
+    Empty strings become nulls, like in the CSV files read back by pandas, so that feature_engineering and
+    removing_duplicates see the same missing identifiers whatever the format.
+    """
+    dataframe = dataframe[schema.names].copy()
+    for field in schema:
+        if pa.types.is_string(field.type) or pa.types.is_dictionary(field.type):
+            values = dataframe[field.name].astype(object)
+            dataframe[field.name] = values.where(values.notna() & (values != ''), None)
+        else:
+            dataframe[field.name] = pd.to_numeric(dataframe[field.name], errors='coerce')
+    return pa.Table.from_pandas(dataframe, schema=schema, preserve_index=False)
+
+
+class SummaryWriter:
+    """
+    Writes summary DataFrames to one Parquet file, batch by batch, with a fixed schema.
+
+    Args:
+        path (str): The Parquet file to write (replaced when the writer is closed).
+        columns (list): The columns written, in order.
+    """
+
+    def __init__(self, path, columns):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.schema = summary_schema(columns)
+        self.rows = 0
+        # written next to the final file and renamed at the end, so that readers never see half a file
+        # (hidden files are skipped by the dataset discovery, so a leftover of a crash is never read)
+        directory, name = os.path.split(path)
+        self._tmp_path = os.path.join(directory, f".{name}.tmp")
+        self._writer = pq.ParquetWriter(self._tmp_path, self.schema)
+
+    def write(self, dataframe):
+        """Appends the rows of a DataFrame (one or more row groups)."""
+        if len(dataframe):
+            self._writer.write_table(summary_table(dataframe, self.schema))
+            self.rows += len(dataframe)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            os.remove(self._tmp_path)
+
+
+def _summary_columns(dataframe):
+    # experiment_type is a partition key: it is not repeated inside the files
+    return [column for column in SUMMARY_DTYPES if column != 'experiment_type' and column in dataframe.columns]
+
+
+@timed()
+def write_summary(dataframe, store_path, biome_name, experiment_type):
+    """
+    Writes the summary of a biome and experiment type to its partition of the store, replacing the previous one.
+
+    Args:
+        dataframe (pd.DataFrame): The summary returned by summarize_records (or read from its CSV file).
+        store_path (str): The directory of the store (e.g. '../outputs/summaries').
+        biome_name (str): The biome of the summary, e.g. 'root:Engineered:Wastewater'.
+        experiment_type (str): The experiment type of the summary, e.g. 'metagenomic'.
+
+    Returns:
+        str: The path of the written Parquet file.
+    """
+    path = os.path.join(partition_directory(store_path, biome_name, experiment_type), PART_NAME)
+    with SummaryWriter(path, _summary_columns(dataframe)) as writer:
+        writer.write(dataframe)
+    return path
+
+
+@timed()
+def write_summary_csv(csv_path, store_path, biome_name, experiment_type, chunksize=200000):
+    """
+    Copies a summary CSV file (e.g. written by the streaming ingestion) to its partition of the store, in row batches.
+
+    Returns:
+        str: The path of the written Parquet file.
+    """
+    path = os.path.join(partition_directory(store_path, biome_name, experiment_type), PART_NAME)
+    writer = None
+    for chunk in read_summary_chunks(csv_path, chunksize):
+        if writer is None:
+            writer = SummaryWriter(path, _summary_columns(chunk))
+        writer.write(chunk)
+    if writer is None:
+        # no rows: an empty partition keeps the biome and experiment type visible in the store
+        writer = SummaryWriter(path, [column for column in SUMMARY_DTYPES if column != 'experiment_type'])
+    writer.close()
+    return path
+
+
+def open_store(store_path, biome_names=None, experiment_types=None):
+    """
+    Opens the store as an arrow dataset, optionally restricted to some partitions.
+
+    The partitions are selected from the directory names, so the files of the other biomes and experiment
+    types are never opened.
+
+    Args:
+        store_path (str): The directory of the store, or the path of a single Parquet file.
+        biome_names (list, optional): Only these biomes. Defaults to None (all).
+        experiment_types (list, optional): Only these experiment types. Defaults to None (all).
+
+    Returns:
+        pyarrow.dataset.Dataset: The dataset, with 'biome' and 'experiment_type' as dictionary columns.
+
+    Raises:
+        ValueError: If no partition matches the selection.
+    """
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+    dataset = ds.dataset(store_path, format='parquet', partitioning=partitioning)
+    if biome_names is None and experiment_types is None:
+        return dataset
+    selection = None
+    for key, values in zip(PARTITION_KEYS, (biome_names, experiment_types)):
+        if values is not None:
+            condition = ds.field(key).isin(list(values))
+            selection = condition if selection is None else selection & condition
+    files = [fragment.path for fragment in dataset.get_fragments(filter=selection)]
+    if not files:
+        raise ValueError(f"No summaries in {store_path} for biomes {biome_names} and experiment types {experiment_types}")
+    return ds.dataset(files, format='parquet', partitioning=partitioning, partition_base_dir=store_path)
+
+
+def store_columns(dataset, columns=None):
+    """Returns the requested columns, or the summary columns of the dataset in the order of the CSV files."""
+    if columns is not None:
+        return list(columns)
+    names = dataset.schema.names
+    return [column for column in SUMMARY_DTYPES if column in names] + \
+           [column for column in names if column not in SUMMARY_DTYPES and column not in PARTITION_KEYS]
+
+
+@timed()
+def read_summaries(store_path, columns=None, biome_names=None, experiment_types=None):
+    """
+    Reads the summaries of the store into one DataFrame, in the order of the partitions (sorted by biome,
+    then experiment type).
+
+    Args:
+        store_path (str): The directory of the store, or a Parquet file (e.g. the deduplicated rows).
+        columns (list, optional): Only read these columns. Defaults to the summary columns.
+        biome_names (list, optional): Only these biomes. Defaults to None (all).
+        experiment_types (list, optional): Only these experiment types. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame: The rows, with the dictionary columns as categoricals.
+    """
+    dataset = open_store(store_path, biome_names, experiment_types)
+    return dataset.to_table(columns=store_columns(dataset, columns)).to_pandas()
+
+
+def iter_summary_batches(store_path, batch_size, columns=None):
+    """
+    Reads the summaries of the store in batches of at most `batch_size` rows, in the order of read_summaries.
+
+    Args:
+        store_path (str or pyarrow.dataset.Dataset): The store, a Parquet file, or a dataset returned by open_store.
+        batch_size (int): Largest number of rows per batch.
+        columns (list, optional): Only read these columns. Defaults to the summary columns.
+
+    Yields:
+        pd.DataFrame: The next batch of rows.
+    """
+    dataset = store_path if isinstance(store_path, ds.Dataset) else open_store(store_path)
+    for batch in dataset.to_batches(columns=store_columns(dataset, columns), batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+@timed()
+def export_csv(store_path, csv_path, chunksize=200000, columns=None):
+    """
+    Exports the summaries of the store (or a Parquet file) to one CSV file, batch by batch (optional CSV output).
+
+    Args:
+        store_path (str or pyarrow.dataset.Dataset): The store, a Parquet file, or a dataset returned by open_store.
+        csv_path (str): The CSV file written (e.g. '../outputs/combined_dataframe.csv').
+        chunksize (int, optional): Largest number of rows per batch. Defaults to 200000.
+        columns (list, optional): Only export these columns. Defaults to the summary columns.
+
+    Returns:
+        int: The number of exported rows.
+    """
+    rows = 0
+    header = True
+    for batch in iter_summary_batches(store_path, chunksize, columns):
+        if header or len(batch):
+            batch.to_csv(csv_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+        rows += len(batch)
+    if header:
+        # no row group at all: the file still gets its header
+        dataset = store_path if isinstance(store_path, ds.Dataset) else open_store(store_path)
+        pd.DataFrame(columns=store_columns(dataset, columns)).to_csv(csv_path, index=False)
+    print(f"Exported {rows} rows to {csv_path}")
+    return rows
+
+def is_parquet(path):
+    """Tells whether a path is a Parquet file, a store directory or a dataset opened by open_store."""
+    return isinstance(path, ds.Dataset) or (isinstance(path, str) and (path.endswith('.parquet') or os.path.isdir(path)))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+""" This python script contains the sparse, lineage-indexed loader of MGnify taxonomy abundance tables.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nf-retrieve_info_mgnify", "taxonomy")
+CACHE_VERSION = 1
+
+# depth of each rank in the trie: 'Root' is the first component of every lineage, then k__, p__, ... s__
+RANKS = ('root', 'kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species')
+
+
+def rank_depth(rank):
+    """Returns the trie depth of a rank name ('phylum') or prefix ('p' or 'p__')."""
+    if rank in RANKS:
+        return RANKS.index(rank) + 1
+    prefix = rank.rstrip('_')
+    for depth, name in enumerate(RANKS[1:], start=2):
+        if name[0] == prefix:
+            return depth
+    raise ValueError(f"Unknown rank: {rank}")
+
+
+class LineageTrie:
+    """
+    Interns 'Root;k__...;s__' lineage strings as the paths of a trie with one level per rank.
+
+    Node 0 is the (unnamed) top of the trie and every component of a lineage is a node one level below
+    the previous one, so 'Root' has depth 1 and the species depth 8. Empty components such as 'o__' are
+    kept as nodes: they mean 'unassigned at this rank' and group their rows apart from assigned ones.
+    Nodes are numbered in creation order, so a parent always has a smaller id than its children.
+    """
+
+    def __init__(self, names=None, parents=None):
+        self.names = list(names) if names is not None else ['']
+        self.parents = list(parents) if parents is not None else [-1]
+        self._children = {(parent, name): node for node, (parent, name) in enumerate(zip(self.parents, self.names)) if node}
+        self._depths = None
+        self._ancestors = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, lineage):
+        """Returns the node of a lineage string, creating the missing nodes of its path."""
+        node = 0
+        for name in lineage.split(';'):
+            child = self._children.get((node, name))
+            if child is None:
+                child = len(self.names)
+                self.names.append(name)
+                self.parents.append(node)
+                self._children[(node, name)] = child
+                self._depths = self._ancestors = None
+            node = child
+        return node
+
+    def lineage(self, node):
+        """Returns the lineage string of a node."""
+        names = []
+        while node > 0:
+            names.append(self.names[node])
+            node = self.parents[node]
+        return ';'.join(reversed(names))
+
+    @property
+    def depths(self):
+        """np.ndarray: The depth of every node."""
+        if self._depths is None:
+            parents = np.asarray(self.parents, dtype=np.int32)
+            depths = np.zeros(len(parents), dtype=np.int8)
+            for node in range(1, len(parents)):  # parents come before their children
+                depths[node] = depths[parents[node]] + 1
+            self._depths = depths
+        return self._depths
+
+    @property
+    def ancestors(self):
+        """np.ndarray: ancestors[node, depth] is the ancestor of a node at a depth (the node itself at its own depth), -1 above it."""
+        if self._ancestors is None:
+            parents = np.asarray(self.parents, dtype=np.int32)
+            depths = self.depths
+            ancestors = np.full((len(parents), int(depths.max()) + 1), -1, dtype=np.int32)
+            ancestors[0, 0] = 0
+            for depth in range(1, ancestors.shape[1]):
+                nodes = np.flatnonzero(depths == depth)
+                ancestors[nodes] = ancestors[parents[nodes]]
+                ancestors[nodes, depth] = nodes
+            self._ancestors = ancestors
+        return self._ancestors
+
+
+class TaxonomyTable:
+    """
+    Abundance table stored as a sparse matrix: one row per lineage (a trie node), one column per run.
+
+    Args:
+        matrix (scipy.sparse.csr_matrix): Abundances, lineages x runs.
+        run_ids (list): The run ID of each column.
+        trie (LineageTrie): The trie holding the lineages.
+        row_nodes (np.ndarray): The trie node of each row.
+    """
+
+    def __init__(self, matrix, run_ids, trie, row_nodes):
+        self.matrix = matrix
+        self.run_ids = list(run_ids)
+        self.trie = trie
+        self.row_nodes = np.asarray(row_nodes)
+        self._run_positions = None
+        self._csc = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def lineages(self):
+        """list: The lineage string of each row."""
+        return [self.trie.lineage(node) for node in self.row_nodes]
+
+    def run_position(self, run_id):
+        """Returns the column of a run ID."""
+        if self._run_positions is None:
+            self._run_positions = {run_id: position for position, run_id in enumerate(self.run_ids)}
+        return self._run_positions[run_id]
+
+    def column(self, run_id):
+        """
+        Returns the non-zero abundances of one run.
+
+        Returns:
+            pd.Series: Abundances indexed by lineage.
+        """
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        position = self.run_position(run_id)
+        start, end = self._csc.indptr[position], self._csc.indptr[position + 1]
+        rows = self._csc.indices[start:end]
+        return pd.Series(self._csc.data[start:end], index=[self.trie.lineage(node) for node in self.row_nodes[rows]],
+                         name=run_id)
+
+    def run_totals(self):
+        """Returns the total abundance of each run as a Series indexed by run ID."""
+        return pd.Series(np.asarray(self.matrix.sum(axis=0)).ravel(), index=self.run_ids)
+
+    def run_ids_with_reads(self, min_total=1):
+        """Returns the run IDs whose total abundance is at least `min_total`."""
+        totals = np.asarray(self.matrix.sum(axis=0)).ravel()
+        return [self.run_ids[position] for position in np.flatnonzero(totals >= min_total)]
+
+    def rollup(self, rank):
+        """
+        Sums the abundances of every lineage up to a rank.
+
+        Each row is mapped to its ancestor at the rank through the trie and the rows are summed with one
+        sparse product. Rows whose lineage stops above the rank (e.g. 'Root' alone at phylum level) are left out.
+
+        Args:
+            rank (str): A rank name ('phylum') or prefix ('p__').
+
+        Returns:
+            TaxonomyTable: One row per lineage at that rank, in trie order.
+        """
+        depth = rank_depth(rank)
+        ancestors = self.trie.ancestors
+        groups = ancestors[self.row_nodes, depth] if depth < ancestors.shape[1] else np.full(len(self.row_nodes), -1)
+        rows = np.flatnonzero(groups >= 0)
+        group_nodes, group_of_row = np.unique(groups[rows], return_inverse=True)
+        indicator = sparse.csr_matrix((np.ones(len(rows), dtype=self.matrix.dtype), (group_of_row, rows)),
+                                      shape=(len(group_nodes), self.matrix.shape[0]))
+        return TaxonomyTable((indicator @ self.matrix).tocsr(), self.run_ids, self.trie, group_nodes)
+
+    def to_dataframe(self):
+        """Returns the table as a sparse DataFrame laid out like the TSV file (lineages x runs)."""
+        dataframe = pd.DataFrame.sparse.from_spmatrix(self.matrix, index=self.lineages, columns=self.run_ids)
+        dataframe.index.name = '#SampleID'
+        return dataframe
+
+    def save(self, cache_path, source_stat=None):
+        """
+        Writes the table as a directory of raw .npy arrays (memory-mappable) and JSON string lists.
+
+        Args:
+            cache_path (str): The cache directory, replaced if it exists.
+            source_stat (os.stat_result, optional): Stat of the source TSV, stored to detect when it changes.
+        """
+        tmp_path = cache_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in (('data', self.matrix.data), ('indices', self.matrix.indices), ('indptr', self.matrix.indptr),
+                            ('row_nodes', self.row_nodes), ('parents', np.asarray(self.trie.parents, dtype=np.int32))):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "strings.json"), "w") as file:
+            json.dump({"run_ids": self.run_ids, "names": self.trie.names}, file)
+        meta = {"version": CACHE_VERSION, "shape": list(self.matrix.shape)}
+        if source_stat is not None:
+            meta.update(source_size=source_stat.st_size, source_mtime=source_stat.st_mtime_ns)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+            json.dump(meta, file)
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load(cls, cache_path):
+        """Opens a table written by save, memory-mapping its arrays (they are read from disk only when used)."""
+        with open(os.path.join(cache_path, "meta.json")) as file:
+            meta = json.load(file)
+        with open(os.path.join(cache_path, "strings.json")) as file:
+            strings = json.load(file)
+        arrays = {name: np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode='r')
+                  for name in ('data', 'indices', 'indptr', 'row_nodes', 'parents')}
+        matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(meta['shape']), copy=False)
+        trie = LineageTrie(strings['names'], arrays['parents'].tolist())
+        return cls(matrix, strings['run_ids'], trie, arrays['row_nodes'])
+
+
+def read_run_ids(path):
+    """Returns the run IDs of a taxonomy abundance TSV, reading only its header line."""
+    with open(path) as file:
+        return file.readline().rstrip('\n').split('\t')[1:]
+
+
+def parse_taxonomy_tsv(path, dtype=np.float64):
+    """
+    Streams a taxonomy abundance TSV into a TaxonomyTable, one line at a time.
+
+    Only the non-zero values of each line are kept, so the memory grows with the number of non-zero
+    abundances and never holds the dense table.
+
+    Args:
+        path (str): The TSV file ('#SampleID' or lineage first column, one column per run).
+        dtype (np.dtype, optional): Type of the abundances. Defaults to float64.
+
+    Returns:
+        TaxonomyTable: The parsed table.
+    """
+    trie = LineageTrie()
+    row_nodes, indices, data, indptr = [], [], [], [0]
+    with open(path) as file:
+        run_ids = file.readline().rstrip('\n').split('\t')[1:]
+        for line_number, line in enumerate(file, start=2):
+            values = line.rstrip('\n').split('\t')
+            lineage = values[0]
+            if not lineage:
+                continue
+            if len(values) - 1 != len(run_ids):
+                raise ValueError(f"{path}, line {line_number}: {len(values) - 1} values for {len(run_ids)} runs")
+            # most values are '0': only the other ones are converted
+            columns = np.array([column for column, value in enumerate(values[1:]) if value != '0'], dtype=np.int32)
+            row = np.array([values[column + 1] for column in columns], dtype=dtype)
+            nonzero = np.flatnonzero(row)
+            indices.append(columns[nonzero])
+            data.append(row[nonzero])
+            indptr.append(indptr[-1] + len(nonzero))
+            row_nodes.append(trie.intern(lineage))
+
+    matrix = sparse.csr_matrix((np.concatenate(data) if data else np.zeros(0, dtype=dtype),
+                                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                                np.asarray(indptr, dtype=np.int64)), shape=(len(row_nodes), len(run_ids)))
+    return TaxonomyTable(matrix, run_ids, trie, np.asarray(row_nodes, dtype=np.int32))
+
+
+def cache_path_for(path, cache_dir=DEFAULT_CACHE_DIR):
+    """Returns the cache directory of a TSV file, named after its absolute path."""
+    digest = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(path)}.{digest}")
+
+
+def load_taxonomy_table(path, cache_dir=DEFAULT_CACHE_DIR, dtype=np.float64):
+    """
+    Loads a taxonomy abundance TSV, from the binary cache when it is up to date with the file.
+
+    The first load parses the TSV (parse_taxonomy_tsv) and writes the cache; the next ones memory-map it,
+    which takes a few milliseconds whatever the size of the table. The cache is rebuilt when the size or
+    the modification time of the TSV changes.
+
+    Args:
+        path (str): The TSV file.
+        cache_dir (str, optional): Directory of the cache, or None to always parse the TSV.
+                                   Defaults to ~/.cache/nf-retrieve_info_mgnify/taxonomy.
+        dtype (np.dtype, optional): Type of the abundances when parsing. Defaults to float64.
+
+    Returns:
+        TaxonomyTable: The table.
+    """
+    if cache_dir is None:
+        return parse_taxonomy_tsv(path, dtype)
+
+    stat = os.stat(path)
+    cache_path = cache_path_for(path, cache_dir)
+    try:
+        with open(os.path.join(cache_path, "meta.json")) as file:
+            meta = json.load(file)
+        if (meta.get("version"), meta.get("source_size"), meta.get("source_mtime")) == (CACHE_VERSION, stat.st_size, stat.st_mtime_ns):
+            return TaxonomyTable.load(cache_path)
+    except (OSError, ValueError):
+        pass
+
+    table = parse_taxonomy_tsv(path, dtype)
+    os.makedirs(cache_dir, exist_ok=True)
+    table.save(cache_path, stat)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracts the run IDs of a MGnify taxonomy abundance table.")
+    parser.add_argument("--input_file", required=True, help="taxonomy abundance TSV")
+    parser.add_argument("--output_name", default="IDs.txt", help="name of the file listing one run ID per line")
+    parser.add_argument("--output_directory", default=".")
+    parser.add_argument("--min_reads", type=float, default=0, help="keep only the runs with at least this many reads")
+    args = parser.parse_args()
+
+    if args.min_reads > 0:
+        run_ids = load_taxonomy_table(args.input_file).run_ids_with_reads(args.min_reads)
+    else:
+        run_ids = read_run_ids(args.input_file)
+
+    os.makedirs(args.output_directory, exist_ok=True)
+    output_path = os.path.join(args.output_directory, args.output_name)
+    with open(output_path, "w") as file:
+        file.write("\n".join(run_ids) + "\n")
+    print(f"{len(run_ids)} run IDs saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,797 @@
+#!/usr/bin/env python
+
+""" This python script contains the transfer of FASTQ files from the ENA FTP server to Azure Blob Storage.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import contextlib
+import math
+import os
+from ftplib import error_perm, error_temp
+import posixpath
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from ena_ftp import ftp_connect, resolve_fastq_files
+import metrics
+from transfer_journal import IN_PROGRESS
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024    # bytes staged per block
+DEFAULT_BUFFERS = 8                     # blocks held in memory at most (being filled or uploaded)
+DEFAULT_UPLOAD_WORKERS = 4              # blocks staged in parallel
+FTP_READ_SIZE = 256 * 1024              # bytes read from the FTP data connection at once
+DEFAULT_CONNECTIONS = 1                 # FTP connections used to download one file (1 = single stream)
+DEFAULT_SEGMENT_THRESHOLD = 64 * 1024 * 1024   # files smaller than this are always downloaded as a single stream
+MIN_SEGMENT_BLOCKS = 2                  # smallest segment, in blocks
+MAX_SEGMENT_BLOCKS = 32                 # largest segment, in blocks
+
+
+def blob_labels(blob_client):
+    """Returns the accession and the file name of a blob named 'accession/file', used to label the metrics."""
+    accession, _, file = blob_client.blob_name.partition('/')
+    return {'accession': accession, 'file': file or accession}
+
+
+def block_id(index):
+    """Returns the id of the index-th block. All ids of a blob must have the same length (the SDK base64-encodes them)."""
+    return f"{index:08d}"
+
+
+class BlockStager:
+    """
+    Turns a byte stream into staged blocks of a block blob, without touching the local disk.
+
+    Incoming bytes are copied into buffers taken from a bounded pool. A full buffer is handed to a thread
+    pool that stages it with `stage_block` and returns it to the pool, so the download keeps filling the
+    next buffer while previous blocks are uploaded. When every buffer is in flight `write` blocks until one
+    is released, which bounds the memory to `buffers * block_size`.
+
+    Args:
+        blob_client (BlobClient): The destination blob.
+        block_size (int, optional): Size of each block in bytes. Defaults to 8 MB.
+        buffers (int, optional): Number of buffers in the pool. Defaults to 8.
+        upload_workers (int, optional): Number of blocks staged in parallel. Defaults to 4.
+        first_block (int, optional): Index of the first block, when resuming after blocks staged earlier. Defaults to 0.
+        progress (callable, optional): Called with the number of bytes staged without gaps from `first_block`
+                                       every time that number grows.
+    """
+
+    def __init__(self, blob_client, block_size=DEFAULT_BLOCK_SIZE, buffers=DEFAULT_BUFFERS,
+                 upload_workers=DEFAULT_UPLOAD_WORKERS, first_block=0, progress=None):
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self.block_ids = []
+        self.bytes_staged = 0
+        self._pool = queue.Queue()
+        for _ in range(max(buffers, 1)):
+            self._pool.put(None)  # buffers are allocated on first use
+        self._executor = ThreadPoolExecutor(max_workers=upload_workers)
+        self._futures = []
+        self._error = None
+        self._lock = threading.Lock()
+        self._next_block = first_block
+        self._buffer = None
+        self._filled = 0
+        self._progress = progress
+        self._done = {}              # index -> length of the blocks staged after a gap
+        self._contiguous = first_block
+        self._contiguous_bytes = 0
+        self._labels = blob_labels(blob_client)
+
+    def _take_buffer(self):
+        buffer = self._pool.get()
+        self._raise_if_failed()
+        return buffer if buffer is not None else bytearray(self.block_size)
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def _stage(self, index, buffer, length):
+        try:
+            if self._error is None:
+                start = time.perf_counter()
+                self.blob_client.stage_block(block_id(index), memoryview(buffer)[:length], length=length)
+                metrics.throughput("upload", length, time.perf_counter() - start, **self._labels)
+                with self._lock:
+                    self.bytes_staged += length
+                    self._done[index] = length
+                    advanced = False
+                    while self._contiguous in self._done:
+                        # the last block of a file is shorter: count the bytes, not the blocks
+                        self._contiguous_bytes += self._done.pop(self._contiguous)
+                        self._contiguous += 1
+                        advanced = True
+                    if advanced and self._progress is not None:
+                        self._progress(self._contiguous_bytes)
+        except Exception as err:
+            self._error = err
+        finally:
+            self._pool.put(buffer)
+
+    def _submit(self):
+        index = self._next_block
+        self._next_block += 1
+        self.block_ids.append(block_id(index))
+        self._futures.append(self._executor.submit(self._stage, index, self._buffer, self._filled))
+        self._buffer = None
+        self._filled = 0
+
+    def write(self, data):
+        """Appends bytes to the stream (usable as the retrbinary callback)."""
+        view = memoryview(data)
+        while view:
+            if self._buffer is None:
+                self._buffer = self._take_buffer()
+            n = min(len(view), self.block_size - self._filled)
+            self._buffer[self._filled:self._filled + n] = view[:n]
+            self._filled += n
+            view = view[n:]
+            if self._filled == self.block_size:
+                self._submit()
+
+    def flush(self):
+        """Stages the partially filled buffer, if any, and waits for every block to be staged."""
+        if self._filled:
+            self._submit()
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        self._raise_if_failed()
+
+    def close(self):
+        """
+        Stages the remaining bytes and stops the upload threads, without committing the block list.
+
+        Returns:
+            int: The number of bytes staged by this stager.
+        """
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+        return self.bytes_staged
+
+    def commit(self, staged_ids=()):
+        """
+        Stages the remaining bytes and commits the block list.
+
+        Args:
+            staged_ids (iterable, optional): Ids of the blocks staged before this stager (when resuming).
+
+        Returns:
+            int: The number of bytes staged by this stager.
+        """
+        self.close()
+        self.blob_client.commit_block_list(list(staged_ids) + self.block_ids)
+        return self.bytes_staged
+
+    def abort(self):
+        """Stops staging; uncommitted blocks are discarded by Azure after a week."""
+        self._error = self._error or RuntimeError("transfer aborted")
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def staged_prefix(blob_client, block_size):
+    """
+    Finds the blocks of an interrupted transfer that can be kept: the uncommitted blocks 0, 1, 2...
+    staged without gaps and with the full block size.
+
+    Args:
+        blob_client (BlobClient): The destination blob.
+        block_size (int): The block size used by the interrupted transfer.
+
+    Returns:
+        list: The ids of the reusable blocks, in order.
+    """
+    try:
+        _, uncommitted = blob_client.get_block_list('uncommitted')
+    except ResourceNotFoundError:
+        return []
+    sizes = {block.id: block.size for block in uncommitted}
+    staged_ids = []
+    while sizes.get(block_id(len(staged_ids))) == block_size:
+        staged_ids.append(block_id(len(staged_ids)))
+    return staged_ids
+
+
+def stream_ftp_file_to_blob(ftp, remote_path, blob_client, block_size=DEFAULT_BLOCK_SIZE, buffers=DEFAULT_BUFFERS,
+                            upload_workers=DEFAULT_UPLOAD_WORKERS, resume=False, progress=None):
+    """
+    Streams a file from a FTP server into a block blob: the `retrbinary` chunks are staged as blocks
+    in parallel while the download goes on, and the block list is committed at the end.
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection.
+        remote_path (str): Path of the file on the FTP server.
+        blob_client (BlobClient): The destination blob, overwritten when the block list is committed.
+        block_size (int, optional): Size of each block in bytes. Defaults to 8 MB.
+        buffers (int, optional): Number of in-memory buffers. Defaults to 8.
+        upload_workers (int, optional): Number of blocks staged in parallel. Defaults to 4.
+        resume (bool, optional): Keep the blocks already staged by an interrupted transfer (same block size)
+                                 and download only the rest, using a FTP REST offset. Defaults to False.
+        progress (callable, optional): Called with the number of bytes of the file safely staged.
+
+    Returns:
+        int: The number of bytes transferred by this call.
+    """
+    staged_ids = staged_prefix(blob_client, block_size) if resume else []
+    offset = len(staged_ids) * block_size
+    on_progress = (lambda staged: progress(offset + staged)) if progress else None
+    stager = BlockStager(blob_client, block_size=block_size, buffers=buffers, upload_workers=upload_workers,
+                         first_block=len(staged_ids), progress=on_progress)
+    try:
+        ftp.retrbinary('RETR ' + remote_path, stager.write, blocksize=FTP_READ_SIZE, rest=offset or None)
+    except BaseException:
+        stager.abort()
+        raise
+    return stager.commit(staged_ids)
+
+
+def staged_blocks(blob_client, block_size, size):
+    """
+    Finds every uncommitted block of an interrupted transfer that has the expected size for its position,
+    whichever order the blocks were staged in (segmented transfers stage them out of order).
+
+    Args:
+        blob_client (BlobClient): The destination blob.
+        block_size (int): The block size used by the interrupted transfer.
+        size (int): The size of the file.
+
+    Returns:
+        set: The indexes of the reusable blocks.
+    """
+    try:
+        _, uncommitted = blob_client.get_block_list('uncommitted')
+    except ResourceNotFoundError:
+        return set()
+    sizes = {block.id: block.size for block in uncommitted}
+    return {index for index in range(math.ceil(size / block_size))
+            if sizes.get(block_id(index)) == min(block_size, size - index * block_size)}
+
+
+def plan_segments(block_indexes, connections):
+    """
+    Groups the blocks to download into segments of consecutive blocks, in file order.
+
+    Segments are sized on the work left (guided scheduling): each one takes about remaining / (2 * connections)
+    blocks, between MIN_SEGMENT_BLOCKS and MAX_SEGMENT_BLOCKS. The first segments are large, to limit the number
+    of FTP requests, and the last ones small, so that the connections finish at about the same time.
+
+    Args:
+        block_indexes (list): The sorted indexes of the blocks to download.
+        connections (int): Number of connections sharing the segments.
+
+    Returns:
+        list: (first block, number of blocks) of each segment.
+    """
+    runs = []
+    for index in block_indexes:
+        if runs and runs[-1][0] + runs[-1][1] == index:
+            runs[-1][1] += 1
+        else:
+            runs.append([index, 1])
+
+    remaining = len(block_indexes)
+    segments = []
+    for first, count in runs:
+        while count:
+            target = min(MAX_SEGMENT_BLOCKS, max(MIN_SEGMENT_BLOCKS, math.ceil(remaining / (2 * connections))))
+            blocks = min(count, target)
+            segments.append((first, blocks))
+            first += blocks
+            count -= blocks
+            remaining -= blocks
+    return segments
+
+
+def download_range(ftp, remote_path, offset, length, callback, read_size=FTP_READ_SIZE):
+    """
+    Downloads `length` bytes of a file starting at `offset` (FTP REST), then closes the data connection.
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection.
+        remote_path (str): Path of the file on the FTP server.
+        offset (int): First byte to download.
+        length (int): Number of bytes to download.
+        callback (callable): Called with every chunk of data, in order.
+        read_size (int, optional): Bytes read from the data connection at once. Defaults to 256 KB.
+    """
+    ftp.voidcmd('TYPE I')
+    remaining = length
+    with ftp.transfercmd('RETR ' + remote_path, rest=offset or None) as connection:
+        while remaining:
+            data = connection.recv(min(read_size, remaining))
+            if not data:
+                break
+            callback(data)
+            remaining -= len(data)
+    try:
+        ftp.voidresp()
+    except error_temp:
+        pass  # 426/451: the data connection was closed before the end of the file, as intended
+    if remaining:
+        raise EOFError(f"{remote_path}: the server closed the data connection {remaining} bytes before the end of the segment")
+
+
+def segmented_ftp_file_to_blob(ftp, remote_path, blob_client, size, connections=4, pool=None,
+                               block_size=DEFAULT_BLOCK_SIZE, buffers=DEFAULT_BUFFERS,
+                               upload_workers=DEFAULT_UPLOAD_WORKERS, resume=False, progress=None):
+    """
+    Downloads one large file over several FTP connections at once and streams it into a block blob.
+
+    The file is split into segments of whole blocks (see plan_segments). Every connection takes the next
+    segment from a shared queue, downloads its byte range with a REST offset and stages its blocks under the
+    ids of their position in the file, so the block list committed at the end (block 0, 1, 2...) puts the
+    segments back in order without buffering them. Faster connections simply take more segments.
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection, used by the first connection.
+        remote_path (str): Path of the file on the FTP server.
+        blob_client (BlobClient): The destination blob, overwritten when the block list is committed.
+        size (int): The size of the file (FTP SIZE).
+        connections (int, optional): Number of simultaneous FTP connections. Defaults to 4.
+        pool (FTPSessionPool, optional): Pool providing the other connections. A temporary pool to the server
+                                         of `ftp` is used if None.
+        block_size (int, optional): Size of each block in bytes. Defaults to 8 MB.
+        buffers (int, optional): Number of in-memory buffers, shared out among the connections. Defaults to 8.
+        upload_workers (int, optional): Number of blocks staged in parallel, shared out among the connections. Defaults to 4.
+        resume (bool, optional): Keep every block already staged by an interrupted transfer (same block size)
+                                 and download only the missing ones. Defaults to False.
+        progress (callable, optional): Called after every segment with the end of the part of the file staged
+                                       without gaps from its first byte, and the number of bytes staged in total.
+
+    Returns:
+        int: The number of bytes transferred by this call.
+    """
+    total_blocks = max(math.ceil(size / block_size), 1)
+    staged = staged_blocks(blob_client, block_size, size) if resume else set()
+    segments = queue.Queue()
+    plan = plan_segments([index for index in range(total_blocks) if index not in staged], connections)
+    for segment in plan:
+        segments.put(segment)
+
+    done = {'staged': sum(min(block_size, size - index * block_size) for index in staged), 'moved': 0}
+    # the segments finish out of order: the blocks staged so far, and the first block not staged yet
+    staged_indexes = set(staged)
+    contiguous = [0]
+    lock = threading.Lock()
+    failed = threading.Event()
+    errors = []
+    segment_buffers = max(buffers // connections, 2)
+    segment_upload_workers = max(upload_workers // connections, 1)
+
+    def download_segments(session):
+        while not failed.is_set():
+            try:
+                first, count = segments.get_nowait()
+            except queue.Empty:
+                return
+            offset = first * block_size
+            stager = BlockStager(blob_client, block_size=block_size, buffers=segment_buffers,
+                                 upload_workers=segment_upload_workers, first_block=first)
+            try:
+                download_range(session, remote_path, offset, min(size, (first + count) * block_size) - offset, stager.write)
+            except BaseException:
+                stager.abort()
+                raise
+            moved = stager.close()
+            with lock:
+                done['moved'] += moved
+                staged_indexes.update(range(first, first + count))
+                while contiguous[0] in staged_indexes:
+                    contiguous[0] += 1
+                if progress is not None:
+                    progress(min(size, contiguous[0] * block_size), done['staged'] + done['moved'])
+
+    def run(session=None):
+        try:
+            if session is not None:
+                download_segments(session)
+            else:
+                with pool.session() as extra_session:
+                    download_segments(extra_session)
+        except BaseException as err:
+            errors.append(err)
+            failed.set()
+
+    own_pool = pool is None
+    if own_pool:
+        pool = FTPSessionPool(f"{ftp.host}:{ftp.port}", size=connections - 1)
+    threads = [threading.Thread(target=run, args=(ftp,))]
+    threads += [threading.Thread(target=run) for _ in range(min(connections, len(plan)) - 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if own_pool:
+        pool.close()
+    if errors:
+        raise errors[0]
+
+    blob_client.commit_block_list([block_id(index) for index in range(total_blocks)])
+    return done['moved']
+
+
+def transfer_file(ftp, remote_path, blob_client, local_directory=None, block_size=DEFAULT_BLOCK_SIZE,
+                  buffers=DEFAULT_BUFFERS, upload_workers=DEFAULT_UPLOAD_WORKERS, resume=False, progress=None,
+                  size=None, connections=DEFAULT_CONNECTIONS, pool=None, segment_threshold=DEFAULT_SEGMENT_THRESHOLD):
+    """
+    Copies one file from the FTP server to a blob, streaming it by default or going through a local file.
+    When streaming, files of at least `segment_threshold` bytes are downloaded over `connections` FTP
+    connections at once (see segmented_ftp_file_to_blob).
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection.
+        remote_path (str): Path of the file on the FTP server.
+        blob_client (BlobClient): The destination blob.
+        local_directory (str, optional): If given, the file is downloaded there, uploaded and removed (previous behaviour).
+        block_size (int, optional): Size of each staged block in bytes (streaming only). Defaults to 8 MB.
+        buffers (int, optional): Number of in-memory buffers (streaming only). Defaults to 8.
+        upload_workers (int, optional): Number of blocks staged in parallel (streaming only). Defaults to 4.
+        resume (bool, optional): Continue an interrupted transfer: from the staged blocks when streaming,
+                                 from the partial local file otherwise. Defaults to False.
+        progress (callable, optional): Called with the end of the part of the file staged without gaps from its first
+                                       byte, and with the bytes staged in total for segmented downloads (streaming only).
+        size (int, optional): The size of the file, needed for segmented downloads.
+        connections (int, optional): FTP connections used for a large file (streaming only). Defaults to 1.
+        pool (FTPSessionPool, optional): Pool providing the extra connections of a segmented download.
+        segment_threshold (int, optional): Smallest file downloaded over several connections. Defaults to 64 MB.
+
+    Returns:
+        int: The number of bytes downloaded by this call.
+    """
+    labels = blob_labels(blob_client)
+    start = time.perf_counter()
+    if local_directory is None:
+        # when streaming, the download also waits for the blocks being staged: its rate is the end-to-end rate
+        if connections > 1 and size is not None and size >= segment_threshold:
+            moved = segmented_ftp_file_to_blob(ftp, remote_path, blob_client, size, connections, pool, block_size,
+                                               buffers, upload_workers, resume=resume, progress=progress)
+        else:
+            moved = stream_ftp_file_to_blob(ftp, remote_path, blob_client, block_size, buffers, upload_workers,
+                                            resume=resume, progress=progress)
+        metrics.throughput("download", moved, time.perf_counter() - start, **labels)
+        return moved
+
+    local_file_path = os.path.join(local_directory, posixpath.basename(remote_path))
+    offset = os.path.getsize(local_file_path) if resume and os.path.exists(local_file_path) else 0
+    with open(local_file_path, 'ab' if offset else 'wb') as local_file:
+        ftp.retrbinary('RETR ' + remote_path, local_file.write, rest=offset or None)
+    size = os.path.getsize(local_file_path)
+    metrics.throughput("download", size - offset, time.perf_counter() - start, **labels)
+    start = time.perf_counter()
+    with open(local_file_path, "rb") as data:
+        blob_client.upload_blob(data, overwrite=True)
+    metrics.throughput("upload", size, time.perf_counter() - start, **labels)
+    os.remove(local_file_path)
+    return size - offset
+
+
+def remote_size(ftp, remote_path):
+    """Returns the size of a file on the FTP server (SIZE command), or None if the server does not tell."""
+    try:
+        ftp.voidcmd('TYPE I')
+        return ftp.size(remote_path)
+    except error_perm:
+        return None
+
+
+def blob_size(blob_client):
+    """Returns the size of an existing blob, or None if it does not exist."""
+    try:
+        return blob_client.get_blob_properties().size
+    except ResourceNotFoundError:
+        return None
+
+
+def transfer_file_resumable(ftp, accession, remote_path, blob_client, journal=None, local_directory=None,
+                            block_size=DEFAULT_BLOCK_SIZE, buffers=DEFAULT_BUFFERS, upload_workers=DEFAULT_UPLOAD_WORKERS,
+                            connections=DEFAULT_CONNECTIONS, pool=None, segment_threshold=DEFAULT_SEGMENT_THRESHOLD):
+    """
+    Transfers one file unless the blob is already complete, resuming an interrupted transfer recorded in the journal.
+
+    The remote FTP SIZE is compared with the size of the existing blob first, and the file is skipped when they
+    match. Otherwise, if the journal shows the file in progress with the same size, only the missing bytes are
+    moved (see transfer_file). The journal is updated as blocks are staged and when the blob is committed.
+
+    Args:
+        ftp (ftplib.FTP): A logged in FTP connection.
+        accession (str): The run accession the file belongs to.
+        remote_path (str): Path of the file on the FTP server.
+        blob_client (BlobClient): The destination blob.
+        journal (TransferJournal, optional): The transfer journal.
+        local_directory (str, optional): Go through a local file in this directory instead of streaming.
+        block_size (int, optional): Block size of new transfers (streaming only). Defaults to 8 MB.
+        buffers (int, optional): Number of in-memory buffers (streaming only). Defaults to 8.
+        upload_workers (int, optional): Number of blocks staged in parallel (streaming only). Defaults to 4.
+        connections (int, optional): FTP connections used for files of at least `segment_threshold` bytes. Defaults to 1.
+        pool (FTPSessionPool, optional): Pool providing the extra connections of a segmented download.
+        segment_threshold (int, optional): Smallest file downloaded over several connections. Defaults to 64 MB.
+
+    Returns:
+        int: The number of bytes downloaded (0 if the file was skipped).
+    """
+    file = posixpath.basename(remote_path)
+    with metrics.timer("transfer.check", accession=accession, file=file):
+        size = remote_size(ftp, remote_path)
+        uploaded = size is not None and blob_size(blob_client) == size
+    if uploaded:
+        if journal is not None:
+            journal.committed(accession, file, remote_path, size)
+        metrics.add("transfer.skipped_files", accession=accession, file=file)
+        print(f"{accession}/{file} is already uploaded, skipping it.")
+        return 0
+
+    entry = journal.get(accession, file) if journal is not None else None
+    resume = bool(entry and entry['state'] == IN_PROGRESS and entry['size'] == size and entry['block_size'])
+    if resume:
+        block_size = entry['block_size']
+        if entry['staged'] > entry['offset']:
+            # a segmented download stages its blocks out of order: every missing block is downloaded again
+            print(f"Resuming {accession}/{file}: {entry['staged']} of {size} bytes already staged, "
+                  f"without gaps up to byte {entry['offset']}.")
+        else:
+            print(f"Resuming {accession}/{file} from byte {entry['offset']}.")
+
+    progress = None
+    if journal is not None:
+        journal.start(accession, file, remote_path, size, block_size, offset=entry['offset'] if resume else 0,
+                      staged=entry['staged'] if resume else 0)
+        progress = lambda offset, staged=None: journal.progress(accession, file, offset, staged)
+
+    with metrics.timer("transfer.file", accession=accession, file=file, resumed=resume):
+        moved = transfer_file(ftp, remote_path, blob_client, local_directory, block_size, buffers, upload_workers,
+                              resume=resume, progress=progress, size=size, connections=connections, pool=pool,
+                              segment_threshold=segment_threshold)
+    if journal is not None:
+        journal.committed(accession, file, remote_path, size if size is not None else moved)
+    return moved
+
+
+def shared_container_client(azure_connection_string, azure_container_name, max_connections=32):
+    """
+    Builds one container client, with a HTTP connection pool large enough to be shared by every transfer thread.
+
+    Args:
+        azure_connection_string (str): Azure Storage account connection string.
+        azure_container_name (str): Name of the Azure Blob Storage container.
+        max_connections (int, optional): Size of the HTTP connection pool. Defaults to 32.
+
+    Returns:
+        ContainerClient: The container client (thread-safe).
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    blob_service_client = BlobServiceClient.from_connection_string(azure_connection_string, transport=transport)
+    return blob_service_client.get_container_client(azure_container_name)
+
+
+class FTPSessionPool:
+    """
+    Bounded pool of reusable anonymous FTP sessions.
+
+    At most `size` sessions are open at once. A session is returned to the pool after use and is
+    dropped instead if an error was raised while it was held, since it may be in an unknown state.
+
+    Args:
+        server_address (str): The FTP server, optionally as 'host:port'.
+        size (int): Maximum number of simultaneous sessions.
+    """
+
+    def __init__(self, server_address, size):
+        self.server_address = server_address
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextlib.contextmanager
+    def session(self):
+        """Context manager yielding a logged in FTP session."""
+        self._slots.acquire()
+        ftp = None
+        try:
+            try:
+                ftp = self._idle.get_nowait()
+            except queue.Empty:
+                ftp = ftp_connect(self.server_address)
+                self.connections_opened += 1
+            yield ftp
+        except BaseException:
+            if ftp is not None:
+                ftp.close()
+                ftp = None
+            raise
+        finally:
+            if ftp is not None:
+                self._idle.put(ftp)
+            self._slots.release()
+
+    def close(self):
+        """Closes every idle session."""
+        while True:
+            try:
+                ftp = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+
+class TransferScheduler:
+    """
+    Transfers the FASTQ files of many accessions concurrently, reusing FTP sessions and one blob client.
+
+    A resolver thread finds the files of each accession and puts one task per file in a bounded queue;
+    `workers` threads take the tasks, each borrowing a FTP session from the pool, so several files of
+    the same accession and several accessions are transferred at the same time.
+
+    Args:
+        server_address (str): The FTP server, optionally as 'host:port'.
+        container_client (ContainerClient): The destination container, shared by every worker.
+        workers (int, optional): Number of files transferred at the same time. Defaults to 4.
+        index (AccessionIndex, optional): Persistent index of the FTP paths already resolved.
+        local_directory (str, optional): Go through local files in this directory instead of streaming.
+        queue_size (int, optional): Maximum number of file tasks waiting in the queue. Defaults to 2 * workers.
+        upload_workers (int, optional): Number of blocks staged in parallel for each file. Defaults to 4.
+        journal (TransferJournal, optional): Journal used to skip completed files and resume interrupted ones.
+        connections (int, optional): FTP connections used by each worker for a file of at least
+                                     `segment_threshold` bytes (segmented download). Defaults to 1.
+        segment_threshold (int, optional): Smallest file downloaded over several connections. Defaults to 64 MB.
+    """
+
+    def __init__(self, server_address, container_client, workers=4, index=None, local_directory=None,
+                 queue_size=None, upload_workers=DEFAULT_UPLOAD_WORKERS, journal=None,
+                 connections=DEFAULT_CONNECTIONS, segment_threshold=DEFAULT_SEGMENT_THRESHOLD):
+        self.server_address = server_address
+        self.container_client = container_client
+        self.workers = workers
+        self.index = index
+        self.local_directory = local_directory
+        self.upload_workers = upload_workers
+        self.journal = journal
+        self.connections = connections
+        self.segment_threshold = segment_threshold
+        # every worker may hold `connections` sessions during a segmented download, the resolver one more
+        self.pool = FTPSessionPool(server_address, size=workers * connections + 1)
+        self.results = {}            # accession -> 'done', 'not found' or 'failed'
+        self.worker_stats = {}       # worker name -> {'files', 'bytes', 'seconds'}
+        self.wall_seconds = 0.0      # duration of the last run, from the start of the threads to the end of the last one
+        self._tasks = queue.Queue(maxsize=queue_size or 2 * workers)
+        self._lock = threading.Lock()
+        self._pending = {}           # accession -> files not transferred yet
+        self._resolve_error = None
+
+    def _resolve(self, accession_ids):
+        try:
+            for accession in accession_ids:
+                try:
+                    with self.pool.session() as ftp:
+                        # the index is a SQLite connection shared across threads, so it is only used by the resolver
+                        path, files = resolve_fastq_files(ftp, accession, index=self.index)
+                except Exception as err:
+                    print(f"Could not resolve {accession}: {err}")
+                    with self._lock:
+                        self.results[accession] = 'failed'
+                    continue
+                if not files:
+                    print(f"Files for {accession} not found in any location.")
+                    with self._lock:
+                        self.results[accession] = 'not found'
+                    continue
+                with self._lock:
+                    self._pending[accession] = len(files)
+                    self.results[accession] = 'done'
+                for file in files:
+                    if self.journal is not None:
+                        self.journal.pending(accession, file, path + file)
+                    self._tasks.put((accession, path, file))
+        except BaseException as err:
+            # raised again by run() once the workers have drained the files already queued
+            self._resolve_error = err
+        finally:
+            # the workers stop on these sentinels, so they are queued whatever happened above
+            for _ in range(self.workers):
+                self._tasks.put(None)
+
+    def _work(self, name):
+        stats = self.worker_stats.setdefault(name, {'files': 0, 'bytes': 0, 'seconds': 0.0})
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            accession, path, file = task
+            blob_client = self.container_client.get_blob_client(blob=os.path.join(accession, file))
+            start = time.perf_counter()
+            try:
+                with self.pool.session() as ftp:
+                    size = transfer_file_resumable(ftp, accession, path + file, blob_client, self.journal,
+                                                   self.local_directory, upload_workers=self.upload_workers,
+                                                   connections=self.connections, pool=self.pool,
+                                                   segment_threshold=self.segment_threshold)
+            except Exception as err:
+                print(f"Transfer of {accession}/{file} failed: {err}")
+                with self._lock:
+                    self.results[accession] = 'failed'
+                continue
+            finally:
+                stats['seconds'] += time.perf_counter() - start
+
+            stats['files'] += 1
+            stats['bytes'] += size
+            with self._lock:
+                self._pending[accession] -= 1
+                finished = self._pending[accession] == 0 and self.results[accession] == 'done'
+            if finished:
+                print(f"Files for {accession} downloaded and uploaded to Azure.")
+
+    def run(self, accession_ids):
+        """
+        Transfers the files of every accession and waits for the end.
+
+        Args:
+            accession_ids (list): The run accessions to transfer.
+
+        Returns:
+            dict: Maps each accession to 'done', 'not found' or 'failed'.
+
+        Raises:
+            Exception: The error that stopped the resolver thread, if any (e.g. the journal could not be written).
+        """
+        threads = [threading.Thread(target=self._resolve, args=(accession_ids,), name="resolver")]
+        threads += [threading.Thread(target=self._work, args=(f"worker-{i + 1}",), name=f"worker-{i + 1}")
+                    for i in range(self.workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+        self.pool.close()
+        if self._resolve_error is not None:
+            raise self._resolve_error
+        return self.results
+
+    def report(self):
+        """Prints the throughput of each worker and of the whole run."""
+        print(f"{'worker':>10} {'files':>6} {'MB':>10} {'MB/s':>8}")
+        total_bytes, total_files = 0, 0
+        for name, stats in sorted(self.worker_stats.items()):
+            megabytes = stats['bytes'] / 1024 ** 2
+            rate = megabytes / stats['seconds'] if stats['seconds'] else 0.0
+            print(f"{name:>10} {stats['files']:>6} {megabytes:>10.1f} {rate:>8.1f}")
+            total_bytes += stats['bytes']
+            total_files += stats['files']
+        # the workers overlap, so the rate of the whole run is measured on the wall clock
+        megabytes = total_bytes / 1024 ** 2
+        rate = megabytes / self.wall_seconds if self.wall_seconds else 0.0
+        print(f"{'total':>10} {total_files:>6} {megabytes:>10.1f} {rate:>8.1f}")
+        counts = {status: list(self.results.values()).count(status) for status in ('done', 'not found', 'failed')}
+        print(f"{total_files} files, {megabytes:.1f} MB in {self.wall_seconds:.1f} s; accessions: {counts}; "
+              f"FTP sessions opened: {self.pool.connections_opened}")
+        if self.journal is not None:
+            print(f"Transfer journal: {self.journal.summary()}")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+""" This python script contains the FASTQ transfers of a batch of accessions (the 'transfer' command of main.py).
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import json
+import os
+from ena_ftp import ENA_FTP_SERVER, AccessionIndex
+from transfer import DEFAULT_UPLOAD_WORKERS, TransferScheduler, shared_container_client
+from transfer_journal import TransferJournal
+
+
+def run(args):
+    """
+    Transfers the accessions of the arguments parsed by main.py and writes the report.
+
+    Returns:
+        dict: The status of every accession ('done', 'not found' or 'failed').
+    """
+    upload_workers = args.upload_workers or DEFAULT_UPLOAD_WORKERS
+    if args.accessions:
+        accession_ids = args.accessions
+    else:
+        with open(args.accession_file) as file:
+            accession_ids = [line.strip() for line in file if line.strip()]
+
+    if args.credentials:
+        # read here rather than with utils.load_credentials, which would import pandas
+        with open(args.credentials) as file:
+            credentials = json.load(file)
+        azure_connection_string = f"DefaultEndpointsProtocol=https;AccountName={credentials['storageAccountName']};AccountKey={credentials['storageAccountKey']};EndpointSuffix=core.windows.net"
+    else:
+        azure_connection_string = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
+
+    container_client = shared_container_client(azure_connection_string, args.container,
+                                               max_connections=args.workers * upload_workers + 1)
+    scheduler = TransferScheduler(args.server or ENA_FTP_SERVER,
+                                  container_client,
+                                  workers=args.workers,
+                                  index=AccessionIndex(args.index) if args.index else None,
+                                  local_directory=args.local_directory,
+                                  upload_workers=upload_workers,
+                                  journal=TransferJournal(args.journal) if args.journal else None,
+                                  connections=args.connections)
+    results = scheduler.run(accession_ids)
+    scheduler.report()
+
+    with open(args.report, "w") as file:
+        for accession in accession_ids:
+            file.write(f"{accession}\t{results.get(accession, 'failed')}\n")
+    return results
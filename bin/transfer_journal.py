@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+""" This python script contains the journal used to resume interrupted FASTQ transfers.
+ __  __
+|  \/  |
+| \  / | ___  _ __   __ _
+| |\/| |/ _ \| '_ \ / _` |
+| |  | | (_) | | | | (_| |
+|_|  |_|\___/|_| |_|\__,_|
+
+__authors__ = Marco Reverenna
+__copyright__ = Copyright 2024-2025
+__reserach-group__ = Multi-omics network analysis
+__date__ = 02 Feb 2024
+__maintainer__ = Marco Reverenna
+__email__ = marcor@dtu.dk
+__status__ = Dev
+"""
+
+# import libraries
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+COMMITTED = 'committed'
+
+
+class TransferJournal:
+    """
+    SQLite journal of the state of every file transfer: pending, in progress or committed, with the end of the
+    part staged from the start of the file (offset), the number of bytes staged in total (staged), the size of
+    the file and the block size used. The two counts only differ for segmented downloads, whose blocks are staged
+    out of order. It can be shared by the threads of the TransferScheduler.
+
+    Args:
+        path (str): Path of the SQLite database. It is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transfers ("
+            " accession TEXT, file TEXT, remote_path TEXT, state TEXT, offset INTEGER, size INTEGER,"
+            " block_size INTEGER, updated_at REAL, staged INTEGER, PRIMARY KEY (accession, file))"
+        )
+        # journals written before the 'staged' column was added
+        if 'staged' not in {row[1] for row in self._db.execute("PRAGMA table_info(transfers)")}:
+            self._db.execute("ALTER TABLE transfers ADD COLUMN staged INTEGER")
+        self._db.commit()
+
+    def _execute(self, query, parameters):
+        with self._lock:
+            self._db.execute(query, parameters)
+            self._db.commit()
+
+    def get(self, accession, file):
+        """
+        Returns the journal entry of a file.
+
+        Returns:
+            dict or None: Keys 'remote_path', 'state', 'offset', 'staged', 'size' and 'block_size',
+                          or None if the file was never seen.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT remote_path, state, offset, COALESCE(staged, offset), size, block_size FROM transfers"
+                " WHERE accession = ? AND file = ?",
+                (accession, file),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('remote_path', 'state', 'offset', 'staged', 'size', 'block_size'), row))
+
+    def pending(self, accession, file, remote_path):
+        """Registers a file to transfer, unless it is already known to the journal."""
+        self._execute(
+            "INSERT OR IGNORE INTO transfers (accession, file, remote_path, state, offset, staged, size, block_size, updated_at)"
+            " VALUES (?, ?, ?, ?, 0, 0, NULL, NULL, ?)",
+            (accession, file, remote_path, PENDING, time.time()),
+        )
+
+    def start(self, accession, file, remote_path, size, block_size, offset=0, staged=None):
+        """Marks a file as in progress from `offset`, with `staged` bytes already staged (defaults to `offset`)."""
+        self._execute(
+            "INSERT OR REPLACE INTO transfers (accession, file, remote_path, state, offset, staged, size, block_size, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (accession, file, remote_path, IN_PROGRESS, offset, offset if staged is None else staged, size, block_size,
+             time.time()),
+        )
+
+    def progress(self, accession, file, offset, staged=None):
+        """
+        Records the progress of a file.
+
+        Args:
+            accession (str): The run accession.
+            file (str): The file name.
+            offset (int): End of the part of the file staged without gaps from its first byte.
+            staged (int, optional): Bytes staged in total, ahead of `offset` for segmented downloads. Defaults to `offset`.
+        """
+        self._execute(
+            "UPDATE transfers SET offset = ?, staged = ?, updated_at = ? WHERE accession = ? AND file = ?",
+            (offset, offset if staged is None else staged, time.time(), accession, file),
+        )
+
+    def committed(self, accession, file, remote_path, size):
+        """Marks a file as completely transferred."""
+        self._execute(
+            "INSERT OR REPLACE INTO transfers (accession, file, remote_path, state, offset, staged, size, block_size, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT block_size FROM transfers WHERE accession = ? AND file = ?), ?)",
+            (accession, file, remote_path, COMMITTED, size, size, size, accession, file, time.time()),
+        )
+
+    def summary(self):
+        """Returns the number of files in each state."""
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM transfers GROUP BY state").fetchall())
+
+    def close(self):
+        """Closes the SQLite database."""
+        self._db.close()
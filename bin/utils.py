@@ -18,50 +18,17 @@ __status__ = Dev
 """
 
 # import libraries
-import requests
 import os
 import pandas as pd
 #import matplotlib.pyplot as plt
 #import seaborn as sns
 import json
-from ftplib import FTP
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+from mgnify_api import MGNIFY_API_URL, DEFAULT_CONCURRENCY, STUDIES_COLUMNS, ANALYSES_COLUMNS, SUMMARY_COLUMNS, biome_slug, fetch_all_pages, fetch_listings, flatten_analyses, flatten_studies
+from state_store import sync_listing, sync_listings
+from metrics import timed
 
-def fetch_biomes_and_save(output_dir):
-    """
-    Fetches the list of biomes from the MGnify API and saves it to a text file in the specified output directory.
-    The function makes a GET request to the MGnify API's biomes endpoint, extracts the biome IDs from the response,
-    and writes them to a file named 'mgnify_biomes_list.txt' within the given output directory.
-
-    Args:
-        output_dir (str): The directory path where the biomes list file will be saved. The directory must exist.
-
-    Note:
-        This function requires the 'requests' library for making HTTP requests and 'os' library for file path operations.
-    """
-    url = "https://www.ebi.ac.uk/metagenomics/api/v1/biomes"
-    response = requests.get(url)
-    if response.status_code == 200:
-        biomes_data = response.json()
-        biomes_list = [biome['id'] for biome in biomes_data['data']]
-        
-        # Ensure the output directory exists
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # Write the biome IDs to a file
-        with open(os.path.join(output_dir, "mgnify_biomes_list.txt"), 'w') as file:
-            for biome_name in biomes_list:
-                file.write(f"{biome_name}\n")
-                
-        print("Biomes list saved successfully.")
-        
-    else:
-        print("Failed to retrieve biomes. Status code:", response.status_code)
-
-
-
-def get_studies_and_analyses_summary(biome_name, experiment_type, output_dir = '../outputs'):
+@timed()
+def get_studies_and_analyses_summary(biome_name, experiment_type, output_dir = '../outputs', concurrency = DEFAULT_CONCURRENCY, cache = None, state_store = None):
     """
     Fetches and summarizes studies and analyses data from the MGnify API based on the specified biome name
     and experiment type. It saves the raw data as JSON and returns a merged DataFrame summary.
@@ -74,14 +41,23 @@ def get_studies_and_analyses_summary(biome_name, experiment_type, output_dir = '
         biome_name (str): The name of the biome to filter studies and analyses.
         experiment_type (str): The type of experiment to filter analyses.
         output_dir (str, optional): The directory path where the JSON files will be saved. Defaults to '../outputs'.
+        concurrency (int, optional): Maximum number of pages requested at the same time. Defaults to 8.
+        cache (HTTPCache, optional): On-disk cache used for every page, so that re-runs only download what changed.
+        state_store (StateStore, optional): If given, the listings are synced incrementally into this store
+                                            (only new or updated records are downloaded) and the summary is
+                                            rebuilt from the stored records. The cache is not used in this mode.
 
     Returns:
         pd.DataFrame: A DataFrame summarizing the studies and analyses, including key details like study ID,
                       study name, number of samples, and related analysis information.
+
+    Raises:
+        IncompleteListingError: If a page could not be retrieved even after the retries of the request controller,
+                                so that no truncated JSON file or summary is produced.
     """
 
     # API URLs for fetching studies and analyses data
-    urls = {"studies": "https://www.ebi.ac.uk/metagenomics/api/v1/studies", "analyses": "https://www.ebi.ac.uk/metagenomics/api/v1/analyses"}
+    urls = {"studies": f"{MGNIFY_API_URL}/studies", "analyses": f"{MGNIFY_API_URL}/analyses"}
 
     # common parameters for API requests
     common_params = {"biome_name": biome_name}
@@ -99,29 +75,12 @@ def get_studies_and_analyses_summary(biome_name, experiment_type, output_dir = '
                 "experiment_type": experiment_type
             })
 
-        page = 1
-        
-        while True:
-            try:
-                print(f"Retrieving data for page {page}...")
-                params["page"] = page
-                response = requests.get(url, params=params)
-                response.raise_for_status()  # errors codes HTTP
-                
-                data = response.json()["data"]
-                page_info = response.json()["meta"]["pagination"]
-                all_data[key].extend(data)
-                print(f"Page {page} retrieved successfully. Total pages: {page_info['pages']}")
-
-                if page >= page_info["pages"]:
-                    break
-                page += 1
-            except requests.exceptions.HTTPError as http_err:
-                print(f"HTTP error occurred: {http_err} - Status code: {response.status_code}")
-                break
-            except Exception as err:
-                print(f"An error occurred: {err}")
-                break
+        if state_store is not None:
+            scope = biome_name if key == "studies" else f"{biome_name}|{experiment_type}"
+            sync_listing(state_store, key, scope, url, params, concurrency=concurrency)
+            all_data[key] = list(state_store.records(key, scope))
+        else:
+            all_data[key] = fetch_all_pages(url, params, concurrency=concurrency, cache=cache)
         
         # save json files
         if key == "studies":
@@ -134,158 +93,101 @@ def get_studies_and_analyses_summary(biome_name, experiment_type, output_dir = '
         print(f"{key.capitalize()} data for {experiment_type} saved to {output_file_path}")
 
 
-    # building dataframes
-    studies_columns = ['study_id', 'study_name', 'n_samples', 'bioproject', 'centre_name', 'biomes']
-    studies_data = []
-    for item in all_data['studies']:
-        studies_data.append({
-            'study_id': item['id'],
-            'study_name': item['attributes'].get('study-name', ''),
-            'n_samples': item['attributes'].get('samples-count', 0),
-            'bioproject': item['attributes'].get('bioproject', ''),
-            'centre_name': item['attributes'].get('centre-name', ''),
-            'biomes': ", ".join([biome['id'] for biome in item['relationships']['biomes']['data']])
-            })
-    df_studies = pd.DataFrame(studies_data, columns=studies_columns)
-
-    analyses_columns = ['analysis_id', 'experiment_type', 'pipeline_version', 'instrument_platform', 'study_id', 'sample_id', 'assembly_run_id']
-    analyses_data = []
-    for item in all_data['analyses']:
-        analyses_data.append({
-            'analysis_id': item['id'],
-            'experiment_type': item['attributes'].get('experiment-type', ''),
-            'pipeline_version': item['attributes'].get('pipeline-version', ''),
-            'instrument_platform': item['attributes'].get('instrument-model', ''),
-            'study_id': item['relationships']['study']['data'].get('id', '') if item['relationships'].get('study') else '',
-            'sample_id': item['relationships']['sample']['data'].get('id', '') if item['relationships'].get('sample') else '',
-            'assembly_run_id': item['relationships'].get('assembly', {}).get('data', {}).get('id', '') if item['attributes'].get('experiment-type') == 'assembly' else item['relationships'].get('run', {}).get('data', {}).get('id', '')
-            })
-    df_analyses = pd.DataFrame(analyses_data, columns=analyses_columns)
-
-    # merging dataframe and return it
-    df_summary = pd.merge(df_analyses, df_studies, on='study_id', how='left')
-    
-    return df_summary
+    return summarize_records(all_data['studies'], all_data['analyses'])
 
 
 
-def explore_dataset(dataset):
+def summarize_records(study_records, analysis_records):
     """
-    Explores the given dataset by printing out statistics and information related to its composition.
-    This includes the total number of unique studies, the distribution of unique assembly run IDs per study,
-    the presence of missing values across variables, and the median number of samples per biome.
+    Builds the summary DataFrame of a biome and experiment type from raw MGnify records.
 
     Args:
-        dataset (pd.DataFrame): The dataset to be explored. It must contain the columns 'study_id',
-                                'assembly_run_id', 'biomes', and 'n_samples' among others.
-
-    Note:
-        The function assumes 'combined_df' is the dataset passed through the 'dataset' argument for some print statements.
-        Replace 'combined_df' with 'dataset' in the actual implementation if 'combined_df' is a typo.
-    """
-
-    print("\nTotal number of unique studies")
-    print(dataset['study_id'].nunique())
-    print('\033[92m' + "-" * 25 + '\033[0m')
-
-    print("\nNumber of unique assembly_run_id per study_id")
-    print(dataset.groupby('study_id')['assembly_run_id'].nunique())
-    print('\033[92m' + "-" * 25 + '\033[0m')
-
-    # missing data
-    print("\nMissing values per variable")
-    print(dataset.isnull().sum())
-    any_missing_data = dataset.isnull().values.any()
-    print(f"Are there any missing data in the dataframe? {'yes' if any_missing_data else 'no'}")
-    print('\033[92m' + "-" * 25 + '\033[0m')
-
-    print("\nNumber of samples per biome (median)")
-    print(dataset.groupby('biomes')['n_samples'].median().reset_index())
-    print('\033[92m' + "-" * 25 + '\033[0m')
-
-    experiment_type_counts = dataset["experiment_type"].value_counts()
-    biomes_counts = dataset["biomes"].value_counts()
-    print('\033[92m' + "-" * 25 + '\033[0m')
-    
-    print("\nDistribuzione di experiment_type:")
-    print(experiment_type_counts)
-
-    print("\nDistribuzione di biomes:")
-    print(biomes_counts)
-    print('\033[92m' + "-" * 25 + '\033[0m')
-
-
-
-def feature_engineering(dataframe):
-    """
-    Performs feature engineering on the provided dataframe. It includes mapping pipeline versions
-    to a simplified numerical scale, extracting initials from the 'assembly_run_id', and concatenating
-    multiple identifiers into a single 'concatenated_ids' column.
-    
-    The function does the following transformations:
-    - Maps 'pipeline_version' to 'pipeline_mapped' using a predefined version mapping for simplification.
-    - Extracts the first three characters from 'assembly_run_id' and stores them in 'initials_run'.
-    - Concatenates 'study_id', 'sample_id', 'assembly_run_id', and 'bioproject' into a new 'concatenated_ids' column.
-
-    Args:
-        dataframe (pd.DataFrame): The input dataframe to process. It must contain the columns 'pipeline_version',
-                                  'assembly_run_id', 'study_id', 'sample_id', and 'bioproject'.
+        study_records (list or pd.DataFrame): Raw study records, or the DataFrame already flattened from them.
+        analysis_records (list): Raw analysis records.
 
     Returns:
-        pd.DataFrame: The dataframe with added features based on the original data.
+        pd.DataFrame: One row per analysis, merged with the details of its study.
     """
+    # building dataframes
+    if isinstance(study_records, pd.DataFrame):
+        df_studies = study_records
+    else:
+        df_studies = pd.DataFrame(flatten_studies(study_records), columns=STUDIES_COLUMNS)
+    df_analyses = pd.DataFrame(flatten_analyses(analysis_records), columns=ANALYSES_COLUMNS)
 
-    version_mapping = {1.0: 1, 2.0: 2, 3.0: 3, 4.0: 4, 4.1: 5, 5.0: 6}
-    dataframe['pipeline_mapped'] = dataframe['pipeline_version'].map(version_mapping)
+    # merging dataframe and return it
+    return pd.merge(df_analyses, df_studies, on='study_id', how='left')
 
-    # extract the first three characters
-    dataframe['initials_run'] = dataframe['assembly_run_id'].str[:3]
 
-    dataframe['concatenated_ids'] = dataframe['study_id'] + '_' + dataframe['sample_id'] + '_' + dataframe['assembly_run_id'] + '_' + dataframe['bioproject']
 
-    return dataframe
+@timed()
+def get_studies_and_analyses_summaries(biome_names, experiment_types, output_dir = '../outputs', concurrency = DEFAULT_CONCURRENCY, cache = None, state_store = None, studies = None):
+    """
+    Batch version of get_studies_and_analyses_summary for several biomes and experiment types.
 
+    The studies of each biome are fetched exactly once, and every listing (the studies of each biome and the
+    analyses of each biome and experiment type) is retrieved in one scheduled batch sharing the same
+    connection pool. Every summary is then built from this shared data: with three experiment types the
+    studies are downloaded once instead of three times.
 
-
-def removing_duplicates(dataframe):
-    """
-    Removes duplicate rows from the dataframe based on the 'concatenated_ids' column.
-    Among duplicates, it retains only the row with the highest value in the 'pipeline_mapped' column.
-    
-    This function first counts the occurrences of each unique 'concatenated_ids' value to identify duplicates.
-    For each set of duplicates, it sorts them by 'pipeline_mapped' in descending order and keeps the top one,
-    effectively removing duplicates with lower 'pipeline_mapped' values. Rows without duplicates are preserved as is.
+    The raw records are saved as 'mgnify_studies_{biome}.json' and 'mgnify_analyses_{biome}_{experiment_type}.json'.
 
     Args:
-        dataframe (pd.DataFrame): The dataframe to process. It must contain the columns 'concatenated_ids' and 'pipeline_mapped'.
+        biome_names (list): The biomes to filter studies and analyses.
+        experiment_types (list): The types of experiment to filter analyses.
+        output_dir (str, optional): The directory path where the JSON files will be saved. Defaults to '../outputs'.
+        concurrency (int, optional): Maximum number of pages requested at the same time by the batch. Defaults to 8.
+        cache (HTTPCache, optional): On-disk cache used for every page.
+        state_store (StateStore, optional): If given, every listing is synced incrementally into this store
+                                            and the summaries are rebuilt from the stored records.
+        studies (dict, optional): Maps biomes to their raw study records, already fetched (e.g. by another task
+                                  of main.nf): the studies listings of these biomes are not downloaded again.
 
     Returns:
-        pd.DataFrame: A dataframe with duplicates removed based on the above criteria.
-    """
-
-    counts = dataframe['concatenated_ids'].value_counts()
-    duplicates = (counts > 1).sum()
+        tuple: (dict mapping each (biome_name, experiment_type) to its summary DataFrame,
+                DataFrame concatenating every summary in biome and experiment type order,
+                empty when there is no experiment type and only the studies are fetched).
 
-    print(f"Number of duplicates in the dataset: {duplicates}")
+    Raises:
+        IncompleteListingError: If a page of any listing could not be retrieved.
+    """
+    studies = studies or {}
+    listings = [("studies", biome_name, f"{MGNIFY_API_URL}/studies", {"biome_name": biome_name})
+                for biome_name in biome_names if biome_name not in studies]
+    listings += [("analyses", f"{biome_name}|{experiment_type}", f"{MGNIFY_API_URL}/analyses",
+                  {"biome_name": biome_name, "lineage": biome_name, "experiment_type": experiment_type})
+                 for biome_name in biome_names for experiment_type in experiment_types]
+
+    if state_store is not None:
+        sync_listings(state_store, listings, concurrency=concurrency)
+        records = [list(state_store.records(kind, scope)) for kind, scope, _, _ in listings]
+    else:
+        records = fetch_listings([(url, params) for _, _, url, params in listings], concurrency=concurrency, cache=cache)
+
+    df_studies = {biome_name: pd.DataFrame(flatten_studies(data), columns=STUDIES_COLUMNS) for biome_name, data in studies.items()}
+    df_summaries = {}
+    for (kind, scope, _, _), data in zip(listings, records):
+        biome_name, _, experiment_type = scope.partition("|")
+        if kind == "studies":
+            output_file_path = os.path.join(output_dir, f"mgnify_studies_{biome_slug(biome_name)}.json")
+        else:
+            output_file_path = os.path.join(output_dir, f"mgnify_analyses_{biome_slug(biome_name)}_{experiment_type}.json")
+        with open(output_file_path, "w") as outfile:
+            json.dump(data, outfile)
+        print(f"{kind.capitalize()} data for {scope} saved to {output_file_path}")
 
-    filtered_df = pd.DataFrame()
+        # the studies listings come first, so the studies of a biome are ready before its analyses
+        if kind == "studies":
+            df_studies[biome_name] = pd.DataFrame(flatten_studies(data), columns=STUDIES_COLUMNS)
+        else:
+            df_summaries[(biome_name, experiment_type)] = summarize_records(df_studies[biome_name], data)
 
-    # Process each ID with more than one occurrence to identify and keep only the desired row
-    for id, count in counts[counts > 1].items():
-        # Select rows matching the current duplicate ID
-        dup_rows = dataframe[dataframe['concatenated_ids'] == id]
-        # Sort these rows by 'pipeline_mapped' in descending order and select the top one
-        highest_pipeline_mapped_row = dup_rows.sort_values(by='pipeline_mapped', ascending=False).head(1)
-        # Append the selected row to the filtered DataFrame
-        filtered_df = pd.concat([filtered_df, highest_pipeline_mapped_row], ignore_index=True)
-    
-    # Identify and include rows that are not duplicates
-    non_duplicate_ids = counts[counts == 1].index
-    non_duplicate_rows = dataframe[dataframe['concatenated_ids'].isin(non_duplicate_ids)]
-    filtered_df = pd.concat([filtered_df, non_duplicate_rows], ignore_index=True)
+    if df_summaries:
+        combined_df = pd.concat(df_summaries.values(), axis=0, ignore_index=True)
+    else:
+        combined_df = pd.DataFrame(columns=SUMMARY_COLUMNS)
+    return df_summaries, combined_df
 
-    # Return the DataFrame with duplicates removed
-    return filtered_df
 
 def load_credentials(file_path = '~/Retrieve_info_MGnifyAPI/credentials.json'):
     """Load the credentials for connecting with Azure
@@ -300,33 +202,9 @@ def load_credentials(file_path = '~/Retrieve_info_MGnifyAPI/credentials.json'):
         data = json.load(file)
     return data
 
-def save_filtered_ids_to_file(dataframe, output_column, filter_column, filter_value, output_path):
-    """
-    Filters a DataFrame for rows where filter_column equals filter_value,
-    extracts values from output_column of those rows, and saves them to a file.
-
-    Parameters:
-    - dataframe: pd.DataFrame, the DataFrame to filter.
-    - filter_column: str, the name of the column to apply the filter on.
-    - filter_value: str, the value to filter rows by in the filter_column.
-    - output_column: str, the name of the column from which to extract values.
-    - output_file_path: str, the path to the file where the output will be saved.
-
-    Returns:
-    - None, but saves a file at output_file_path with one value per line from the output_column.
-    """
 
-    filtered_df = dataframe[dataframe[filter_column] == filter_value]
-
-    output_values = filtered_df[output_column].tolist()
-
-    with open(os.path.join(output_path, 'assembly_run_ids.txt' ), 'w') as file:
-        for value in output_values:
-            file.write(f"{value}\n")
-
-    print(f"Saved {output_column} to {output_path}")
-
-def download_files_and_upload_to_azure(server_address, accession, local_directory_base, azure_connection_string, azure_container_name):
+@timed()
+def download_files_and_upload_to_azure(server_address, accession, local_directory_base, azure_connection_string, azure_container_name, index = None, streaming = False, journal = None, connections = 1):
     """ This function downloads fastq files given a txt file which contains the IDs, and uploads them to Azure Blob Storage.
 
     Args:
@@ -336,59 +214,39 @@ def download_files_and_upload_to_azure(server_address, accession, local_director
         local_directory (str): path to your local directory which contains script and data
         azure_connection_string (str): Azure Storage account connection string
         azure_container_name (str): Name of the Azure Blob Storage container
+        index (AccessionIndex, optional): persistent index of the FTP paths already resolved, to skip the FTP discovery
+        streaming (bool, optional): stream the FTP download straight into staged blob blocks, without writing to local_directory_base
+        journal (TransferJournal, optional): transfer journal used to skip files already uploaded and resume interrupted ones
+        connections (int, optional): FTP connections used to download each large file in segments when streaming (1 = single stream)
     """
-    found = False
-    ftp = FTP(server_address)
-    ftp.login()  # Non sono richieste credenziali per questo server
+    # the Azure SDK and the transfer modules are imported here only: the metadata steps do not pay for their import
+    from azure.storage.blob import BlobServiceClient
+    from ena_ftp import ftp_connect, resolve_fastq_files
+    from transfer import transfer_file_resumable
+
+    ftp = ftp_connect(server_address)
 
     # Crea il client di servizio blob di Azure con la stringa di connessione
     blob_service_client = BlobServiceClient.from_connection_string(azure_connection_string)
     container_client = blob_service_client.get_container_client(azure_container_name)
 
-    # Estrae le prime tre lettere e i primi tre numeri dall'ID dell'accessione per formare ID_start
-    ID_start = accession[:6]
-    base_path = f'/vol1/fastq/{ID_start}/'
-
     try:
-        # Prova prima nella directory principale dell'accessione
-        path = f"{base_path}{accession}/"
-        try:
-            ftp.cwd(path)
-            files = ftp.nlst()
-            if files:
-                found = True
-        except Exception as e:
-            # Se non trova file nella directory principale, cerca nelle subfolders
-            for i in range(1, 1000):
-                subfolder = f"{i:03}"
-                path = f"{base_path}{subfolder}/{accession}/"
-                try:
-                    ftp.cwd(path)
-                    files = ftp.nlst()
-                    if files:
-                        found = True
-                        break
-                except Exception as e:
-                    continue
+        # the directory is computed from the digits of the accession, searching the subfolders only as a fallback
+        path, files = resolve_fastq_files(ftp, accession, index=index)
 
         # Se i file sono stati trovati, scaricali e caricali su Azure
-        if found:
+        if files:
             for file in files:
-                local_file_path = os.path.join(local_directory_base, file)
-                with open(local_file_path, 'wb') as local_file:
-                    ftp.retrbinary('RETR ' + file, local_file.write)
-
-                # Carica il file su Azure Blob Storage
                 blob_client = container_client.get_blob_client(blob=os.path.join(accession, file))
-                with open(local_file_path, "rb") as data:
-                    blob_client.upload_blob(data, overwrite=True)
-                
-                # Rimuovi il file locale dopo il caricamento, se desiderato
-                os.remove(local_file_path)
+                # when streaming, the blocks are uploaded in parallel while the download goes on, without touching the disk
+                # the files already uploaded are skipped and the interrupted ones resume where they stopped
+                # the large files are downloaded in segments over several FTP connections in parallel
+                transfer_file_resumable(ftp, accession, path + file, blob_client, journal=journal,
+                                        local_directory=None if streaming else local_directory_base,
+                                        connections=connections)
 
             print(f"Files for {accession} downloaded and uploaded to Azure.")
         else:
             print("Files not found in any location.")
     finally:
         ftp.quit()
-        
\ No newline at end of file
@@ -1,14 +1,29 @@
 #!/usr/bin/env nextflow
 
-params.tsv = "data/MGYS00001392_ERP011345_taxonomy_abundances_v3.0.tsv"
-//params.url = "https://www.ebi.ac.uk/metagenomics/api/v1/analyses"
+nextflow.enable.dsl = 2
+
+// biomi e tipi di esperimento separati da virgole: ogni combinazione diventa un task indipendente
+params.biomes = 'root:Engineered:Wastewater'
+params.experiment_types = 'metagenomic,metatranscriptomic,assembly'
 params.outputDir = 'output' // Directory di output
 
-params.input_file = 'path/to/default/input_file.csv'
-params.output_name = 'default_output_name'
-params.output_directory = 'path/to/output_directory'
+// in alternativa ai metadati MGnify, gli ID possono essere estratti da una tabella di abbondanze tassonomiche
+params.tsv = null // es. "data/MGYS00001392_ERP011345_taxonomy_abundances_v3.0.tsv"
 
-// sarebbe opportuno compiere l'intero processo con almeno due accessioni in modo tale da vedere la parallellizzazione
+params.filter_value = 'ERR'              // prefisso delle accessioni da trasferire
+params.chunksize = null                  // righe per blocco: se impostato i riassunti vengono elaborati a blocchi, con memoria limitata
+params.transfer_batch_size = 10          // accessioni gestite da ciascun task di trasferimento
+params.ftp_server = 'ftp.sra.ebi.ac.uk'
+params.azure_container = 'retrievefastq'
+params.credentials = null                // file JSON con storageAccountName e storageAccountKey
+params.skip_transfer = false
+// archivi SQLite degli studi e delle analisi gia' scaricati: le esecuzioni successive scaricano solo i record nuovi
+// o modificati (default: <outputDir>/metadata_state). Come transfer_state, deve essere su un file system condiviso
+params.metadata_state = null
+// journal dei trasferimenti e indice dei percorsi FTP: i tentativi successivi e le esecuzioni con -resume saltano
+// i file gia' caricati e riprendono quelli interrotti (default: <outputDir>/transfer_state). La directory viene
+// aperta direttamente dai task, quindi deve trovarsi su un file system condiviso con gli esecutori (es. EFS/NFS)
+params.transfer_state = null
 
 // val
 // Utilizza val per passare valori non associati a un file system, come stringhe, numeri o qualsiasi altro valore che non rappresenta un percorso di file o directory. Questi valori sono trattati come dati letterali e possono essere utilizzati per parametri di configurazione, nomi di file dinamici, ecc.
@@ -18,39 +33,161 @@ params.output_directory = 'path/to/output_directory'
 // Utilizza path per passare riferimenti a file o directory. Questo consente a Nextflow di gestire i file come parte del suo sistema di gestione dati, ottimizzando il trasferimento di file, l'esecuzione in ambienti distribuiti e garantendo che i file siano disponibili dove e quando sono necessari per l'esecuzione di un processo.
 // indica a Nextflow che l'oggetto in questione è un percorso di file o directory. Questo consente a Nextflow di gestire automaticamente la localizzazione dei file (ad esempio, scaricarli o copiarli in una cache locale) prima di eseguire un processo. Questo è particolarmente utile in ambienti distribuiti o quando si utilizzano sistemi di storage remoto.
 
+// Scatter: gli studi di ciascun bioma vengono scaricati una sola volta
+process FetchStudies {
+    tag "${biome}"
+    label 'api'
+    publishDir "${params.outputDir}/metadata", mode: 'copy'
+
+    containerOptions { "--volume ${state_dir}:${state_dir}" }
+
+    input:
+    val biome
+    val state_dir
+
+    output:
+    tuple val(biome), path("mgnify_studies_*.json")
+
+    script:
+    // un archivio per task, quindi nessun file SQLite condiviso tra task in parallelo; la cache HTTP non serve:
+    // con l'archivio le liste vengono sincronizzate in modo incrementale e non passano dalla cache
+    """
+    main.py --metrics metrics_studies.jsonl summarize --studies_only --biomes '${biome}' \\
+        --state_store ${state_dir}/studies_${biome.replaceAll(/[^A-Za-z0-9]+/, '_').toLowerCase()}.sqlite \\
+        --cache_dir '' --output_dir .
+    """
+}
+
+// Scatter: un task per ogni combinazione di bioma e tipo di esperimento
+process FetchAnalyses {
+    tag "${biome} ${experiment_type}"
+    label 'api'
+    publishDir "${params.outputDir}/metadata", mode: 'copy', pattern: 'mgnify_analyses_*.json'
+
+    containerOptions { "--volume ${state_dir}:${state_dir}" }
+
+    input:
+    tuple val(biome), path(studies), val(experiment_type)
+    val state_dir
+
+    output:
+    path "summaries", emit: store
+    path "mgnify_analyses_*.json", emit: analyses
+
+    script:
+    """
+    main.py --metrics metrics_analyses.jsonl summarize --biomes '${biome}' --experiment_types ${experiment_type} \\
+        --studies ${studies} \\
+        --state_store ${state_dir}/analyses_${biome.replaceAll(/[^A-Za-z0-9]+/, '_').toLowerCase()}_${experiment_type}.sqlite \\
+        --cache_dir '' --output_dir .
+    """
+}
+
+// Gather: le partizioni di tutti i riassunti formano un unico archivio Parquet, poi rimozione dei duplicati ed estrazione delle accessioni
 process ExtractIDs {
+    label 'process_medium'
+    publishDir "${params.outputDir}", mode: 'copy'
 
     input:
-    val(input_file) from params.input_file
-    val(output_name) from params.output_name
-    val(output_directory) from params.output_directory
+    path stores, stageAs: 'store*/*'
 
     output:
-    path "IDs.txt" into idsForDownload
+    path "assembly_run_ids.txt", emit: ids
+    path "deduplicated.parquet", emit: deduplicated
+    path "summaries", emit: store
 
     script:
     """
-    pwd
-    script.py --input_file ${params.tsv} --output_name ${output_name} --output_directory $output_directory
+    mkdir summaries
+    for store in store*/summaries; do
+        cp -R "\$store"/. summaries/
+    done
+    main.py --metrics metrics_dedup.jsonl dedup --output_dir . ${params.chunksize ? "--chunksize ${params.chunksize}" : ''}
+    main.py --metrics metrics_extract_ids.jsonl extract-ids --output_dir . --filter_value ${params.filter_value}
     """
 }
 
-// Processo per scaricare i file FASTQ
-process DownloadFastq {
+// Estrazione delle accessioni dall'intestazione di una tabella di abbondanze tassonomiche
+process ExtractIDsFromTable {
+    label 'process_low'
+    publishDir "${params.outputDir}", mode: 'copy'
+
     input:
-    val id from idsForDownload.flatten()
+    path tsv
 
     output:
-    path "${params.outputDir}/*"
-    // Modificare in base alla struttura desiderata
+    path "IDs.txt"
 
     script:
     """
-    python download_files_from_list.py
+    taxonomy_table.py --input_file ${tsv} --output_name IDs.txt --output_directory .
+    """
+}
+
+// Processo per trasferire i file FASTQ: un task per ogni gruppo di accessioni, eseguiti in parallelo
+process TransferFastq {
+    tag "${accessions[0]} (+${accessions.size() - 1})"
+    label 'transfer'
+    publishDir "${params.outputDir}/transfers", mode: 'copy'
+    // la directory dello stato non e' un input: viene montata nel container con lo stesso percorso assoluto
+    containerOptions { "--volume ${state_dir}:${state_dir}" }
+
+    input:
+    val accessions
+    path credentials
+    // percorso assoluto passato come valore: non viene copiato nella cartella del task (le scritture SQLite
+    // andrebbero perse con gli esecutori che copiano gli input) e nell'hash usato da -resume entra solo il
+    // percorso, non il contenuto che ogni gruppo modifica
+    val state_dir
+
+    output:
+    path "transfer_report_*.tsv"
+    path "metrics_*.jsonl"
+
+    script:
+    // un journal per gruppo di accessioni e un unico indice condiviso da tutti i task: SQLite lascia scrivere
+    // l'indice a un solo task alla volta, e ogni accessione risolta serve anche ai gruppi e alle esecuzioni successive
+    """
+    main.py --metrics metrics_transfer_${accessions[0]}.jsonl transfer --accessions ${accessions.join(' ')} \\
+        --credentials ${credentials} \\
+        --server ${params.ftp_server} \\
+        --container ${params.azure_container} \\
+        --workers ${task.cpus} \\
+        --index ${state_dir}/index.sqlite \\
+        --journal ${state_dir}/journal_${accessions[0]}.sqlite \\
+        --report transfer_report_${accessions[0]}.tsv
     """
 }
 
 workflow {
-    ExtractIDs()
-    DownloadFastq()
-}
\ No newline at end of file
+    if (params.tsv) {
+        ids = ExtractIDsFromTable(file(params.tsv))
+    }
+    else {
+        biomes = Channel.fromList(params.biomes.tokenize(','))
+        experiments = Channel.fromList(params.experiment_types.tokenize(','))
+
+        // come per i trasferimenti, la directory viene passata come percorso assoluto e non come input
+        metadata_state = file(params.metadata_state ?: "${params.outputDir}/metadata_state").toAbsolutePath()
+        metadata_state.mkdirs()
+
+        studies = FetchStudies(biomes, metadata_state.toString())
+        FetchAnalyses(studies.combine(experiments), metadata_state.toString())
+        ids = ExtractIDs(FetchAnalyses.out.store.collect()).ids
+    }
+
+    if (!params.skip_transfer) {
+        if (!params.credentials) {
+            error "Set --credentials to the JSON file with the Azure storage account, or use --skip_transfer"
+        }
+        accessions = ids
+            .splitText()
+            .map { it.trim() }
+            .filter { it }
+            .buffer(size: params.transfer_batch_size, remainder: true)
+        // la directory sopravvive alle cartelle di lavoro dei task, che cambiano ad ogni tentativo
+        state_dir = file(params.transfer_state ?: "${params.outputDir}/transfer_state").toAbsolutePath()
+        state_dir.mkdirs()
+        TransferFastq(accessions, file(params.credentials), state_dir.toString())
+    }
+}
@@ -0,0 +1,54 @@
+""" Shared setup of the unit tests: the modules of bin/ and the local stand-ins of benchmarks/ are importable. """
+
+# import libraries
+import os
+import sys
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bin"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from blob_emulator import BlobEmulator
+from ena_ftp import ftp_connect
+from ftp_fixture import LocalFTPServer
+from mock_mgnify import MockMGnifyServer
+from transfer import shared_container_client
+
+CONTAINER = "tests"
+
+
+@pytest.fixture
+def mgnify_server():
+    """A mock MGnify API with 3 pages of 10 records per listing and no latency."""
+    with MockMGnifyServer(pages=3, page_size=10, latency=0) as server:
+        yield server
+
+
+@pytest.fixture
+def ftp_server():
+    """A local anonymous FTP server serving a temporary directory."""
+    with LocalFTPServer() as server:
+        yield server
+
+
+@pytest.fixture
+def ftp(ftp_server):
+    """A logged in connection to the local FTP server."""
+    connection = ftp_connect(f"{ftp_server.host}:{ftp_server.port}")
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def blob_emulator():
+    """A local Azure Blob Storage stand-in, with an empty container named CONTAINER."""
+    with BlobEmulator() as emulator:
+        shared_container_client(emulator.connection_string, CONTAINER).create_container()
+        yield emulator
+
+
+@pytest.fixture
+def container(blob_emulator):
+    """A client of the container of the blob emulator."""
+    return shared_container_client(blob_emulator.connection_string, CONTAINER)
@@ -0,0 +1,48 @@
+""" Tests of the batch retrieval of the summaries of several biomes and experiment types (bin/utils.py). """
+
+# import libraries
+import os
+import pandas as pd
+import pytest
+import utils
+from mgnify_api import SUMMARY_COLUMNS, biome_slug
+
+BIOMES = ['root:Engineered:Wastewater', 'root:Host-associated:Human']
+EXPERIMENT_TYPES = ['metagenomic', 'metatranscriptomic', 'assembly']
+
+
+@pytest.fixture
+def api(mgnify_server, monkeypatch):
+    monkeypatch.setattr(utils, "MGNIFY_API_URL", mgnify_server.url)
+    return mgnify_server
+
+
+def test_studies_are_fetched_once_per_biome(api, tmp_path):
+    summaries, combined_df = utils.get_studies_and_analyses_summaries(BIOMES, EXPERIMENT_TYPES, output_dir=str(tmp_path))
+    # 3 pages of studies per biome, not per biome and experiment type
+    assert api.requests_by_listing["studies"] == len(BIOMES) * api.pages
+    # the 30 analyses are split among the 3 experiment types: one page each
+    assert api.requests_by_listing["analyses"] == len(BIOMES) * len(EXPERIMENT_TYPES)
+    assert list(summaries) == [(biome, experiment_type) for biome in BIOMES for experiment_type in EXPERIMENT_TYPES]
+    assert len(combined_df) == sum(len(summary) for summary in summaries.values()) == len(BIOMES) * 30
+    assert combined_df['n_samples'].notna().all()
+    assert len(os.listdir(tmp_path)) == len(BIOMES) * (1 + len(EXPERIMENT_TYPES))
+
+
+def test_given_studies_are_not_fetched_again(api, tmp_path):
+    studies = {BIOMES[0]: api.records["studies"]}
+    summaries, _ = utils.get_studies_and_analyses_summaries(BIOMES, EXPERIMENT_TYPES, output_dir=str(tmp_path),
+                                                            studies=studies)
+    assert api.requests_by_listing["studies"] == api.pages
+    assert not os.path.exists(tmp_path / f"mgnify_studies_{biome_slug(BIOMES[0])}.json")
+    # the summaries built from the given studies match those built from the downloaded ones
+    for experiment_type in EXPERIMENT_TYPES:
+        pd.testing.assert_frame_equal(summaries[(BIOMES[0], experiment_type)], summaries[(BIOMES[1], experiment_type)])
+
+
+def test_no_experiment_type_fetches_only_the_studies(api, tmp_path):
+    summaries, combined_df = utils.get_studies_and_analyses_summaries(BIOMES, [], output_dir=str(tmp_path))
+    assert summaries == {}
+    assert combined_df.empty and list(combined_df.columns) == SUMMARY_COLUMNS
+    assert api.requests_by_listing == {"studies": len(BIOMES) * api.pages}
+    assert sorted(os.listdir(tmp_path)) == [f"mgnify_studies_{biome_slug(biome)}.json" for biome in BIOMES]
@@ -0,0 +1,81 @@
+""" Tests of the per-key best pipeline table of the out-of-core deduplication (bin/chunked.py). """
+
+# import libraries
+import numpy as np
+import pandas as pd
+import pytest
+from chunked import BestPipelineTable
+from summary_processing import removing_duplicates
+
+
+def random_frame(n_rows, n_keys, seed=0):
+    """Rows with many duplicated keys, tied pipelines, unmapped pipelines and missing keys."""
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'row': np.arange(n_rows),
+        'concatenated_ids': [f"MGYS{key:05d}_ERS{key}_ERR{key}_PRJEB{key}" for key in rng.integers(0, n_keys, n_rows)],
+        'pipeline_mapped': rng.choice([1.0, 2.0, 3.0, np.nan], n_rows),
+    })
+    frame.loc[rng.random(n_rows) < 0.05, 'concatenated_ids'] = np.nan
+    return frame
+
+
+def build(frame, chunksize):
+    table = BestPipelineTable()
+    for start in range(0, len(frame), chunksize):
+        table.update(frame.iloc[start:start + chunksize], start)
+    return table
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 250, 5000])
+def test_kept_rows_match_removing_duplicates(chunksize):
+    frame = random_frame(2000, 300)
+    expected = removing_duplicates(frame.copy())['row'].to_numpy()
+    table = build(frame, chunksize)
+    np.testing.assert_array_equal(table.kept_rows(), expected)
+    assert len(table) == frame['concatenated_ids'].nunique()
+
+
+def test_counts_and_duplicates():
+    frame = pd.DataFrame({'concatenated_ids': ["a", "b", "a", None, "c", "a", "c"],
+                          'pipeline_mapped': [1, 1, 1, 1, 1, 1, 1]})
+    table = build(frame, 3)
+    assert list(table.keys) == [b"a", b"b", b"c"]
+    assert list(table.counts) == [3, 1, 2]
+    assert table.duplicates == 2
+    # ties keep the earliest row
+    assert list(table.kept_rows()) == [0, 1, 4]
+
+
+def test_unmapped_pipeline_loses_to_any_version():
+    frame = pd.DataFrame({'concatenated_ids': ["a", "a", "b"], 'pipeline_mapped': [np.nan, 1.0, np.nan]})
+    assert list(build(frame, 1).kept_rows()) == [1, 2]
+
+
+def test_merged_tables_equal_a_single_table():
+    frame = random_frame(3000, 400, seed=1)
+    first, second = build(frame.iloc[:1700], 300), BestPipelineTable()
+    for start in range(1700, len(frame), 300):
+        second.update(frame.iloc[start:start + 300], start)
+    single = build(frame, 300)
+
+    merged = first.merge(second)
+    for column in ("keys", "pipeline", "rows", "counts"):
+        np.testing.assert_array_equal(getattr(merged, column), getattr(single, column))
+
+
+def test_longer_keys_are_never_truncated():
+    prefix = "MGYS00000001_ERS0000001_ERR0000001_" + "x" * 60
+    frame = pd.DataFrame({'concatenated_ids': ["a", prefix, prefix + "1", prefix + "2", "a", prefix + "1"],
+                          'pipeline_mapped': [1, 2, 2, 2, 3, 3]})
+    # the first batch fixes a short width, the later ones bring longer keys sharing a long prefix
+    table = build(frame, 1)
+    assert len(table) == 4
+    assert list(table.kept_rows()) == [1, 3, 4, 5]
+
+
+def test_non_ascii_keys():
+    frame = pd.DataFrame({'concatenated_ids': ["Zürich_1", "Zurich_1", "Zürich_1"], 'pipeline_mapped': [1, 1, 2]})
+    table = build(frame, 2)
+    assert len(table) == 2
+    assert list(table.kept_rows()) == [1, 2]
@@ -0,0 +1,59 @@
+""" Tests of the ENA FTP path resolution (bin/ena_ftp.py). """
+
+# import libraries
+import os
+import pytest
+from ena_ftp import AccessionIndex, ena_fastq_directory, resolve_fastq_files
+from ftp_fixture import make_fastq_tree
+
+
+@pytest.mark.parametrize("accession, directory", [
+    ("ERR977403", "/vol1/fastq/ERR977/ERR977403/"),
+    ("ERR1234567", "/vol1/fastq/ERR123/007/ERR1234567/"),
+    ("SRR12345678", "/vol1/fastq/SRR123/078/SRR12345678/"),
+    ("DRR123456789", "/vol1/fastq/DRR123/789/DRR123456789/"),
+])
+def test_directory_is_computed_from_the_digits(accession, directory):
+    assert ena_fastq_directory(accession) == directory
+
+
+def test_directory_under_another_root():
+    assert ena_fastq_directory("ERR1234567", root="/mirror") == "/mirror/ERR123/007/ERR1234567/"
+
+
+def test_computed_directory_takes_one_listing(ftp, ftp_server):
+    paths = make_fastq_tree(ftp_server.root, ["ERR1234567"], file_size=10)
+    ftp_server.reset_counters()
+
+    directory, files = resolve_fastq_files(ftp, "ERR1234567")
+    assert [directory + name for name in files] == paths["ERR1234567"]
+    assert ftp_server.commands.get("NLST") == 1
+
+
+def test_other_subfolders_are_searched_as_a_fallback(ftp, ftp_server):
+    # an older layout: the run is not in the folder of its digits
+    misplaced = os.path.join(ftp_server.root, "vol1", "fastq", "ERR123", "000", "ERR1234567")
+    os.makedirs(misplaced)
+    open(os.path.join(misplaced, "ERR1234567.fastq.gz"), "wb").close()
+
+    assert resolve_fastq_files(ftp, "ERR1234567") == ("/vol1/fastq/ERR123/000/ERR1234567/", ["ERR1234567.fastq.gz"])
+
+
+def test_missing_accession(ftp):
+    assert resolve_fastq_files(ftp, "ERR7654321") == (None, [])
+
+
+def test_index_skips_the_ftp_discovery(ftp, ftp_server, tmp_path):
+    make_fastq_tree(ftp_server.root, ["ERR1234567"], file_size=10)
+    index = AccessionIndex(str(tmp_path / "index.sqlite"))
+    resolved = resolve_fastq_files(ftp, "ERR1234567", index=index)
+    index.close()
+
+    # a new index on the same file answers without any FTP command
+    index = AccessionIndex(str(tmp_path / "index.sqlite"))
+    ftp_server.reset_counters()
+    assert resolve_fastq_files(ftp, "ERR1234567", index=index) == resolved
+    assert ftp_server.total_commands() == 0
+    index.forget("ERR1234567")
+    assert index.get("ERR1234567") is None
+    index.close()
@@ -0,0 +1,75 @@
+""" Tests of the on-disk HTTP cache (bin/http_cache.py): freshness, ETag revalidation and LRU eviction. """
+
+# import libraries
+import os
+from http_cache import HTTPCache, cache_key
+from mgnify_api import fetch_all_pages
+
+URL = "https://www.ebi.ac.uk/metagenomics/api/v1/studies"
+
+
+def test_cache_key_ignores_the_order_of_the_parameters():
+    assert cache_key(URL, {"page": 2, "biome_name": "root"}) == cache_key(URL, {"biome_name": "root", "page": "2"})
+    assert cache_key(URL, {"page": 2}) != cache_key(URL, {"page": 3})
+
+
+def test_stored_body_is_served_while_fresh(tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=3600)
+    assert cache.lookup(URL, {"page": 1}) is None
+    cache.store(URL, {"page": 1}, b'{"data": []}', {"ETag": '"v1"'})
+
+    entry = cache.lookup(URL, {"page": 1})
+    assert cache.is_fresh(entry)
+    assert cache.hit(entry) == b'{"data": []}'
+    assert entry.conditional_headers() == {"If-None-Match": '"v1"'}
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 1
+
+
+def test_expired_entry_is_kept_for_revalidation(tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=0)
+    cache.store(URL, None, b"body", {"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+
+    entry = cache.lookup(URL)
+    assert not cache.is_fresh(entry)
+    assert entry.has_validators()
+    assert entry.conditional_headers() == {"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert cache.revalidated(entry) == b"body"
+
+
+def test_expired_pages_are_revalidated_with_their_etag(tmp_path, mgnify_server):
+    url = f"{mgnify_server.url}/studies"
+    cache = HTTPCache(str(tmp_path), ttl=0)
+    first = fetch_all_pages(url, {}, concurrency=2, cache=cache)
+    assert cache.stats["stored"] == mgnify_server.pages
+
+    # every page answers 304 Not Modified: the bodies come from the cache
+    second = fetch_all_pages(url, {}, concurrency=2, cache=cache)
+    assert second == first
+    assert cache.stats["revalidated"] == mgnify_server.pages
+    assert cache.stats["stored"] == mgnify_server.pages
+
+
+def test_fresh_pages_are_served_without_requests(tmp_path, mgnify_server):
+    url = f"{mgnify_server.url}/studies"
+    cache = HTTPCache(str(tmp_path), ttl=3600)
+    first = fetch_all_pages(url, {}, cache=cache)
+    served = mgnify_server.requests_served
+
+    assert fetch_all_pages(url, {}, cache=cache) == first
+    assert mgnify_server.requests_served == served
+    assert cache.stats["hits"] == mgnify_server.pages
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # random bytes do not compress: each body takes about 1000 bytes on disk
+    bodies = {page: os.urandom(1000) for page in (1, 2, 3)}
+    cache = HTTPCache(str(tmp_path), max_size=2500)
+    cache.store(URL, {"page": 1}, bodies[1])
+    cache.store(URL, {"page": 2}, bodies[2])
+    cache.hit(cache.lookup(URL, {"page": 1}))
+
+    cache.store(URL, {"page": 3}, bodies[3])
+    assert cache.stats["evicted"] == 1
+    assert cache.lookup(URL, {"page": 2}) is None
+    assert cache.lookup(URL, {"page": 1}).read() == bodies[1]
+    assert cache.lookup(URL, {"page": 3}).read() == bodies[3]
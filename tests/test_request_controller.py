@@ -0,0 +1,164 @@
+""" Tests of the adaptive concurrency limit and the retries of the MGnify requests (bin/request_controller.py). """
+
+# import libraries
+import asyncio
+import email.utils
+import time
+import aiohttp
+import pytest
+import requests
+from request_controller import RequestController, parse_retry_after, retry_reason
+
+
+def http_error(status, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return aiohttp.ClientResponseError(None, (), status=status, headers=headers)
+
+
+def failing(*errors, result="ok"):
+    """Returns an attempt coroutine function raising the given errors in turn, then returning `result`."""
+    errors = list(errors)
+
+    async def attempt():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return attempt
+
+
+def test_success_adds_about_one_per_round():
+    controller = RequestController(initial_concurrency=4, max_concurrency=32)
+    for _ in range(4):
+        controller._succeeded()
+    assert 4.9 < controller.limit < 5
+
+
+def test_limit_stays_under_the_maximum():
+    controller = RequestController(initial_concurrency=8, max_concurrency=8)
+    controller._succeeded()
+    assert controller.limit == 8
+
+
+def test_one_decrease_per_round():
+    controller = RequestController(initial_concurrency=16, min_concurrency=3)
+    controller._throttled(0, None)
+    assert controller.limit == 8
+    # answers to requests started before the decrease do not lower the limit again
+    controller._throttled(0, None)
+    assert controller.limit == 8
+    controller._throttled(1, None)
+    assert controller.limit == 4
+    controller._throttled(2, None)
+    assert controller.limit == 3
+    assert controller.lowest_limit == 3
+    assert controller.stats["throttled"] == 4
+
+
+def test_retry_after_pauses_the_new_requests():
+    controller = RequestController()
+    before = time.monotonic()
+    controller._throttled(0, 30)
+    assert controller.resume_at >= before + 30
+
+
+def test_throttled_request_is_retried():
+    controller = RequestController(initial_concurrency=8, backoff_base=0)
+    assert asyncio.run(controller.execute(failing(http_error(429, "0")))) == "ok"
+    assert controller.stats == {"requests": 2, "retries": 1, "throttled": 1, "failed": 0}
+    assert controller.lowest_limit == 4
+
+
+def test_simultaneous_throttles_decrease_once():
+    controller = RequestController(initial_concurrency=8, backoff_base=0)
+
+    async def run():
+        started = asyncio.Event()
+        in_flight = []
+
+        async def attempt():
+            if len(in_flight) < 8:
+                in_flight.append(1)
+                if len(in_flight) == 8:
+                    started.set()
+                await started.wait()
+                raise http_error(429)
+            return "ok"
+        return await asyncio.gather(*(controller.execute(attempt) for _ in range(8)))
+
+    assert asyncio.run(run()) == ["ok"] * 8
+    assert controller.stats["throttled"] == 8
+    assert controller.lowest_limit == 4
+
+
+def test_requests_in_flight_stay_under_the_limit():
+    controller = RequestController(initial_concurrency=3, max_concurrency=3)
+    peak = 0
+
+    async def run():
+        in_flight = 0
+
+        async def attempt():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+        await asyncio.gather(*(controller.execute(attempt) for _ in range(20)))
+
+    asyncio.run(run())
+    assert peak == 3
+
+
+def test_final_errors_are_not_retried():
+    controller = RequestController(backoff_base=0)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(controller.execute(failing(http_error(404))))
+    assert controller.stats["requests"] == 1 and controller.stats["failed"] == 1
+
+
+def test_retries_are_bounded():
+    controller = RequestController(max_retries=2, backoff_base=0)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(controller.execute(failing(*[http_error(500)] * 3)))
+    assert controller.stats["requests"] == 3 and controller.stats["retries"] == 2
+
+
+def test_blocking_requests_are_retried():
+    controller = RequestController(backoff_base=0)
+    attempts = iter([requests.exceptions.ConnectionError(), "ok"])
+
+    def attempt():
+        value = next(attempts)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    assert controller.execute_sync(attempt) == "ok"
+    assert controller.stats["retries"] == 1 and controller.stats["throttled"] == 0
+
+
+def test_backoff_bounds():
+    controller = RequestController(backoff_base=0.5, backoff_max=4)
+    for attempt in range(8):
+        delays = [controller.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= min(4, 0.5 * 2 ** attempt) for delay in delays)
+    assert all(10 <= controller.backoff(3, retry_after=10) <= 10.5 for _ in range(200))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 50 < parse_retry_after(email.utils.formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_retry_reason():
+    assert retry_reason(http_error(429, "2")) == (429, 2.0)
+    assert retry_reason(http_error(502)) == (502, None)
+    assert retry_reason(http_error(404)) is None
+    assert retry_reason(asyncio.TimeoutError()) == (None, None)
+    assert retry_reason(ValueError()) is None
+    response = requests.Response()
+    response.status_code = 503
+    assert retry_reason(requests.exceptions.HTTPError(response=response)) == (503, None)
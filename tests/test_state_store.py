@@ -0,0 +1,105 @@
+""" Tests of the incremental sync of the SQLite state store (bin/state_store.py) against the mock MGnify API. """
+
+# import libraries
+import pytest
+import request_controller
+from mgnify_api import IncompleteListingError
+from mock_mgnify import make_analysis, make_study
+from state_store import StateStore, sync_listing
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def failing_second_request(mgnify_server):
+    """Makes the next sync fail on its second request: the mock API throttles it and nothing is retried."""
+    def arm():
+        mgnify_server._received = 0
+        mgnify_server.throttle_every = 2
+    request_controller.configure(max_retries=0)
+    yield arm
+    request_controller.configure()
+
+
+def sync(store, server, kind, scope="root"):
+    return sync_listing(store, kind, scope, f"{server.url}/{kind}", {"biome_name": "root"}, concurrency=2)
+
+
+def stored_ids(store, kind, scope="root"):
+    return [item["id"] for item in store.records(kind, scope)]
+
+
+def test_initial_sync_stores_every_record(store, mgnify_server):
+    assert store.last_sync("studies", "root") is None
+    assert sync(store, mgnify_server, "studies") == 30
+    assert stored_ids(store, "studies") == sorted(item["id"] for item in mgnify_server.records["studies"])
+    assert store.last_sync("studies", "root") is not None
+
+
+def test_unchanged_listing_stops_after_the_first_page(store, mgnify_server):
+    sync(store, mgnify_server, "studies")
+    served = mgnify_server.requests_served
+
+    assert sync(store, mgnify_server, "studies") == 0
+    assert mgnify_server.requests_served == served + 1
+
+
+def test_new_and_updated_studies_are_synced(store, mgnify_server):
+    sync(store, mgnify_server, "studies")
+    new_study = make_study(100)
+    new_study["attributes"]["last-update"] = "2030-01-01T00:00:00"
+    mgnify_server.records["studies"].append(new_study)
+    updated = mgnify_server.records["studies"][5]
+    updated["attributes"].update({"study-name": "Renamed study", "last-update": "2030-01-02T00:00:00"})
+    served = mgnify_server.requests_served
+
+    assert sync(store, mgnify_server, "studies") == 2
+    # page 1 holds both changes, page 2 only known records
+    assert mgnify_server.requests_served == served + 2
+    records = {item["id"]: item for item in store.records("studies", "root")}
+    assert len(records) == 31
+    assert records[new_study["id"]] == new_study
+    assert records[updated["id"]]["attributes"]["study-name"] == "Renamed study"
+
+
+def test_new_analyses_are_found_by_accession(store, mgnify_server):
+    sync(store, mgnify_server, "analyses")
+    mgnify_server.records["analyses"].append(make_analysis(30, 30))
+
+    assert sync(store, mgnify_server, "analyses") == 1
+    assert "MGYA00000030" in stored_ids(store, "analyses")
+
+
+
+def test_failed_initial_sync_is_not_marked(store, mgnify_server, failing_second_request):
+    failing_second_request()
+    with pytest.raises(IncompleteListingError):
+        sync(store, mgnify_server, "studies")
+    assert store.last_sync("studies", "root") is None
+    assert stored_ids(store, "studies") == []
+
+
+def test_failed_incremental_sync_leaves_no_gap(store, mgnify_server, failing_second_request):
+    sync(store, mgnify_server, "studies")
+    synced_at = store.last_sync("studies", "root")
+    # more new studies than a page: the walk needs page 2, which fails
+    new_studies = [make_study(100 + index) for index in range(15)]
+    for study in new_studies:
+        study["attributes"]["last-update"] = "2030-01-01T00:00:00"
+    mgnify_server.records["studies"].extend(new_studies)
+
+    failing_second_request()
+    with pytest.raises(IncompleteListingError):
+        sync(store, mgnify_server, "studies")
+    assert store.last_sync("studies", "root") == synced_at
+    assert len(stored_ids(store, "studies")) == 30
+
+    # the next sync walks the same pages again and gets every new study
+    mgnify_server.throttle_every = 0
+    assert sync(store, mgnify_server, "studies") == 15
+    assert len(stored_ids(store, "studies")) == 45
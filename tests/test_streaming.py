@@ -0,0 +1,149 @@
+""" Tests of the zero-disk streaming transfer (bin/transfer.py): BlockStager, staged_prefix and resumed uploads. """
+
+# import libraries
+import os
+import threading
+import pytest
+from conftest import CONTAINER
+from ena_ftp import ftp_connect
+from transfer import BlockStager, block_id, staged_prefix, stream_ftp_file_to_blob
+
+BLOCK = 64 * 1024
+SIZE = 5 * BLOCK + 12_345
+
+
+class InterruptedFTP:
+    """
+    Forwards `retrbinary` to a FTP connection and drops the download after `limit` bytes,
+    once the blocks received so far are staged (so the interrupted transfer leaves a known prefix).
+    """
+
+    def __init__(self, ftp, limit, staged):
+        self.ftp = ftp
+        self.limit = limit
+        self.staged = staged
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        received = 0
+
+        def forward(data):
+            nonlocal received
+            if received + len(data) > self.limit:
+                callback(data[:self.limit - received])
+                assert self.staged.wait(10)
+                raise ConnectionResetError("data connection dropped")
+            received += len(data)
+            callback(data)
+
+        return self.ftp.retrbinary(cmd, forward, blocksize, rest)
+
+
+@pytest.fixture
+def remote_file(ftp_server):
+    data = os.urandom(SIZE)
+    with open(os.path.join(ftp_server.root, "run.fastq.gz"), "wb") as file:
+        file.write(data)
+    return "/run.fastq.gz", data
+
+
+def test_stream_commits_the_file(ftp, remote_file, container, blob_emulator):
+    path, data = remote_file
+    blob = container.get_blob_client("ERR000001/run.fastq.gz")
+    offsets = []
+    moved = stream_ftp_file_to_blob(ftp, path, blob, block_size=BLOCK, buffers=2, upload_workers=2,
+                                    progress=offsets.append)
+    assert moved == SIZE
+    assert blob_emulator.blob_data(CONTAINER, "ERR000001/run.fastq.gz") == data
+    committed, _ = blob.get_block_list('committed')
+    assert [block.id for block in committed] == [block_id(index) for index in range(6)]
+    # the progress only grows, never past the end of the file
+    assert offsets == sorted(offsets) and offsets[-1] == SIZE
+
+
+def test_stager_without_commit_leaves_the_blob_uncommitted(container):
+    blob = container.get_blob_client("ERR000001/run.fastq.gz")
+    stager = BlockStager(blob, block_size=BLOCK, buffers=2, upload_workers=2)
+    stager.write(os.urandom(2 * BLOCK + 100))
+    assert stager.close() == 2 * BLOCK + 100
+    assert not blob.exists()
+    _, uncommitted = blob.get_block_list('uncommitted')
+    assert sorted((block.id, block.size) for block in uncommitted) == [
+        (block_id(0), BLOCK), (block_id(1), BLOCK), (block_id(2), 100)]
+
+
+class FailingBlob:
+    """A blob whose third block cannot be staged."""
+
+    blob_name = "ERR000001/run.fastq.gz"
+
+    def __init__(self):
+        self.staged = []
+
+    def stage_block(self, block_id, data, length):
+        if len(self.staged) == 2:
+            raise ConnectionResetError("upload dropped")
+        self.staged.append(block_id)
+
+    def commit_block_list(self, block_ids):
+        raise AssertionError("the block list of a failed upload must not be committed")
+
+
+def test_staging_error_is_raised():
+    blob = FailingBlob()
+    stager = BlockStager(blob, block_size=BLOCK, buffers=2, upload_workers=1)
+    with pytest.raises(ConnectionResetError):
+        stager.write(os.urandom(6 * BLOCK))
+        stager.commit()
+    stager.abort()
+    assert blob.staged == [block_id(0), block_id(1)]
+
+
+def test_staged_prefix_stops_at_the_first_gap(container):
+    blob = container.get_blob_client("ERR000001/run.fastq.gz")
+    assert staged_prefix(blob, BLOCK) == []
+    stager = BlockStager(blob, block_size=BLOCK)
+    stager.write(os.urandom(3 * BLOCK))
+    stager.close()
+    stager = BlockStager(blob, block_size=BLOCK, first_block=4)
+    stager.write(os.urandom(2 * BLOCK))
+    stager.close()
+    assert staged_prefix(blob, BLOCK) == [block_id(0), block_id(1), block_id(2)]
+    # blocks of another size were staged with another block size and cannot be reused
+    assert staged_prefix(blob, BLOCK // 2) == []
+
+
+def test_short_block_is_not_reused(container):
+    blob = container.get_blob_client("ERR000001/run.fastq.gz")
+    stager = BlockStager(blob, block_size=BLOCK)
+    stager.write(os.urandom(BLOCK + 10))
+    stager.close()
+    assert staged_prefix(blob, BLOCK) == [block_id(0)]
+
+
+def test_interrupted_stream_is_resumed(ftp_server, ftp, remote_file, container, blob_emulator):
+    path, data = remote_file
+    blob = container.get_blob_client("ERR000001/run.fastq.gz")
+    staged = threading.Event()
+
+    def progress(offset):
+        if offset >= 3 * BLOCK:
+            staged.set()
+
+    with pytest.raises(ConnectionResetError):
+        stream_ftp_file_to_blob(InterruptedFTP(ftp, 3 * BLOCK + 1000, staged), path, blob, block_size=BLOCK,
+                                buffers=2, upload_workers=2, progress=progress)
+    assert not blob.exists()
+    assert staged_prefix(blob, BLOCK) == [block_id(0), block_id(1), block_id(2)]
+
+    ftp_server.reset_counters()
+    offsets = []
+    resumed = ftp_connect(f"{ftp_server.host}:{ftp_server.port}")
+    try:
+        moved = stream_ftp_file_to_blob(resumed, path, blob, block_size=BLOCK, resume=True, progress=offsets.append)
+    finally:
+        resumed.close()
+    # only the bytes after the staged blocks are downloaded again, from a REST offset
+    assert moved == SIZE - 3 * BLOCK
+    assert ftp_server.commands.get("REST") == 1
+    assert offsets[-1] == SIZE and min(offsets) > 3 * BLOCK
+    assert blob_emulator.blob_data(CONTAINER, "ERR000001/run.fastq.gz") == data
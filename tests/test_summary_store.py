@@ -0,0 +1,129 @@
+""" Tests of the partitioned Parquet store of the summaries (bin/summary_store.py). """
+
+# import libraries
+import os
+import pandas as pd
+import pytest
+from summary_processing import feature_engineering, save_filtered_ids_to_file
+from summary_store import (PART_NAME, SummaryWriter, export_csv, open_store, partition_directory, read_summaries,
+                           write_summary, write_summary_csv)
+
+BIOMES = ['root:Engineered:Wastewater', 'root:Host-associated:Human']
+
+
+def summary(biome, experiment_type, rows, first=0):
+    """A summary as returned by summarize_records, with ERR and SRR runs."""
+    return pd.DataFrame({
+        'analysis_id': [f"MGYA{first + i:08d}" for i in range(rows)],
+        'experiment_type': experiment_type,
+        'pipeline_version': 4.1,
+        'instrument_platform': 'ILLUMINA',
+        'study_id': [f"MGYS{first + i:08d}" for i in range(rows)],
+        'sample_id': [f"ERS{first + i}" for i in range(rows)],
+        'assembly_run_id': [f"{'ERR' if i % 3 else 'SRR'}{first + i}" for i in range(rows)],
+        'study_name': 'a study',
+        'n_samples': 10.0,
+        'bioproject': '',
+        'centre_name': 'EMG',
+        'biomes': biome,
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    store_path = str(tmp_path / 'summaries')
+    write_summary(summary(BIOMES[0], 'metagenomic', 5), store_path, BIOMES[0], 'metagenomic')
+    write_summary(summary(BIOMES[0], 'assembly', 3, first=100), store_path, BIOMES[0], 'assembly')
+    write_summary(summary(BIOMES[1], 'metagenomic', 4, first=200), store_path, BIOMES[1], 'metagenomic')
+    return store_path
+
+
+def test_biome_names_are_quoted_in_the_partition_directories(store):
+    # ':' is not allowed in file names on every file system, so the values are URI encoded
+    assert sorted(os.listdir(store)) == ['biome=root%3AEngineered%3AWastewater', 'biome=root%3AHost-associated%3AHuman']
+    assert os.path.isfile(os.path.join(partition_directory(store, BIOMES[0], 'metagenomic'), PART_NAME))
+    # and decoded back by the partitioning
+    assert sorted(read_summaries(store, columns=['biome'])['biome'].unique()) == BIOMES
+
+
+def test_summaries_are_read_back(store):
+    dataframe = read_summaries(store)
+    assert len(dataframe) == 12
+    # experiment_type is read back from the partition directories, in its place among the summary columns
+    assert list(dataframe.columns) == list(summary(BIOMES[0], 'metagenomic', 1).columns)
+    assert sorted(dataframe['experiment_type'].unique()) == ['assembly', 'metagenomic']
+    assert isinstance(dataframe['centre_name'].dtype, pd.CategoricalDtype)
+    # the empty bioprojects are read back as missing values, like from a CSV file
+    assert dataframe['bioproject'].isna().all()
+
+
+def test_partitions_are_selected(store):
+    assert len(read_summaries(store, biome_names=[BIOMES[0]])) == 8
+    assert len(read_summaries(store, experiment_types=['metagenomic'])) == 9
+    dataframe = read_summaries(store, biome_names=[BIOMES[0]], experiment_types=['assembly'])
+    assert list(dataframe['analysis_id']) == [f"MGYA{100 + i:08d}" for i in range(3)]
+    assert len(open_store(store, biome_names=BIOMES).files) == 3
+
+
+def test_no_matching_partition_raises(store):
+    with pytest.raises(ValueError):
+        open_store(store, biome_names=['root:Environmental'])
+    with pytest.raises(ValueError):
+        open_store(store, biome_names=[BIOMES[1]], experiment_types=['assembly'])
+
+
+def test_rewritten_partition_replaces_the_previous_one(store):
+    write_summary(summary(BIOMES[1], 'metagenomic', 2, first=300), store, BIOMES[1], 'metagenomic')
+    assert list(read_summaries(store, biome_names=[BIOMES[1]])['analysis_id']) == ["MGYA00000300", "MGYA00000301"]
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / 'store' / PART_NAME)
+    with pytest.raises(RuntimeError):
+        with SummaryWriter(path, ['analysis_id', 'study_id']) as writer:
+            writer.write(summary(BIOMES[0], 'metagenomic', 2))
+            raise RuntimeError("interrupted")
+    assert os.listdir(tmp_path / 'store') == []
+
+
+def test_failed_write_keeps_the_previous_file(store):
+    with pytest.raises(RuntimeError):
+        with SummaryWriter(os.path.join(partition_directory(store, BIOMES[1], 'metagenomic'), PART_NAME),
+                           ['analysis_id']) as writer:
+            writer.write(summary(BIOMES[1], 'metagenomic', 1, first=900))
+            raise RuntimeError("interrupted")
+    assert len(read_summaries(store, biome_names=[BIOMES[1]])) == 4
+
+
+def test_filter_on_the_dictionary_column(tmp_path):
+    path = str(tmp_path / 'deduplicated.parquet')
+    with SummaryWriter(path, ['assembly_run_id', 'initials_run', 'pipeline_mapped']) as writer:
+        # several row groups, one of them without any ERR run
+        for first in (0, 100, 200):
+            rows = feature_engineering(summary(BIOMES[0], 'metagenomic', 6, first=first))
+            writer.write(rows if first != 100 else rows[rows['initials_run'] == 'SRR'])
+    save_filtered_ids_to_file(path, output_column='assembly_run_id', filter_column='initials_run', filter_value='ERR',
+                              output_path=str(tmp_path))
+    with open(tmp_path / 'assembly_run_ids.txt') as file:
+        assert file.read().split() == ['ERR1', 'ERR2', 'ERR4', 'ERR5', 'ERR201', 'ERR202', 'ERR204', 'ERR205']
+
+
+def test_export_csv(store, tmp_path):
+    csv_path = str(tmp_path / 'combined.csv')
+    assert export_csv(store, csv_path, chunksize=2) == 12
+    exported = pd.read_csv(csv_path)
+    assert list(exported.columns) == list(read_summaries(store).columns)
+    assert list(exported['analysis_id']) == list(read_summaries(store)['analysis_id'])
+
+
+def test_export_csv_of_an_empty_store(tmp_path):
+    store_path = str(tmp_path / 'summaries')
+    empty_csv_path = str(tmp_path / 'empty.csv')
+    columns = list(summary(BIOMES[0], 'metagenomic', 0).columns)
+    pd.DataFrame(columns=columns).to_csv(empty_csv_path, index=False)
+    write_summary_csv(empty_csv_path, store_path, BIOMES[0], 'metagenomic')
+    # the empty partition has no row group: the exported file only has the header
+    csv_path = str(tmp_path / 'exported.csv')
+    assert export_csv(store_path, csv_path) == 0
+    with open(csv_path) as file:
+        assert file.read().split() == [','.join(columns)]
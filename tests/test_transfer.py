@@ -0,0 +1,71 @@
+""" Tests of the segmented FTP download (bin/transfer.py): segment planning and byte range downloads. """
+
+# import libraries
+import os
+import pytest
+from transfer import MAX_SEGMENT_BLOCKS, MIN_SEGMENT_BLOCKS, download_range, plan_segments
+
+
+def expand(segments):
+    return [first + offset for first, count in segments for offset in range(count)]
+
+
+@pytest.mark.parametrize("blocks, connections", [(100, 4), (7, 2), (500, 1), (1, 8), (64, 16)])
+def test_segments_cover_every_block_in_order(blocks, connections):
+    segments = plan_segments(list(range(blocks)), connections)
+    assert expand(segments) == list(range(blocks))
+    sizes = [count for _, count in segments]
+    assert all(count <= MAX_SEGMENT_BLOCKS for count in sizes)
+    assert all(count >= MIN_SEGMENT_BLOCKS for count in sizes[:-1])
+    # guided scheduling: the segments shrink as the work left decreases
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_segment_size_follows_the_work_left():
+    segments = plan_segments(list(range(100)), 4)
+    assert segments[0] == (0, 13)       # ceil(100 / (2 * 4))
+    assert segments[-1][1] == MIN_SEGMENT_BLOCKS
+    assert plan_segments(list(range(1000)), 1)[0] == (0, MAX_SEGMENT_BLOCKS)
+
+
+def test_segments_do_not_span_the_blocks_already_staged():
+    blocks = [0, 1, 2, 5, 6, 9]
+    segments = plan_segments(blocks, 1)
+    assert expand(segments) == blocks
+    for first, count in segments:
+        assert list(range(first, first + count)) == [block for block in blocks if first <= block < first + count]
+
+
+def test_no_blocks_no_segments():
+    assert plan_segments([], 4) == []
+
+
+@pytest.fixture
+def remote_file(ftp_server):
+    data = os.urandom(300_000)
+    with open(os.path.join(ftp_server.root, "run.fastq.gz"), "wb") as file:
+        file.write(data)
+    return "/run.fastq.gz", data
+
+
+@pytest.mark.parametrize("offset, length", [(0, 1000), (12_345, 100_000), (250_000, 50_000), (0, 300_000)])
+def test_range_is_downloaded(ftp, remote_file, offset, length):
+    path, data = remote_file
+    chunks = []
+    download_range(ftp, path, offset, length, chunks.append, read_size=8192)
+    assert b"".join(chunks) == data[offset:offset + length]
+    assert all(len(chunk) <= 8192 for chunk in chunks)
+
+
+def test_connection_is_reusable_after_a_partial_download(ftp, remote_file):
+    path, data = remote_file
+    for offset in (0, 100_000, 200_000):
+        chunks = []
+        download_range(ftp, path, offset, 10_000, chunks.append)
+        assert b"".join(chunks) == data[offset:offset + 10_000]
+
+
+def test_range_past_the_end_of_the_file(ftp, remote_file):
+    path, _ = remote_file
+    with pytest.raises(EOFError):
+        download_range(ftp, path, 290_000, 20_000, lambda chunk: None)
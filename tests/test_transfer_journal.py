@@ -0,0 +1,137 @@
+""" Tests of the resumable transfers (bin/transfer_journal.py, bin/transfer.py): journal states and skipped uploads. """
+
+# import libraries
+import os
+import sqlite3
+import pytest
+from conftest import CONTAINER
+from transfer import BlockStager, transfer_file_resumable
+from transfer_journal import COMMITTED, IN_PROGRESS, PENDING, TransferJournal
+
+BLOCK = 64 * 1024
+SIZE = 5 * BLOCK + 12_345
+BLOB = "ERR000001/ERR000001_1.fastq.gz"
+REMOTE_PATH = "/vol1/fastq/ERR000/ERR000001/ERR000001_1.fastq.gz"
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = TransferJournal(str(tmp_path / "journal.sqlite"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def remote_file(ftp_server):
+    data = os.urandom(SIZE)
+    directory = os.path.join(ftp_server.root, os.path.dirname(REMOTE_PATH).strip("/"))
+    os.makedirs(directory)
+    with open(os.path.join(directory, os.path.basename(REMOTE_PATH)), "wb") as file:
+        file.write(data)
+    return data
+
+
+def test_journal_follows_a_transfer(journal):
+    assert journal.get("ERR000001", "a.fastq.gz") is None
+    journal.pending("ERR000001", "a.fastq.gz", "/a.fastq.gz")
+    assert journal.get("ERR000001", "a.fastq.gz")["state"] == PENDING
+    journal.start("ERR000001", "a.fastq.gz", "/a.fastq.gz", size=1000, block_size=100)
+    journal.progress("ERR000001", "a.fastq.gz", 300)
+    entry = journal.get("ERR000001", "a.fastq.gz")
+    assert (entry["state"], entry["offset"], entry["staged"], entry["size"]) == (IN_PROGRESS, 300, 300, 1000)
+    # a pending registration from a later run does not reset the progress
+    journal.pending("ERR000001", "a.fastq.gz", "/a.fastq.gz")
+    assert journal.get("ERR000001", "a.fastq.gz")["offset"] == 300
+    journal.committed("ERR000001", "a.fastq.gz", "/a.fastq.gz", 1000)
+    entry = journal.get("ERR000001", "a.fastq.gz")
+    assert (entry["state"], entry["offset"], entry["staged"], entry["block_size"]) == (COMMITTED, 1000, 1000, 100)
+    journal.pending("ERR000001", "b.fastq.gz", "/b.fastq.gz")
+    assert journal.summary() == {COMMITTED: 1, PENDING: 1}
+
+
+def test_segmented_progress_keeps_offset_and_staged_apart(journal):
+    journal.start("ERR000001", "a.fastq.gz", "/a.fastq.gz", size=1000, block_size=100, offset=200, staged=500)
+    assert journal.get("ERR000001", "a.fastq.gz")["staged"] == 500
+    journal.progress("ERR000001", "a.fastq.gz", 300, 700)
+    entry = journal.get("ERR000001", "a.fastq.gz")
+    assert (entry["offset"], entry["staged"]) == (300, 700)
+
+
+def test_journal_survives_a_restart(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    journal = TransferJournal(path)
+    journal.start("ERR000001", "a.fastq.gz", "/a.fastq.gz", size=1000, block_size=100)
+    journal.progress("ERR000001", "a.fastq.gz", 400)
+    journal.close()
+    journal = TransferJournal(path)
+    assert journal.get("ERR000001", "a.fastq.gz")["offset"] == 400
+    journal.close()
+
+
+def test_journal_without_staged_column_is_migrated(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE transfers (accession TEXT, file TEXT, remote_path TEXT, state TEXT, offset INTEGER,"
+               " size INTEGER, block_size INTEGER, updated_at REAL, PRIMARY KEY (accession, file))")
+    db.execute("INSERT INTO transfers VALUES ('ERR000001', 'a.fastq.gz', '/a.fastq.gz', ?, 300, 1000, 100, 0)",
+               (IN_PROGRESS,))
+    db.commit()
+    db.close()
+    journal = TransferJournal(path)
+    entry = journal.get("ERR000001", "a.fastq.gz")
+    assert (entry["offset"], entry["staged"]) == (300, 300)
+    journal.progress("ERR000001", "a.fastq.gz", 400, 600)
+    assert journal.get("ERR000001", "a.fastq.gz")["staged"] == 600
+    journal.close()
+
+
+def test_uploaded_blob_is_skipped(ftp_server, ftp, remote_file, container, journal):
+    container.get_blob_client(BLOB).upload_blob(remote_file)
+    ftp_server.reset_counters()
+    moved = transfer_file_resumable(ftp, "ERR000001", REMOTE_PATH, container.get_blob_client(BLOB), journal)
+    assert moved == 0
+    # only the SIZE check reached the server
+    assert ftp_server.commands.get("SIZE") == 1 and "RETR" not in ftp_server.commands
+    assert journal.get("ERR000001", os.path.basename(REMOTE_PATH))["state"] == COMMITTED
+
+
+def test_blob_of_another_size_is_transferred_again(ftp, remote_file, container, journal, blob_emulator):
+    container.get_blob_client(BLOB).upload_blob(remote_file[:1000])
+    moved = transfer_file_resumable(ftp, "ERR000001", REMOTE_PATH, container.get_blob_client(BLOB), journal)
+    assert moved == SIZE
+    assert blob_emulator.blob_data(CONTAINER, BLOB) == remote_file
+
+
+def test_interrupted_transfer_is_resumed_from_the_journal(ftp_server, ftp, remote_file, container, journal,
+                                                          blob_emulator):
+    # an earlier attempt staged three blocks before it was killed
+    blob = container.get_blob_client(BLOB)
+    file = os.path.basename(REMOTE_PATH)
+    journal.start("ERR000001", file, REMOTE_PATH, SIZE, BLOCK)
+    stager = BlockStager(blob, block_size=BLOCK)
+    stager.write(remote_file[:3 * BLOCK])
+    stager.close()
+    journal.progress("ERR000001", file, 3 * BLOCK)
+
+    ftp_server.reset_counters()
+    # the block size of the interrupted transfer is taken from the journal
+    moved = transfer_file_resumable(ftp, "ERR000001", REMOTE_PATH, blob, journal)
+    assert moved == SIZE - 3 * BLOCK
+    assert ftp_server.commands.get("REST") == 1
+    assert blob_emulator.blob_data(CONTAINER, BLOB) == remote_file
+    assert journal.get("ERR000001", file)["state"] == COMMITTED
+
+
+def test_segmented_transfer_downloads_only_the_missing_blocks(ftp, remote_file, container, journal, blob_emulator):
+    # blocks 0, 1, 3 and 4 of six were staged by an interrupted segmented download
+    blob = container.get_blob_client(BLOB)
+    file = os.path.basename(REMOTE_PATH)
+    for first, count in ((0, 2), (3, 2)):
+        stager = BlockStager(blob, block_size=BLOCK, first_block=first)
+        stager.write(remote_file[first * BLOCK:(first + count) * BLOCK])
+        stager.close()
+    journal.start("ERR000001", file, REMOTE_PATH, SIZE, BLOCK, offset=2 * BLOCK, staged=4 * BLOCK)
+
+    moved = transfer_file_resumable(ftp, "ERR000001", REMOTE_PATH, blob, journal, connections=2, segment_threshold=0)
+    assert moved == SIZE - 4 * BLOCK
+    assert blob_emulator.blob_data(CONTAINER, BLOB) == remote_file
@@ -0,0 +1,95 @@
+""" Tests of the concurrent transfer of many accessions (bin/transfer.py): TransferScheduler. """
+
+# import libraries
+import os
+import sqlite3
+import threading
+import pytest
+from conftest import CONTAINER
+from ftp_fixture import make_fastq_tree
+from transfer import TransferScheduler
+from transfer_journal import COMMITTED, TransferJournal
+
+ACCESSIONS = ["ERR000001", "ERR000002", "SRR1234567"]
+
+
+@pytest.fixture
+def fastq_tree(ftp_server):
+    return make_fastq_tree(ftp_server.root, ACCESSIONS, file_size=100_000)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = TransferJournal(str(tmp_path / "journal.sqlite"))
+    yield journal
+    journal.close()
+
+
+def run_scheduler(scheduler, accessions):
+    """Runs the scheduler in a thread and fails if its threads do not exit."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['results'] = scheduler.run(accessions)
+        except Exception as err:
+            outcome['error'] = err
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "the scheduler threads did not exit"
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['results']
+
+
+def test_every_file_is_transferred(ftp_server, fastq_tree, container, blob_emulator, journal):
+    scheduler = TransferScheduler(f"{ftp_server.host}:{ftp_server.port}", container, workers=2, journal=journal)
+    results = run_scheduler(scheduler, ACCESSIONS + ["ERR999999"])
+    assert results == {"ERR000001": "done", "ERR000002": "done", "SRR1234567": "done", "ERR999999": "not found"}
+    for accession, paths in fastq_tree.items():
+        for remote_path in paths:
+            with open(os.path.join(ftp_server.root, remote_path.strip("/")), "rb") as source:
+                assert blob_emulator.blob_data(CONTAINER, f"{accession}/{os.path.basename(remote_path)}") == source.read()
+    assert journal.summary() == {COMMITTED: 6}
+    assert sum(stats['files'] for stats in scheduler.worker_stats.values()) == 6
+    # the FTP sessions are reused: one per worker and one for the resolver at most
+    assert scheduler.pool.connections_opened <= 3
+
+
+def test_second_run_skips_the_uploaded_files(ftp_server, fastq_tree, container, journal):
+    server_address = f"{ftp_server.host}:{ftp_server.port}"
+    run_scheduler(TransferScheduler(server_address, container, workers=2, journal=journal), ACCESSIONS)
+    ftp_server.reset_counters()
+    scheduler = TransferScheduler(server_address, container, workers=2, journal=journal)
+    assert set(run_scheduler(scheduler, ACCESSIONS).values()) == {"done"}
+    assert "RETR" not in ftp_server.commands
+    assert sum(stats['bytes'] for stats in scheduler.worker_stats.values()) == 0
+
+
+def test_only_missing_accessions(ftp_server, container):
+    scheduler = TransferScheduler(f"{ftp_server.host}:{ftp_server.port}", container, workers=4)
+    assert run_scheduler(scheduler, ["ERR999998", "ERR999999"]) == {"ERR999998": "not found", "ERR999999": "not found"}
+    assert scheduler.worker_stats == {f"worker-{i}": {'files': 0, 'bytes': 0, 'seconds': 0.0} for i in range(1, 5)}
+
+
+def test_resolver_error_stops_the_workers(ftp_server, fastq_tree, container, tmp_path):
+    # a journal that cannot be written makes the resolver fail on the first accession
+    journal = TransferJournal(str(tmp_path / "journal.sqlite"))
+    journal.close()
+    scheduler = TransferScheduler(f"{ftp_server.host}:{ftp_server.port}", container, workers=2, journal=journal)
+    with pytest.raises(sqlite3.ProgrammingError):
+        run_scheduler(scheduler, ACCESSIONS)
+
+
+def test_report_prints_the_whole_run(ftp_server, fastq_tree, container, capsys):
+    scheduler = TransferScheduler(f"{ftp_server.host}:{ftp_server.port}", container, workers=2)
+    run_scheduler(scheduler, ACCESSIONS + ["ERR999999"])
+    capsys.readouterr()
+    scheduler.report()
+    lines = capsys.readouterr().out.splitlines()
+    total = next(line.split() for line in lines if line.split()[0] == "total")
+    assert total[1] == "6" and float(total[2]) == pytest.approx(6 * 100_000 / 1024 ** 2, abs=0.1)
+    assert f"in {scheduler.wall_seconds:.1f} s" in lines[-1]
+    assert "'not found': 1" in lines[-1]